@@ -1,8 +1,7 @@
 # Regular packages
+import argparse
 import os
 
-import pandas as pd
-
 # Specific imports from reportlab
 from reportlab.platypus import (
     BaseDocTemplate,
@@ -17,23 +16,73 @@ from reportlab.platypus.flowables import HRFlowable
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import mm
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 
-# Arial fonts
-pdfmetrics.registerFont(TTFont("Arial", "Arial.ttf"))
-pdfmetrics.registerFont(TTFont("Arial-B", "Arial Bold.ttf"))
-pdfmetrics.registerFont(TTFont("Arial-I", "Arial Italic.ttf"))
-pdfmetrics.registerFont(TTFont("Arial-N", "Arial Narrow.ttf"))
+# Arial fonts (shared with single_survey_page.py, registered once per process)
+from report_resources import register_fonts
+
+register_fonts()
 
 # This import facilitates the header creation
 from functools import partial
 
-# SVG file function
-from svglib.svglib import svg2rlg
+# These is the data to import for these pages (counts and plots made by Make_plots.py)
+from plot_manifest import PLOT_DIR, load_manifest
+
+# Stages of the run are recorded when tracing is switched on (SURVEY_TRACE)
+from survey_trace import stage
+
+# The charts are either the svg plots made by Make_plots.py ("svg"),
+# or drawn directly by reportlab from the tallies ("native")
+CHART_BACKENDS = ["svg", "native"]
 
-# These is the data to import for these pages
-from Make_plots import countA, countB
+# Loaded manifests, by plot folder
+_stats = {}
+
+
+def load_stats(backend="svg", plot_dir=PLOT_DIR, source=None):
+    """
+    load_stats returns the stats manifest written by Make_plots.py. It is only loaded
+    when first needed, and the plots are only made again if it is missing or stale,
+    or made from another export than source (dict of path, sheet_name and header).
+    The native backend does not need the plots, so they are not rendered for it
+    """
+    need_plots = backend == "svg"
+    stats = _stats.get(plot_dir)
+    if stats is None or (need_plots and not stats["plots"]):
+        stats = load_manifest(need_plots=need_plots, plot_dir=plot_dir)
+    if stats is not None and source:
+        made_from = stats["source"]
+        if any(made_from[key] != value for key, value in source.items()):
+            stats = None
+    if stats is None:
+        from Make_plots import make_plots
+
+        stats = make_plots(render=need_plots, plot_dir=plot_dir, **(source or {}))
+    _stats[plot_dir] = stats
+    return stats
+
+
+def chart_image(stats, question, Survey_name, backend="svg"):
+    """
+    chart_image returns the chart of a question for a survey type as an 80 x 60 mm image
+    """
+    if backend == "native":
+        from rl_charts import bar_chart
+
+        key = "{}_{}".format(question, Survey_name)
+        drawing = bar_chart(
+            stats["charts"][key], stats["tallies"][question][Survey_name]
+        )
+    else:
+        # SVG file, parsed with svglib unless the parsed drawing is cached
+        from drawing_cache import load_drawing
+
+        drawing = load_drawing(
+            stats["plots"]["{}_{}".format(question, Survey_name)]["path"]
+        )
+    im = Image(drawing, width=80 * mm, height=60 * mm)
+    im.hAlign = "LEFT"
+    return im
 
 
 def header(canvas, doc, content):
@@ -54,7 +103,7 @@ def header(canvas, doc, content):
 
 
 def generatePdf(
-    Survey_name,
+    Survey_name, backend="svg", output_dir="pdfs_plots", plot_dir=PLOT_DIR, source=None
 ):  # going to make two types of page (one for survey type A and one for survey type B,)
     """
     generatePdf creates a PDF document based on the reporting data supplied.
@@ -62,12 +111,15 @@ def generatePdf(
     This function will print the name of the unit its working on, and
     any warnings that may arise. The excel document can be edited to fix warnings
     and to change the information in the PDFs.
+    backend is "svg" for the plots made by Make_plots.py, or "native" for reportlab charts
     """
-    if not os.path.isdir("pdfs_plots/"):
-        os.mkdir("pdfs_plots/")
+    # Make sure the counts and plots are there and up to date before using them
+    stats = load_stats(backend, plot_dir, source)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
     # Setting the document sizes and margins. showBoundary is useful for debugging
     doc = BaseDocTemplate(
-        "pdfs_plots/plots_survey{}.pdf".format(Survey_name.lower()),
+        os.path.join(output_dir, "plots_survey{}.pdf".format(Survey_name.lower())),
         pagesize=A4,
         rightMargin=18 * mm,
         leftMargin=14 * mm,
@@ -180,7 +232,6 @@ def generatePdf(
         bottomPadding=0 * mm,
     )
 
-    pd.options.display.max_colwidth = 600
     if Survey_name == "A":
         header_content = Paragraph(
             "<font color='#4C979F' name=Arial-B><b>Proposals on New Technologies – a summary</b></font>",
@@ -201,12 +252,11 @@ def generatePdf(
     Story = []
     ### Below here will be Paragraph and Image elements added to the Story, they flow through frames automatically,
     ### however I have set a framebreak to correctly organise things in left/right column.
-    pd.options.display.max_colwidth = 600
     if Survey_name == "A":
         Story.append(
             Paragraph(
                 "<font color='#4C979F' name=Arial-B><b>Total number of proposals: {}</b></font>".format(
-                    (countA),  # .to_string(index=False),
+                    stats["counts"]["A"],  # .to_string(index=False),
                 ),
                 styles["onepager_inner_heading"],
             )
@@ -215,7 +265,7 @@ def generatePdf(
         Story.append(
             Paragraph(
                 "<font color='#A7C947' name=Arial-B><b>Total number of proposals: {}</b></font>".format(
-                    (countB),  # .to_string(index=False),
+                    stats["counts"]["B"],  # .to_string(index=False),
                 ),
                 styles["onepager_inner_heading"],
             )
@@ -233,14 +283,7 @@ def generatePdf(
                 styles["chart_heading"],
             )
         )
-        filepath_affiliation = "Plots/affiliation_{}.svg".format(
-            (Survey_name),
-        )
-        isFile_affiliation = os.path.isfile(filepath_affiliation)
-        im_affiliation = svg2rlg(filepath_affiliation)
-        im_affiliation = Image(im_affiliation, width=80 * mm, height=60 * mm)
-        im_affiliation.hAlign = "LEFT"
-        Story.append(im_affiliation)
+        Story.append(chart_image(stats, "affiliation", Survey_name, backend))
     else:
         Story.append(
             Paragraph(
@@ -248,14 +291,7 @@ def generatePdf(
                 styles["chart_heading"],
             )
         )
-        filepath_affiliation = "Plots/affiliation_{}.svg".format(
-            (Survey_name),
-        )
-        isFile_affiliation = os.path.isfile(filepath_affiliation)
-        im_affiliation = svg2rlg(filepath_affiliation)
-        im_affiliation = Image(im_affiliation, width=80 * mm, height=60 * mm)
-        im_affiliation.hAlign = "LEFT"
-        Story.append(im_affiliation)
+        Story.append(chart_image(stats, "affiliation", Survey_name, backend))
     # Next, plot related to which platform it fits into
     # The title for the question needs to be slightly different
     # Story.append(CondPageBreak(10 * mm))
@@ -268,14 +304,7 @@ def generatePdf(
                 styles["chart_heading"],
             )
         )
-        filepath_platform = "Plots/platform_fit_{}.svg".format(
-            (Survey_name),
-        )
-        isFile_platform = os.path.isfile(filepath_platform)
-        im_platform = svg2rlg(filepath_platform)
-        im_platform = Image(im_platform, width=80 * mm, height=60 * mm)
-        im_platform.hAlign = "LEFT"
-        Story.append(im_platform)
+        Story.append(chart_image(stats, "platform_fit", Survey_name, backend))
     else:
         Story.append(
             Paragraph(
@@ -283,14 +312,7 @@ def generatePdf(
                 styles["chart_heading"],
             )
         )
-        filepath_platform = "Plots/platform_fit_{}.svg".format(
-            (Survey_name),
-        )
-        isFile_platform = os.path.isfile(filepath_platform)
-        im_platform = svg2rlg(filepath_platform)
-        im_platform = Image(im_platform, width=80 * mm, height=60 * mm)
-        im_platform.hAlign = "LEFT"
-        Story.append(im_platform)
+        Story.append(chart_image(stats, "platform_fit", Survey_name, backend))
     # Next, plot related to which capability/program could be strengthened
     # The title for the question needs to be slightly different
     if Survey_name == "A":
@@ -300,14 +322,7 @@ def generatePdf(
                 styles["chart_heading"],
             )
         )
-        filepath_capability = "Plots/capability_fit_{}.svg".format(
-            (Survey_name),
-        )
-        isFile_capability = os.path.isfile(filepath_capability)
-        im_capability = svg2rlg(filepath_capability)
-        im_capability = Image(im_capability, width=80 * mm, height=60 * mm)
-        im_capability.hAlign = "LEFT"
-        Story.append(im_capability)
+        Story.append(chart_image(stats, "capability_fit", Survey_name, backend))
     else:
         Story.append(
             Paragraph(
@@ -315,14 +330,7 @@ def generatePdf(
                 styles["chart_heading"],
             )
         )
-        filepath_capability = "Plots/capability_fit_{}.svg".format(
-            (Survey_name),
-        )
-        isFile_capability = os.path.isfile(filepath_capability)
-        im_capability = svg2rlg(filepath_capability)
-        im_capability = Image(im_capability, width=80 * mm, height=60 * mm)
-        im_capability.hAlign = "LEFT"
-        Story.append(im_capability)
+        Story.append(chart_image(stats, "capability_fit", Survey_name, backend))
         # now need last graph for survey type B (new frame needed) - Estimate number of potential users
         # No further graphs for survey type A
         Story.append(CondPageBreak(200 * mm))  # move to next frame
@@ -332,12 +340,7 @@ def generatePdf(
                 styles["chart_heading"],
             )
         )
-        filepath_potuse = "Plots/potential_users_B.svg"
-        isFile_potuse = os.path.isfile(filepath_potuse)
-        im_potuse = svg2rlg(filepath_potuse)
-        im_potuse = Image(im_potuse, width=80 * mm, height=60 * mm)
-        im_potuse.hAlign = "LEFT"
-        Story.append(im_potuse)
+        Story.append(chart_image(stats, "potential_users", Survey_name, backend))
 
     #
     # if Survey_name == "A":
@@ -392,9 +395,19 @@ def generatePdf(
     # )
 
     # Finally, build the document.
-    doc.build(Story)
+    with stage("build:" + doc.filename):
+        doc.build(Story)
 
 
 # Note: not setting the year universally, because it might be that you're reporting for the current year, or the one before
-generatePdf("A")
-generatePdf("B")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Make the summary pdfs of the survey")
+    parser.add_argument(
+        "--backend",
+        choices=CHART_BACKENDS,
+        default="svg",
+        help="svg: use the plots made by Make_plots.py, native: draw the charts with reportlab",
+    )
+    args = parser.parse_args()
+    generatePdf("A", args.backend)
+    generatePdf("B", args.backend)
@@ -1,174 +1,38 @@
 """This script produces the plots required for the survey data"""
 
-import pandas as pd
 import os
 import plotly.graph_objects as go
-import plotly.express as px
-import numpy as np
 
-
-# read in data and perform data preparation
-# First portion of script (before splitting for survey type is general survey prep)
-
-survey_data_raw = pd.read_excel(
-    "Data/Test-run.xlsx",
-    sheet_name="Sheet 1 - 230807072119_scilifel",
-    header=1,
-    engine="openpyxl",
-    keep_default_na=False,
-)
-
-# Healthcare affiliation has been put in as 'Health care', going to standardise here for the whole set
-
-survey_data_raw = survey_data_raw.replace("Health care", "Healthcare", regex=True)
-
-# make affiliations types into a unified column
-# (prep for affiliations work)
-
-# Need to replace substrings as there can be multiple affiliations
-survey_data_raw["Affiliation"] = [
-    x.replace("University", str(y))
-    for x, y in survey_data_raw[["Affiliation", "University"]].to_numpy()
-]
-
-### THIS PART WOULD NEED CHANGING EACH TIME THE TECH SURVEY WAS DONE (unless survey structure is changed)
-### in 2023, 'Other' under universities allows users to type in the university (this is not true for 'Other Swedish University')
-### Want them to actually show up as 'Other university' (this is only expected to be relatively rare)
-### In this case, we will rename the individual instances of this (e.g. with University of Copenhagen)
-
-survey_data_raw["Affiliation"] = survey_data_raw["Affiliation"].replace(
-    "Copenhagen University", "Other University", regex=True
-)
-
-# Rename columns needed to work with
-
-survey_data_raw.rename(
-    columns={
-        "In which of the existing SciLifeLab Platform(s) would the technology/instrument/service/technological capability fit. https://www.scilifelab.se/services/infrastructure-organization/": "Tech_fits",
-        "In which of the existing SciLifeLab Platform(s) would the facility fit": "Fac_fits",
-        "Indicate if the suggested technology/instrument/service/technological capability would considerably contribute to strengthen one or more of the SciLifeLab capabilities and/or the Data Driven Life Science program": "cap_fits_A",
-        "Indicate if the suggested facility would considerably contribute to strengthen one or more of the SciLifeLab capabilities and/or the Data Driven Life Science program": "cap_fits_B",
-        "Estimate the number of unique annual users if the unit would become a part of the SciLifeLab national infrastructure": "potential_users",
-    },
-    inplace=True,
+from plot_manifest import PLOT_DIR, plot_path, write_manifest
+from render_queue import RenderCache, RenderQueue
+from rl_charts import chart_spec
+from survey_crosstab import CrossTab
+from survey_loading import (
+    QUESTIONS,
+    load_survey_data,
+    partition_survey_types,
 )
-
-# made where the tech/facility fits in one column (for which platform does it fit in question)
-
-survey_data_raw["Platform_fits"] = (
-    survey_data_raw["Tech_fits"] + survey_data_raw["Fac_fits"]
-)
-
-# made which capability would be contributed to fit in one column (for which capability does it fit in question)
-
-survey_data_raw["Capability_fits"] = (
-    survey_data_raw["cap_fits_A"] + survey_data_raw["cap_fits_B"]
+from survey_options import (
+    SURVEY_FILE,
+    SURVEY_HEADER,
+    SURVEY_SHEET,
+    SURVEY_TYPES,
 )
+from survey_tally import counts, tally_questions
 
-# print(survey_data_raw.info())
-# There are two different sets of plots needed (one for each survey type), although some plots are needed for both types
-# Split data according to survey type (A and B)
-
-surveyA = survey_data_raw[
-    (
-        survey_data_raw
-        == "a.	From a user perspective, an urgently needed technology, instrument, service, or technological capability, currently not available as nation-wide service in Sweden"
-    ).any(axis=1)
-]
-
-surveyB = survey_data_raw[
-    (
-        survey_data_raw
-        == "b.	An existing local or national core-facility that could be incorporated as a SciLifeLab unit from 2025"
-    ).any(axis=1)
-]
-
-# Need counts for each survey types (go into top of pages)
-
-countA = surveyA.shape[0]
-countB = surveyB.shape[0]
 
 # Below here is all plots and associated data preparation
 
 ### Make affiliation plots - needed for both survey types
 
-# Dataframe of all possible values (needed to ensure all values can be on the plot, even if not selected in the survey)
-
-Aff_data = pd.DataFrame(
-    {
-        "Affiliation": [
-            "Chalmers University of Technology",
-            "Karolinska Institutet",
-            "KTH, Royal Institute of Technology",
-            "Linköping University",
-            "Lund University",
-            "Stockholm University",
-            "Swedish University of Agricultural Sciences",
-            "Umeå University",
-            "University of Gothenburg",
-            "Uppsala University",
-            "Örebro University",
-            "Other Swedish University",
-            "Governmental organization",
-            "Healthcare",
-            "Industry",
-            "Other University",
-        ],
-        "Count": [
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-        ],
-    }
-)
-
-# get counts for affiliations of those that aubmitted survey type A
-
-Aff_count_A = pd.DataFrame(
-    surveyA.Affiliation.str.extractall("({})".format("|".join(Aff_data["Affiliation"])))
-    .iloc[:, 0]
-    .str.get_dummies()
-    .sum()
-    .reset_index()
-    .rename(columns={"index": "Affiliation", 0: "Count"})
-)
-
-affA_comb = pd.concat([Aff_data, Aff_count_A])
-
-affiliationsA = affA_comb.groupby(["Affiliation"]).sum().reset_index()
+# All possible values (needed to ensure all values can be on the plot, even if not selected in the survey)
+# are in AFFILIATION_OPTIONS (survey_options.py)
 
-# get counts for affiliations of those that submitted survey type B
-
-Aff_count_B = pd.DataFrame(
-    surveyB.Affiliation.str.extractall("({})".format("|".join(Aff_data["Affiliation"])))
-    .iloc[:, 0]
-    .str.get_dummies()
-    .sum()
-    .reset_index()
-    .rename(columns={"index": "Affiliation", 0: "Count"})
-)
-
-affB_comb = pd.concat([Aff_data, Aff_count_B])
-
-affiliationsB = affB_comb.groupby(["Affiliation"]).sum().reset_index()
 
 # now make affiliations plot
 
 
-def affiliations_bar(input, name, colour):
+def affiliations_bar(input, name, colour, queue, plot_dir=PLOT_DIR):
     affiliations = input
     fig = go.Figure(
         data=[
@@ -281,90 +145,20 @@ def affiliations_bar(input, name, colour):
     )
     # fig.show()
 
-    if not os.path.isdir("Plots/"):
-        os.mkdir("Plots/")
-    fig.write_image("Plots/affiliation_{}.svg".format(name))
-
+    queue.add(fig, plot_path("affiliation", name, plot_dir))
 
-# function to iterate through
+    return fig
 
-affiliations_bar(affiliationsA, "A", "#4C979F")
-affiliations_bar(affiliationsB, "B", "#A7C947")
 
 ### In which Platform would it fit? - for both survey types, although slight difference in exactly what's recorded for each type
 
-# Noticed that for 'A', the response for 'none' is 'none of the current platforms'. and for B it's 'none of the existing platforms'
-# Need to standardise this
-
-surveyA = surveyA.replace(
-    "None of the current platforms", "None of the existing platforms", regex=True
-)
-
-# We need to use the Platform_fits column, but since can have multiple units listed in that column, it's necessary to do the counts as substrings
-
-# work to make sure that zero values (i.e. survey options not selected are included)
-Plat_data = pd.DataFrame(
-    {
-        "Platform": [
-            "Genomics",
-            "Clinical Genomics",
-            "Metabolomics",
-            "Spatial Biology",
-            "Cellular and Molecular Imaging",
-            "Integrated Structural Biology",
-            "Chemical Biology and Genome Engineering",
-            "Clinical Proteomics and Immunology",
-            "Drug Discovery and Development",
-            "Bioinformatics",
-            "None of the existing platforms",
-            "I do not know",
-        ],
-        "Count": [
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-        ],
-    }
-)
-
-Plat_fit_A = pd.DataFrame(
-    surveyA.Platform_fits.str.extractall("({})".format("|".join(Plat_data["Platform"])))
-    .iloc[:, 0]
-    .str.get_dummies()
-    .sum()
-    .reset_index()
-    .rename(columns={"index": "Platform", 0: "Count"})
-)
-
-plata_comb = pd.concat([Plat_data, Plat_fit_A])
-
-plata = plata_comb.groupby(["Platform"]).sum().reset_index()
-
-Plat_fit_B = (
-    surveyB.Platform_fits.str.extractall("({})".format("|".join(Plat_data["Platform"])))
-    .iloc[:, 0]
-    .str.get_dummies()
-    .sum()
-    .reset_index()
-    .rename(columns={"index": "Platform", 0: "Count"})
-)
+# We need to use the Platform_fits column, but since can have multiple units listed in that column, the answers are split before counting
 
-platb_comb = pd.concat([Plat_data, Plat_fit_B])
-
-platb = platb_comb.groupby(["Platform"]).sum().reset_index()
+# work to make sure that zero values (i.e. survey options not selected are included), see PLATFORM_OPTIONS
 
 
 # plot
-def platform_fit_bar(input, name, colour):
+def platform_fit_bar(input, name, colour, queue, plot_dir=PLOT_DIR):
     plat_fit = input
     fig = go.Figure(
         data=[
@@ -465,72 +259,16 @@ def platform_fit_bar(input, name, colour):
     )
     # fig.show()
 
-    if not os.path.isdir("Plots/"):
-        os.mkdir("Plots/")
-    fig.write_image("Plots/platform_fit_{}.svg".format(name))
-
-
-# function to iterate through
-
-platform_fit_bar(plata, "A", "#4C979F")
-platform_fit_bar(platb, "B", "#A7C947")
-
-### Contribution to capabilities - needed for both survey types
+    queue.add(fig, plot_path("platform_fit", name, plot_dir))
 
-Capability_data = pd.DataFrame(
-    {
-        "Capability": [
-            "Pandemic Laboratory Preparedness",
-            "Precision Medicine",
-            "Planetary Biology",
-            "Data Driven Life Science",
-            "None",
-            "I do not know",
-        ],
-        "Count": [
-            0,
-            0,
-            0,
-            0,
-            0,
-            0,
-        ],
-    }
-)
-
-Capability_fit_A = pd.DataFrame(
-    surveyA.Capability_fits.str.extractall(
-        "({})".format("|".join(Capability_data["Capability"]))
-    )
-    .iloc[:, 0]
-    .str.get_dummies()
-    .sum()
-    .reset_index()
-    .rename(columns={"index": "Capability", 0: "Count"})
-)
-
-capa_comb = pd.concat([Capability_data, Capability_fit_A])
-
-capa = capa_comb.groupby(["Capability"]).sum().reset_index()
-
-Capability_fit_B = pd.DataFrame(
-    surveyB.Capability_fits.str.extractall(
-        "({})".format("|".join(Capability_data["Capability"]))
-    )
-    .iloc[:, 0]
-    .str.get_dummies()
-    .sum()
-    .reset_index()
-    .rename(columns={"index": "Capability", 0: "Count"})
-)
+    return fig
 
-capb_comb = pd.concat([Capability_data, Capability_fit_B])
 
-capb = capb_comb.groupby(["Capability"]).sum().reset_index()
+### Contribution to capabilities - needed for both survey types (options in CAPABILITY_OPTIONS)
 
 
 # Plot
-def capability_fit_bar(input, name, colour):
+def capability_fit_bar(input, name, colour, queue, plot_dir=PLOT_DIR):
     capability_fit = input
     fig = go.Figure(
         data=[
@@ -613,48 +351,19 @@ def capability_fit_bar(input, name, colour):
     )
     # fig.show()
 
-    if not os.path.isdir("Plots/"):
-        os.mkdir("Plots/")
-    fig.write_image("Plots/capability_fit_{}.svg".format(name))
-
+    queue.add(fig, plot_path("capability_fit", name, plot_dir))
 
-# # function to iterate through
+    return fig
 
-capability_fit_bar(capa, "A", "#4C979F")
-capability_fit_bar(capb, "B", "#A7C947")
 
 # Estimate number of users that would have if incorporated into SciLifeLab - only needed for survey type B
 # Can only select one option here, so no need to split strings.
 
-# working to ensure that even options not selected in the survey are included
-Potential_users_data = pd.DataFrame(
-    {
-        "potential_users": [
-            "1-10",
-            "10-50",
-            "More than 50",
-            "I do not know",
-        ],
-        "Count": [
-            0,
-            0,
-            0,
-            0,
-        ],
-    }
-)
-
-potential_users_counts = (
-    surveyB.groupby(["potential_users"]).size().reset_index(name="Count")
-)
-
-pot_users_comb = pd.concat([Potential_users_data, potential_users_counts])
-
-pot_users = pot_users_comb.groupby(["potential_users"]).sum().reset_index()
+# working to ensure that even options not selected in the survey are included, see POTENTIAL_USERS_OPTIONS
 
 
 # plot
-def potential_users_bar(input, name, colour):
+def potential_users_bar(input, name, colour, queue, plot_dir=PLOT_DIR):
     pot_users = input
     fig = go.Figure(
         data=[
@@ -731,10 +440,168 @@ def potential_users_bar(input, name, colour):
     )
     # fig.show()
 
-    if not os.path.isdir("Plots/"):
-        os.mkdir("Plots/")
-    fig.write_image("Plots/potential_users_{}.svg".format(name))
+    queue.add(fig, plot_path("potential_users", name, plot_dir))
+
+    return fig
+
+
+# Cross-tabulations of two questions, as heatmaps (counts of the responses that selected both options)
+
+
+def crosstab_heatmap(table, crosstab, name, colour, queue, plot_dir=PLOT_DIR):
+    fig = go.Figure(
+        data=[
+            go.Heatmap(
+                z=table.to_numpy(),
+                x=list(table.columns),
+                y=list(table.index),
+                colorscale=[[0, "#FFFFFF"], [1, colour]],
+                texttemplate="%{z}",
+                xgap=1,
+                ygap=1,
+            ),
+        ]
+    )
+
+    fig.update_layout(
+        plot_bgcolor="white",
+        font=dict(size=18),
+        width=1400,
+        height=900,
+    )
+
+    # options in their usual order, the first one on top
+    fig.update_yaxes(title=" ", autorange="reversed", linecolor="black")
+    fig.update_xaxes(title=" ", tickangle=-45, linecolor="black")
+
+    queue.add(fig, plot_path(crosstab, name, plot_dir))
+
+    return fig
+
+
+# The cross-tabs to make: name -> (row question, column question, survey types), the
+# questions are those of QUESTIONS or the survey type. "all" is over all responses
+
+CROSSTABS = {
+    "platform_x_capability": ("platform_fit", "capability_fit", ["A", "B"]),
+    "affiliation_x_platform": ("affiliation", "platform_fit", ["A", "B"]),
+    "survey_type_x_potential_users": ("survey_type", "potential_users", ["all"]),
+}
+
+
+# The questions that can be cross-tabulated, the survey type is set by partition_survey_types
+
+CROSSTAB_QUESTIONS = dict(
+    QUESTIONS, survey_type=("survey_type", list(SURVEY_TYPES), False)
+)
+
+
+def make_plots(
+    path=SURVEY_FILE,
+    sheet_name=SURVEY_SHEET,
+    header=SURVEY_HEADER,
+    render_workers=1,
+    render=True,
+    plot_dir=PLOT_DIR,
+):
+    """
+    make_plots runs the whole pipeline: reads in the survey data, makes the counts,
+    saves the plots in plot_dir (Plots/) and writes the stats manifest used by Make_graph_pdfs.py.
+    The plots are rendered together at the end, spread over render_workers processes.
+    With render=False only the manifest is written (enough for the native pdf charts)
+    """
+    survey_data_raw = load_survey_data(path, sheet_name, header)
+    survey_types = partition_survey_types(survey_data_raw)
+
+    # Every question is counted for all survey types in one pass
+
+    tallies = tally_questions(survey_data_raw, QUESTIONS)
+
+    # The plotting functions queue their figures, which are all rendered in one batch
+
+    # Only the figures whose data or layout changed since the last run are rendered again
+
+    queue = RenderQueue(
+        workers=render_workers,
+        cache=RenderCache(os.path.join(plot_dir, ".render_cache.json")),
+    )
+
+    # Need counts for each survey types (go into top of pages)
+
+    countA = len(survey_types["A"])
+    countB = len(survey_types["B"])
+
+    affiliationsA = counts(tallies["affiliation"], "A", "Affiliation")
+    affiliationsB = counts(tallies["affiliation"], "B", "Affiliation")
+
+    # function to iterate through
+
+    figures = {}
+
+    figures["affiliation_A"] = affiliations_bar(
+        affiliationsA, "A", "#4C979F", queue, plot_dir
+    )
+    figures["affiliation_B"] = affiliations_bar(
+        affiliationsB, "B", "#A7C947", queue, plot_dir
+    )
+
+    plata = counts(tallies["platform_fit"], "A", "Platform")
+    platb = counts(tallies["platform_fit"], "B", "Platform")
+
+    figures["platform_fit_A"] = platform_fit_bar(plata, "A", "#4C979F", queue, plot_dir)
+    figures["platform_fit_B"] = platform_fit_bar(platb, "B", "#A7C947", queue, plot_dir)
+
+    capa = counts(tallies["capability_fit"], "A", "Capability")
+    capb = counts(tallies["capability_fit"], "B", "Capability")
+
+    figures["capability_fit_A"] = capability_fit_bar(
+        capa, "A", "#4C979F", queue, plot_dir
+    )
+    figures["capability_fit_B"] = capability_fit_bar(
+        capb, "B", "#A7C947", queue, plot_dir
+    )
+
+    pot_users = counts(tallies["potential_users"], "B", "potential_users")
+
+    figures["potential_users_B"] = potential_users_bar(
+        pot_users, "B", "#A7C947", queue, plot_dir
+    )
+
+    # Every question is one-hot encoded once, and every cross-tab is one sparse matrix product
+
+    colours = {"A": "#4C979F", "B": "#A7C947", "all": "#4C979F"}
+    crosstab = CrossTab(survey_data_raw, CROSSTAB_QUESTIONS)
+    crosstabs = {}
+    for name, (row_question, column_question, types) in CROSSTABS.items():
+        for survey_type in types:
+            rows = None if survey_type == "all" else survey_types[survey_type]
+            table = crosstab.table(row_question, column_question, rows)
+            crosstab_heatmap(
+                table, name, survey_type, colours[survey_type], queue, plot_dir
+            )
+            crosstabs.setdefault(name, {})[survey_type] = table
+
+    if render:
+        queue.flush()
+
+    # Record the counts, tallies, chart specs and plots so the pdf stage does not need to redo any of this
+
+    return write_manifest(
+        source=dict(path=path, sheet_name=sheet_name, header=header),
+        counts={"A": countA, "B": countB},
+        tallies={
+            "affiliation": {"A": affiliationsA, "B": affiliationsB},
+            "platform_fit": {"A": plata, "B": platb},
+            "capability_fit": {"A": capa, "B": capb},
+            "potential_users": {"B": pot_users},
+        },
+        charts={key: chart_spec(fig) for key, fig in figures.items()},
+        crosstabs=crosstabs,
+        plots=render,
+        plot_dir=plot_dir,
+        normalisation=survey_data_raw.attrs.get("normalisation"),
+    )
 
 
-# function to iterate through
-potential_users_bar(pot_users, "B", "#A7C947")
+if __name__ == "__main__":
+    make_plots()
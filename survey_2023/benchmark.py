@@ -0,0 +1,289 @@
+"""Benchmark of the survey scripts on synthetic exports
+
+Every stage of the scripts is timed on exports made by synthetic_survey.py:
+loading the export (with and without the parsed export cache), partitioning
+by survey type, tallying, rendering the plots (with and without the render
+cache), the summary pdfs (both chart backends) and the per-response pdfs.
+
+The benchmark runs in its own folder (benchmark_run/ by default, the fonts
+and the logo are copied there) so it never overwrites real output. The
+synthetic exports are kept there too, so a size is only generated once. Every
+run is appended to benchmark_results.jsonl together with the git commit, and
+the timings are printed next to those of the previous run of the same size,
+so regressions show up straight away.
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+# The stages, in the order they are run
+STAGES = [
+    "load",
+    "load_cached",
+    "partition",
+    "tally",
+    "crosstab",
+    "plots",
+    "plots_cached",
+    "summary_pdf",
+    "summary_pdf_native",
+    "report_pdfs",
+]
+
+RESULTS_FILE = "benchmark_results.jsonl"
+
+
+def git_commit():
+    """
+    git_commit returns the commit of the checked out code, or None outside a git repository
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_workdir(workdir):
+    """
+    prepare_workdir creates the folder the benchmark runs in, with the fonts and the logo
+    the pdfs need (copied from the current folder)
+    """
+    from report_resources import FONTS, LOGO_FILE
+
+    os.makedirs(workdir, exist_ok=True)
+    for filename in list(FONTS.values()) + [LOGO_FILE]:
+        if not os.path.isfile(os.path.join(workdir, filename)):
+            shutil.copy(filename, workdir)
+
+
+def synthetic_export(rows, seed):
+    """
+    synthetic_export returns the path of the synthetic export of this size, made if needed
+    """
+    from synthetic_survey import write_survey
+
+    path = os.path.join("Data", "synthetic_{}_{}.xlsx".format(rows, seed))
+    if not os.path.isfile(path):
+        write_survey(path, rows, seed)
+    return path
+
+
+def run_stages(path, stages, repeat=1, workers=1):
+    """
+    run_stages times the given stages on the export at path and returns stage -> seconds
+    (the best of `repeat` runs). Everything a stage needs is set up outside its timing
+    """
+    import Make_plots
+    import survey_cache
+
+    state = {}
+
+    def fresh():
+        state["frame"] = Make_plots.load_survey_data(path)
+
+    def partitioned():
+        fresh()
+        Make_plots.partition_survey_types(state["frame"])
+
+    def crosstabs():
+        # every question encoded once, then all the cross-tabs of Make_plots.py
+        crosstab = Make_plots.CrossTab(state["frame"], Make_plots.CROSSTAB_QUESTIONS)
+        for row_question, column_question, _ in Make_plots.CROSSTABS.values():
+            crosstab.table(row_question, column_question)
+
+    def no_render_cache():
+        # every plot is rendered again
+        if os.path.isfile(os.path.join("Plots", ".render_cache.json")):
+            os.remove(os.path.join("Plots", ".render_cache.json"))
+
+    def plotted():
+        from plot_manifest import load_manifest
+
+        if load_manifest() is None:
+            Make_plots.make_plots(path)
+
+    def plotted_no_drawing_cache():
+        plotted()
+        shutil.rmtree(os.path.join("Plots", ".drawing_cache"), ignore_errors=True)
+
+    def summary(backend):
+        import Make_graph_pdfs
+
+        Make_graph_pdfs._stats.clear()
+        # the plots of the benchmarked export, also when the manifest is of another one
+        Make_graph_pdfs.generatePdf("A", backend, source={"path": path})
+        Make_graph_pdfs.generatePdf("B", backend, source={"path": path})
+
+    def report_pdfs():
+        import single_survey_page
+
+        single_survey_page.make_reports(path, workers=workers, force=True)
+
+    # stage -> (setup, timed part)
+    actions = {
+        "load": (
+            lambda: shutil.rmtree(survey_cache.CACHE_DIR, ignore_errors=True),
+            lambda: Make_plots.load_survey_data(path),
+        ),
+        "load_cached": (fresh, lambda: Make_plots.load_survey_data(path)),
+        "partition": (
+            fresh,
+            lambda: Make_plots.partition_survey_types(state["frame"]),
+        ),
+        "tally": (
+            partitioned,
+            lambda: Make_plots.tally_questions(state["frame"], Make_plots.QUESTIONS),
+        ),
+        "crosstab": (partitioned, lambda: crosstabs()),
+        "plots": (no_render_cache, lambda: Make_plots.make_plots(path)),
+        "plots_cached": (plotted, lambda: Make_plots.make_plots(path)),
+        "summary_pdf": (plotted_no_drawing_cache, lambda: summary("svg")),
+        "summary_pdf_native": (plotted, lambda: summary("native")),
+        "report_pdfs": (lambda: None, report_pdfs),
+    }
+
+    timings = {}
+    for stage in [s for s in STAGES if s in stages]:
+        setup, run = actions[stage]
+        best = None
+        for _ in range(repeat):
+            # the scripts report their progress, which is not wanted here
+            with contextlib.redirect_stdout(io.StringIO()):
+                setup()
+                start = time.perf_counter()
+                run()
+                seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        timings[stage] = best
+        print("  {:<20} {:9.3f} s".format(stage, best), flush=True)
+    return timings
+
+
+def previous_result(results_file, rows, workers):
+    """
+    previous_result returns the last recorded run with the same size and number of workers
+    """
+    previous = None
+    if os.path.isfile(results_file):
+        with open(results_file, encoding="utf-8") as fh:
+            for line in fh:
+                result = json.loads(line)
+                if result["rows"] == rows and result["workers"] == workers:
+                    previous = result
+    return previous
+
+
+def report(result, previous):
+    """
+    report prints the timings of a run next to those of the previous run of the same size
+    """
+    print(
+        "\n{} rows, commit {} (previous: {})".format(
+            result["rows"],
+            result["commit"],
+            previous["commit"] if previous else "none",
+        )
+    )
+    print("{:<20} {:>10} {:>10} {:>8}".format("stage", "seconds", "previous", "change"))
+    for stage, seconds in result["stages"].items():
+        before = previous["stages"].get(stage) if previous else None
+        if before:
+            print(
+                "{:<20} {:10.3f} {:10.3f} {:+7.0f}%".format(
+                    stage, seconds, before, (seconds / before - 1) * 100
+                )
+            )
+        else:
+            print("{:<20} {:10.3f} {:>10} {:>8}".format(stage, seconds, "-", "-"))
+
+
+def benchmark(
+    sizes, stages=STAGES, repeat=1, workers=1, seed=1, results_file=RESULTS_FILE
+):
+    """
+    benchmark times the stages for every export size, records the results in
+    results_file and prints them next to the previous results
+    """
+    results = []
+    for rows in sizes:
+        print("{} rows".format(rows), flush=True)
+        path = synthetic_export(rows, seed)
+        result = {
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "rows": rows,
+            "seed": seed,
+            "workers": workers,
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "stages": run_stages(path, stages, repeat, workers),
+        }
+        previous = previous_result(results_file, rows, workers)
+        with open(results_file, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(result) + "\n")
+        report(result, previous)
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time the survey scripts on synthetic exports"
+    )
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[100, 1000],
+        help="export sizes (default 100 1000)",
+    )
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=STAGES,
+        default=STAGES,
+        help="stages to time (default all)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="runs per stage, the best one counts (default 1)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="processes for the per-response pdfs (default 1)",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=1, help="seed of the synthetic exports (default 1)"
+    )
+    parser.add_argument(
+        "--workdir",
+        default="benchmark_run",
+        help="folder to run in (default benchmark_run)",
+    )
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    prepare_workdir(args.workdir)
+    os.chdir(args.workdir)
+    benchmark(args.rows, args.stages, args.repeat, args.jobs, args.seed)
@@ -0,0 +1,66 @@
+"""Build manifest for incremental output generation
+
+The manifest records, for every output file, a digest of everything the file
+is made from. On the next run only the outputs whose digest changed (or whose
+file is gone) are built again, and outputs that are no longer part of the plan
+are deleted.
+"""
+
+import json
+import os
+
+
+class BuildManifest(object):
+    # Digests of the inputs of every output file, stored as json in filename
+    def __init__(self, filename):
+        self.filename = filename
+        self._previous = {}
+        self._current = {}
+        if os.path.isfile(filename):
+            with open(filename, encoding="utf-8") as fh:
+                self._previous = json.load(fh)
+        self.rebuilt = []
+        self.unchanged = []
+        self.removed = []
+
+    # Tells if output needs to be built for inputs with this digest (and records the digest).
+    # With force, every output needs to be built
+    def needs_build(self, output, digest, force=False):
+        self._current[output] = digest
+        if (
+            not force
+            and self._previous.get(output) == digest
+            and os.path.isfile(output)
+        ):
+            self.unchanged.append(output)
+            return False
+        self.rebuilt.append(output)
+        return True
+
+    # Keep the output as it is (not looked at in this run), so it is not deleted by finish
+    def keep(self, output):
+        if output in self._previous:
+            self._current[output] = self._previous[output]
+
+    # Delete the outputs of the previous run that are not part of this run, and save the manifest
+    def finish(self):
+        for output in self._previous:
+            if output not in self._current:
+                if os.path.isfile(output):
+                    os.remove(output)
+                self.removed.append(output)
+                # drop folders that are left empty
+                directory = os.path.dirname(output)
+                if directory and os.path.isdir(directory) and not os.listdir(directory):
+                    os.rmdir(directory)
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.filename + ".tmp", "w", encoding="utf-8") as fh:
+            json.dump(self._current, fh, indent=1, ensure_ascii=False)
+        os.replace(self.filename + ".tmp", self.filename)
+
+    def summary(self):
+        return "{} rebuilt, {} unchanged, {} removed".format(
+            len(self.rebuilt), len(self.unchanged), len(self.removed)
+        )
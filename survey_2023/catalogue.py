@@ -0,0 +1,281 @@
+"""Catalogue of the per-response pdfs
+
+Every planned report gets one record: report and registration number, title,
+platform, category, the pdf (or proposal book) it is in, its first page and
+number of pages there, the size of that file and a hash of its source row.
+Proposals that are near-duplicates of others (see near_duplicates.py) also
+get their cluster and the registration numbers of the related proposals.
+
+The records are streamed to the meta data file, as Excel (openpyxl in
+write-only mode, no cell objects are kept), CSV or Parquet depending on the
+file extension. They are also stored in a json index keyed by report number,
+with lookups by registration number and platform, so other tools can find the
+pdf of a proposal without walking the output folders or reading the survey
+export again:
+
+    python catalogue.py 7 A12
+    python catalogue.py --platform Genomics
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+from itertools import islice
+
+# The columns of the meta data file, and the keys of the index records in the same order
+COLUMNS = [
+    "Report Num.",
+    "Reg Num.",
+    "Title",
+    "Platform",
+    "Category",
+    "Cluster",
+    "Related",
+    "Output",
+    "Page",
+    "Pages",
+    "File size",
+    "Row hash",
+]
+FIELDS = [
+    "rpid",
+    "reg_no",
+    "title",
+    "platform",
+    "category",
+    "cluster",
+    "related",
+    "output",
+    "page",
+    "pages",
+    "size",
+    "row_hash",
+]
+
+INDEX_FILE = "Survey_index.json"
+
+# Rows per batch written to a Parquet file
+PARQUET_BATCH = 1024
+
+
+def row_hash(row):
+    """
+    row_hash returns a short hash of the source row of a report
+    """
+    text = json.dumps(list(row), ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:20]
+
+
+def count_pages(path):
+    """
+    count_pages returns the number of pages of a pdf made by reportlab (which writes
+    every page object uncompressed), or None when the file is not there
+    """
+    if not os.path.isfile(path):
+        return None
+    with open(path, "rb") as fh:
+        return len(re.findall(rb"/Type\s*/Page(?![s\w])", fh.read()))
+
+
+def catalogue_records(plans, placed=None, previous=None, related=None):
+    """
+    catalogue_records yields the record of every plan, in plan order. placed maps the filename of a
+    report to (output, first page, pages) for the reports made in this run (pages can be
+    None). The page counts of the other reports come from the previous index, if it
+    has them, or are counted from the pdf. related has the clusters of near-duplicate
+    proposals, as returned by near_duplicates.related_proposals
+    """
+    from near_duplicates import related_text
+
+    placed = placed or {}
+    related = related or {}
+    previous = previous or {"reports": {}}
+    sizes = {}
+    for plan in plans:
+        output, page, pages = placed.get(plan.filename, (plan.filename, 1, None))
+        rhash = row_hash(plan.response.row)
+        if pages is None:
+            before = previous["reports"].get(plan.rpid.lstrip("0"))
+            if before and before["output"] == output and before["row_hash"] == rhash:
+                pages = before["pages"]
+            else:
+                pages = count_pages(output)
+        if output not in sizes:
+            sizes[output] = os.path.getsize(output) if os.path.isfile(output) else None
+        cluster = related.get(plan.reg_no)
+        values = [
+            plan.rpid,
+            plan.reg_no,
+            plan.title,
+            plan.platform,
+            "Technology" if plan.sid == "A" else "Unit",
+            cluster["cluster"] if cluster else None,
+            related_text(cluster["related"]) if cluster else None,
+            output,
+            page,
+            pages,
+            sizes[output],
+            rhash,
+        ]
+        yield dict(zip(FIELDS, values))
+
+
+def _write_xlsx(records, filename):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(COLUMNS)
+    for record in records:
+        ws.append([record[field] for field in FIELDS])
+    wb.save(filename)
+
+
+def _write_csv(records, filename):
+    with open(filename, "w", encoding="utf-8", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(COLUMNS)
+        for record in records:
+            writer.writerow([record[field] for field in FIELDS])
+
+
+def _write_parquet(records, filename):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    numbers = ["page", "pages", "size"]
+    schema = pa.schema(
+        [
+            (column, pa.int64() if field in numbers else pa.string())
+            for column, field in zip(COLUMNS, FIELDS)
+        ]
+    )
+    records = iter(records)
+    with pq.ParquetWriter(filename, schema) as writer:
+        # only one batch of records is held at a time, an empty file still gets its schema
+        batch = list(islice(records, PARQUET_BATCH))
+        while True:
+            writer.write_table(
+                pa.table(
+                    {
+                        column: [record[field] for record in batch]
+                        for column, field in zip(COLUMNS, FIELDS)
+                    },
+                    schema=schema,
+                )
+            )
+            batch = list(islice(records, PARQUET_BATCH))
+            if not batch:
+                break
+
+
+_WRITERS = {".xlsx": _write_xlsx, ".csv": _write_csv, ".parquet": _write_parquet}
+
+
+def write_catalogue(records, filename):
+    """
+    write_catalogue streams the records (any iterable, e.g. catalogue_records) to
+    filename, as Excel, CSV or Parquet (by the extension of filename)
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in _WRITERS:
+        raise ValueError(
+            "Unknown meta data format {}, use one of {}".format(
+                filename, ", ".join(_WRITERS)
+            )
+        )
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    _WRITERS[extension](records, filename)
+    return filename
+
+
+def indexed(records, index):
+    """
+    indexed yields the records and adds each of them to index on the way: the records
+    by report number (without leading zeros), and the report numbers by registration
+    number and by platform. This way the records can be indexed while they are streamed
+    to the meta data file
+    """
+    for key in ["reports", "reg_no", "platform"]:
+        index.setdefault(key, {})
+    for record in records:
+        rpid = record["rpid"].lstrip("0")
+        index["reports"][rpid] = record
+        index["reg_no"].setdefault(record["reg_no"], []).append(rpid)
+        index["platform"].setdefault(record["platform"], []).append(rpid)
+        yield record
+
+
+def write_index(records, filename=INDEX_FILE, index=None):
+    """
+    write_index stores the records in a json index (see indexed), or stores index when it
+    was already filled by indexed and records is empty
+    """
+    index = {} if index is None else index
+    for _ in indexed(records, index):
+        pass
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(filename + ".tmp", "w", encoding="utf-8") as fh:
+        json.dump(index, fh, indent=1, ensure_ascii=False)
+    os.replace(filename + ".tmp", filename)
+    return index
+
+
+def load_index(filename=INDEX_FILE):
+    """
+    load_index returns the index written by write_index, or None when there is none
+    """
+    if not os.path.isfile(filename):
+        return None
+    with open(filename, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def lookup(index, keys=(), platform=None):
+    """
+    lookup returns the records of the reports with these keys (report numbers, with or
+    without leading zeros, or registration numbers) and/or of a platform, in report order
+    """
+    rpids = []
+    for key in keys:
+        key = str(key)
+        if key.lstrip("0") in index["reports"]:
+            rpids.append(key.lstrip("0"))
+        rpids += index["reg_no"].get(key, [])
+    if platform:
+        rpids += index["platform"].get(platform, [])
+    return [index["reports"][r] for r in sorted(set(rpids), key=int)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find the pdfs of proposals in the report index"
+    )
+    parser.add_argument(
+        "keys", nargs="*", help="report numbers or registration numbers"
+    )
+    parser.add_argument("--platform", help="all reports of this platform")
+    parser.add_argument(
+        "--index", default=INDEX_FILE, help="index file (default Survey_index.json)"
+    )
+    args = parser.parse_args()
+    index = load_index(args.index)
+    if index is None:
+        parser.exit(1, "No index {}, make the reports first\n".format(args.index))
+    for record in lookup(index, args.keys, args.platform):
+        print(
+            "{}\t{}\t{}\tpage {}\t{}".format(
+                record["rpid"],
+                record["reg_no"],
+                record["output"],
+                record["page"],
+                record["title"],
+            )
+        )
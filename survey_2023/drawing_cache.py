@@ -0,0 +1,70 @@
+"""On-disk cache of the reportlab drawings parsed from the svg plots
+
+Parsing plotly's svg output with svglib is the slowest part of making the
+summary pdfs. The first time a plot is used, the parsed Drawing is pickled to
+.drawing_cache/ next to the plot (Plots/.drawing_cache/) under the hash of the svg file (and the svglib and
+reportlab versions). As long as the plot does not change, later runs load the
+pickle instead of parsing the svg again. Entries of earlier versions of the
+same plot are removed when a new one is stored, and the cache can be deleted
+at any time.
+
+The pickles are trusted: loading one runs whatever it contains, like importing
+a module from the working copy. Plots/.drawing_cache/ is written by these
+scripts only and must not be shared or filled from elsewhere.
+"""
+
+import hashlib
+import os
+import pickle
+from importlib.metadata import version
+
+from survey_trace import stage
+
+CACHE_DIR = ".drawing_cache"
+
+# Read from the package metadata, so a cache hit does not import svglib
+PARSER_VERSIONS = "{} {}".format(version("svglib"), version("reportlab")).encode("utf-8")
+
+
+def _drawing_key(svg_bytes):
+    digest = hashlib.sha256(svg_bytes)
+    digest.update(PARSER_VERSIONS)
+    return digest.hexdigest()[:20]
+
+
+def _store(drawing, cache_file, prefix):
+    # Write to a temporary file first so an interrupted run never leaves a broken cache
+    cache_dir = os.path.dirname(cache_file)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_file + ".tmp", "wb") as fh:
+        pickle.dump(drawing, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(cache_file + ".tmp", cache_file)
+    # Drop the entries of earlier versions of the same plot
+    for entry in os.listdir(cache_dir):
+        if entry.startswith(prefix) and entry != os.path.basename(cache_file):
+            os.remove(os.path.join(cache_dir, entry))
+
+
+def load_drawing(svg_path):
+    """
+    load_drawing returns the svg file at svg_path as a reportlab Drawing, parsed
+    with svglib only if it is not in the cache yet
+    """
+    with open(svg_path, "rb") as fh:
+        svg_bytes = fh.read()
+    prefix = os.path.splitext(os.path.basename(svg_path))[0] + "_"
+    cache_dir = os.path.join(os.path.dirname(svg_path), CACHE_DIR)
+    cache_file = os.path.join(cache_dir, prefix + _drawing_key(svg_bytes) + ".pickle")
+    if os.path.isfile(cache_file):
+        try:
+            with open(cache_file, "rb") as fh:
+                return pickle.load(fh)
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # a broken or incompatible entry is parsed again and replaced
+            pass
+    from svglib.svglib import svg2rlg
+
+    with stage("svg2rlg:" + svg_path):
+        drawing = svg2rlg(svg_path)
+    _store(drawing, cache_file, prefix)
+    return drawing
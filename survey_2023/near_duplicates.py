@@ -0,0 +1,440 @@
+"""Near-duplicate proposals
+
+The same technology is often proposed more than once, by different groups,
+as survey type A and B or under different platforms. This script finds such
+proposals without comparing every pair:
+
+- the title and description of every proposal are cut into shingles (runs of
+  SHINGLE_WORDS words),
+- every proposal gets a MinHash signature of NUM_PERM hash functions, the
+  share of equal values of two signatures estimates the Jaccard similarity of
+  their shingles,
+- the signatures are cut into BANDS bands, and only proposals that share all
+  values of at least one band (locality-sensitive hashing) become candidates,
+- proposals with the same signature are only paired with the first of them,
+  and band buckets of more than MAX_BUCKET proposals are skipped, so the
+  number of candidates does not grow with the square of the proposals,
+- candidates whose estimated similarity is at least THRESHOLD are related, and
+  related proposals are joined into clusters (a cluster can also hold
+  proposals that are only related through another one).
+
+The signatures of an export are cached in .survey_cache/, keyed by the hash of
+the export, so earlier years' exports (history) are only shingled once. The
+clusters are cached there as well, keyed by the hashes of all the exports, so
+a run whose exports did not change does no MinHash work at all. The
+clusters go into the report catalogue (see catalogue.py) with --related in
+single_survey_page.py and, with --related-note, into a "possibly related proposals"
+note in the pdfs.
+
+    python near_duplicates.py -i Survey.xlsx --history 2022 Data/survey_2022.xlsx
+    python near_duplicates.py --history 2022 Data/survey_2022.xlsx "Form Responses 1" 0
+
+An earlier export laid out differently than the current one is given with its
+sheet and header row (0 based), as for --year in trends.py.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+
+from search_index import tokenize
+from survey_cache import CACHE_DIR, file_digest, source_digest
+from survey_responses import SURVEY_COLUMNS, read_responses, unique_responses
+
+SHINGLE_WORDS = 3
+NUM_PERM = 128
+# 32 bands of 4 values: pairs with a similarity of 0.5 become candidates with a
+# chance of 87%, pairs with 0.2 only with 5%
+BANDS = 32
+THRESHOLD = 0.5
+# The most similar proposals listed as related to a proposal
+MAX_RELATED = 10
+# Band buckets with more distinct signatures than this are not expanded into pairs, the
+# pairs of a bucket grow with the square of its size
+MAX_BUCKET = 200
+
+# The largest prime below 2**32, (a * x + b) of 32 bit numbers never overflows 64 bits,
+# and the signatures (the minima mod _PRIME) fit in 32 bits
+_PRIME = np.uint64(4294967291)
+
+# The code the signatures are made with, a change to any of these makes the cached ones stale
+SIGNATURE_CODE_FILES = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    for name in ["near_duplicates.py", "search_index.py", "survey_responses.py"]
+]
+
+
+def shingles(text, k=SHINGLE_WORDS):
+    """
+    shingles returns the set of runs of k words of text (the whole text, if it is shorter)
+    """
+    words = tokenize(text)
+    if len(words) <= k:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i : i + k]) for i in range(len(words) - k + 1)}
+
+
+def _shingle_hashes(shingles):
+    return np.fromiter(
+        (
+            int.from_bytes(
+                hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little"
+            )
+            for s in shingles
+        ),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+
+
+def _permutations(num_perm=NUM_PERM, seed=1):
+    # The hash functions (a * x + b) mod _PRIME, the same in every run
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+    return a[:, None], b[:, None]
+
+
+def signatures(texts, num_perm=NUM_PERM):
+    """
+    signatures returns the MinHash signatures of the texts (one row per text). Texts
+    without any word get a row of _PRIME, which never matches a real signature
+    """
+    a, b = _permutations(num_perm)
+    result = np.full((len(texts), num_perm), _PRIME, dtype=np.uint32)
+    for row, text in enumerate(texts):
+        hashes = _shingle_hashes(shingles(text))
+        if len(hashes):
+            result[row] = ((a * hashes[None, :] + b) % _PRIME).min(axis=1)
+    return result
+
+
+def proposal_texts(responses):
+    """
+    proposal_texts returns the title and description of every response (survey_response
+    objects of survey_responses.py) as one text
+    """
+    texts = []
+    for response in responses:
+        description = response.row[SURVEY_COLUMNS[response.sid]["description"]]
+        if description == "None":
+            description = ""
+        texts.append(response.title + "\n" + description)
+    return texts
+
+
+def read_proposals(survey_file, sheet_name=None, header=1):
+    """
+    read_proposals returns the responses of an export once each, in registration order
+    """
+    return unique_responses(read_responses(survey_file, sheet_name, header)[0])
+
+
+def _code_version():
+    return hashlib.sha256(
+        "".join(file_digest(f) for f in SIGNATURE_CODE_FILES).encode("utf-8")
+    ).hexdigest()
+
+
+def _signature_file(survey_file, sheet_name, header):
+    key = "{}|{}|{}|{}|{}".format(
+        source_digest(survey_file), sheet_name, header, NUM_PERM, _code_version()
+    )
+    name = "minhash_" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:20] + ".npz"
+    return os.path.join(CACHE_DIR, name)
+
+
+def export_signatures(survey_file, sheet_name=None, header=1, responses=None):
+    """
+    export_signatures returns the registration numbers, titles and MinHash signatures of
+    the proposals of an export, from the cache when the export was seen before. responses
+    are the proposals of the export when they are already read
+    """
+    cache_file = _signature_file(survey_file, sheet_name, header)
+    if os.path.isfile(cache_file):
+        with np.load(cache_file) as cached:
+            return (
+                [str(reg_no) for reg_no in cached["reg_nos"]],
+                [str(title) for title in cached["titles"]],
+                cached["signatures"],
+            )
+    if responses is None:
+        responses = read_proposals(survey_file, sheet_name, header)
+    reg_nos = [response.reg_no for response in responses]
+    titles = [response.title for response in responses]
+    result = signatures(proposal_texts(responses))
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(cache_file + ".tmp", "wb") as fh:
+        np.savez(fh, reg_nos=reg_nos, titles=titles, signatures=result)
+    os.replace(cache_file + ".tmp", cache_file)
+    return reg_nos, titles, result
+
+
+def candidate_pairs(signatures, bands=BANDS, max_bucket=MAX_BUCKET):
+    """
+    candidate_pairs returns the pairs of rows (first < second, as two arrays) that have all
+    values of at least one band in common. Rows with the same signature (e.g. the same
+    boilerplate text) are paired with the first of them only, and the bands are compared
+    between distinct signatures. Buckets of more than max_bucket distinct signatures
+    (a band value most proposals share) are skipped, the number skipped is printed
+    """
+    count, width = signatures.shape
+    rows = width // bands
+    keep = np.flatnonzero(~(signatures == _PRIME).all(axis=1))
+    distinct, first_rows, inverse = np.unique(
+        signatures[keep], axis=0, return_index=True, return_inverse=True
+    )
+    # The first row of every distinct signature, and the other rows with that signature
+    representatives = keep[first_rows]
+    duplicates = keep != representatives[inverse.ravel()]
+    pairs = [
+        representatives[inverse.ravel()[duplicates]] * count + keep[duplicates]
+    ]
+    skipped = 0
+    for band in range(bands):
+        block = np.ascontiguousarray(distinct[:, band * rows : (band + 1) * rows])
+        # Signatures with the same band values fall into the same bucket
+        keys = block.view(np.dtype((np.void, block.dtype.itemsize * rows))).ravel()
+        order = np.argsort(keys, kind="stable")
+        starts = np.flatnonzero(np.r_[True, keys[order][1:] != keys[order][:-1], True])
+        for begin, end in zip(starts[:-1], starts[1:]):
+            if end - begin > max_bucket:
+                skipped += 1
+            elif end - begin > 1:
+                members = representatives[order[begin:end]]
+                first, second = np.triu_indices(end - begin, 1)
+                low = np.minimum(members[first], members[second])
+                high = np.maximum(members[first], members[second])
+                pairs.append(low * count + high)
+    if skipped:
+        print(
+            "{} band bucket(s) of more than {} proposals skipped".format(
+                skipped, max_bucket
+            )
+        )
+    pairs = np.unique(np.concatenate(pairs))
+    return pairs // count, pairs % count
+
+
+def similar_pairs(signatures, threshold=THRESHOLD, bands=BANDS, chunk=1 << 16):
+    """
+    similar_pairs returns the candidate pairs whose estimated similarity is at least
+    threshold, as (first rows, second rows, similarities)
+    """
+    first, second = candidate_pairs(signatures, bands)
+    similarity = np.empty(len(first))
+    for start in range(0, len(first), chunk):
+        part = slice(start, start + chunk)
+        equal = signatures[first[part]] == signatures[second[part]]
+        similarity[part] = np.count_nonzero(equal, axis=1) / signatures.shape[1]
+    similar = similarity >= threshold
+    return first[similar], second[similar], similarity[similar]
+
+
+def find_clusters(count, first, second):
+    """
+    find_clusters joins the pairs of rows into clusters, returns the clusters of more than
+    one row (lists of rows in row order), in the order of their first rows
+    """
+    parent = list(range(count))
+
+    def root(row):
+        while parent[row] != row:
+            parent[row] = parent[parent[row]]
+            row = parent[row]
+        return row
+
+    for a, b in zip(first.tolist(), second.tolist()):
+        parent[root(b)] = root(a)
+    clusters = {}
+    for row in range(count):
+        clusters.setdefault(root(row), []).append(row)
+    return sorted(
+        (rows for rows in clusters.values() if len(rows) > 1), key=lambda rows: rows[0]
+    )
+
+
+def history_exports(values):
+    """
+    history_exports returns (label, path, sheet_name, header) of every history export given
+    as LABEL EXPORT or LABEL EXPORT SHEET HEADER (on the command line, --history). Without
+    SHEET and HEADER the export is read like the current one: the active sheet, header row 1
+    """
+    exports = []
+    for given in values:
+        if len(given) not in (2, 4):
+            raise ValueError(
+                "--history takes LABEL EXPORT or LABEL EXPORT SHEET HEADER, not {}".format(
+                    " ".join(given)
+                )
+            )
+        label, path = given[:2]
+        if len(given) == 4:
+            exports.append((label, path, given[2], int(given[3])))
+        else:
+            exports.append((label, path, None, 1))
+    return exports
+
+
+def _clusters_file(survey_file, sheet_name, header, history, threshold):
+    # The clusters found with these inputs: the export and every history export (by their
+    # contents), the settings and the code. The name starts with a hash of the path of the
+    # export, so only the latest clusters of an export are kept
+    key = json.dumps(
+        [
+            [source_digest(path), sheet, head, label]
+            for label, path, sheet, head in [("", survey_file, sheet_name, header)]
+            + history
+        ]
+        + [threshold, NUM_PERM, BANDS, MAX_BUCKET, MAX_RELATED, _code_version()]
+    )
+    source = hashlib.sha256(os.path.abspath(survey_file).encode("utf-8")).hexdigest()
+    name = "clusters_{}_{}.json".format(
+        source[:12], hashlib.sha256(key.encode("utf-8")).hexdigest()[:20]
+    )
+    return os.path.join(CACHE_DIR, name)
+
+
+def _store_clusters(related, cache_file):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(cache_file + ".tmp", "w", encoding="utf-8") as fh:
+        json.dump(related, fh, ensure_ascii=False)
+    os.replace(cache_file + ".tmp", cache_file)
+    # Drop the clusters of earlier inputs of the same export
+    prefix = os.path.basename(cache_file)[: -len(".json") - 20]
+    for entry in os.listdir(CACHE_DIR):
+        if entry.startswith(prefix) and entry != os.path.basename(cache_file):
+            os.remove(os.path.join(CACHE_DIR, entry))
+
+
+def related_proposals(
+    survey_file,
+    sheet_name=None,
+    header=1,
+    history=(),
+    threshold=THRESHOLD,
+    responses=None,
+    detect=True,
+):
+    """
+    related_proposals finds the near-duplicate proposals of an export, also among the
+    proposals of earlier exports (history: (label, path, sheet_name, header), see
+    history_exports).
+    Returns reg number -> {"cluster": cluster id, "related": [(label, reg number, title), ...]}
+    for the proposals of the export that are in a cluster (label is "" for the export itself).
+    related are the (at most MAX_RELATED) proposals found most similar to this one, most
+    similar first; the cluster also has the proposals that are only similar to one of those.
+    The clusters are cached, a run with the same exports (and code) does no MinHash work.
+    With detect=False nothing is detected, the clusters are only taken from the cache
+    (empty when the inputs changed)
+    """
+    history = history_exports(history)
+    cache_file = _clusters_file(survey_file, sheet_name, header, history, threshold)
+    if os.path.isfile(cache_file):
+        with open(cache_file, encoding="utf-8") as fh:
+            cached = json.load(fh)
+        for entry in cached.values():
+            entry["related"] = [tuple(other) for other in entry["related"]]
+        return cached
+    if not detect:
+        return {}
+    labels, reg_nos, titles, blocks = [], [], [], []
+    for label, path, sheet, head, proposals in [
+        ("", survey_file, sheet_name, header, responses)
+    ] + [export + (None,) for export in history]:
+        regs, names, block = export_signatures(path, sheet, head, proposals)
+        labels += [label] * len(regs)
+        reg_nos += regs
+        titles += names
+        blocks.append(block)
+    signatures = np.concatenate(blocks)
+    first, second, similarity = similar_pairs(signatures, threshold)
+    # The MAX_RELATED most similar proposals of every proposal (ties in row order)
+    rows = np.concatenate([first, second])
+    others = np.concatenate([second, first])
+    order = np.lexsort((others, -np.concatenate([similarity, similarity]), rows))
+    rows, others = rows[order], others[order]
+    starts = np.searchsorted(rows, rows)
+    top = np.arange(len(rows)) - starts < MAX_RELATED
+    neighbours = {}
+    for row, other in zip(rows[top].tolist(), others[top].tolist()):
+        neighbours.setdefault(row, []).append(other)
+    related = {}
+    for number, rows in enumerate(find_clusters(len(signatures), first, second), 1):
+        for row in rows:
+            if labels[row]:
+                continue
+            related[reg_nos[row]] = {
+                "cluster": "C{}".format(number),
+                "related": [
+                    (labels[other], reg_nos[other], titles[other])
+                    for other in neighbours[row]
+                ],
+            }
+    _store_clusters(related, cache_file)
+    return related
+
+
+def related_text(related):
+    """
+    related_text returns the related proposals as one short string, e.g. "A12, 2022 B3"
+    """
+    return ", ".join(
+        "{} {}".format(label, reg_no) if label else reg_no
+        for label, reg_no, title in related
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find near-duplicate proposals in the survey export"
+    )
+    parser.add_argument(
+        "-i", "--input", default="Survey.xlsx", help="the survey export"
+    )
+    parser.add_argument("--sheet", help="sheet of the export (default the active one)")
+    parser.add_argument(
+        "--header", type=int, default=1, help="row of the column names (default 1)"
+    )
+    parser.add_argument(
+        "--history",
+        nargs="+",
+        action="append",
+        default=[],
+        metavar="LABEL EXPORT [SHEET HEADER]",
+        help="also compare with the proposals of an earlier export (read from SHEET with the column names in row HEADER, 0 based, if given), can be given more than once",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="estimated similarity of related proposals (default {})".format(THRESHOLD),
+    )
+    args = parser.parse_args()
+    try:
+        history = history_exports(args.history)
+    except ValueError as error:
+        parser.error(str(error))
+    related = related_proposals(
+        args.input, args.sheet, args.header, history, args.threshold
+    )
+    clusters = {}
+    for reg_no, entry in related.items():
+        clusters.setdefault(entry["cluster"], []).append(reg_no)
+    for cluster, members in clusters.items():
+        others = related[members[0]]["related"]
+        print(
+            "{}: {}".format(
+                cluster,
+                "; ".join(
+                    [members[0]]
+                    + [
+                        "{} {} ({})".format(label, reg_no, title).strip()
+                        for label, reg_no, title in others
+                    ]
+                ),
+            )
+        )
+    print("{} proposal(s) in {} cluster(s)".format(len(related), len(clusters)))
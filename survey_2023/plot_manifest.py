@@ -0,0 +1,152 @@
+"""Stats manifest shared between Make_plots.py and Make_graph_pdfs.py
+
+Make_plots.py writes Plots/stats_manifest.json with the number of proposals per
+survey type, the number of cells every normalisation rule changed, the
+per-question tallies, the cross-tabs of pairs of questions, the chart spec of
+every plot (used by the native chart backend) and the path and content hash of
+every plot.
+Make_graph_pdfs.py reads it instead of importing the whole plotting pipeline,
+and only asks for the plots to be made again when the manifest is missing or
+stale.
+"""
+
+import json
+import os
+
+from survey_cache import file_digest, source_digest
+
+PLOT_DIR = "Plots"
+MANIFEST_FILE = os.path.join(PLOT_DIR, "stats_manifest.json")
+
+# The code that produces the plots, a change to any of these makes the manifest stale
+PLOT_CODE_FILES = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    for name in [
+        "Make_plots.py",
+        "survey_loading.py",
+        "survey_responses.py",
+        "survey_options.py",
+        "survey_normalise.py",
+        "survey_tally.py",
+        "survey_crosstab.py",
+        "render_queue.py",
+        "rl_charts.py",
+    ]
+]
+
+
+def code_version():
+    """
+    code_version returns a digest of the plotting code
+    """
+    return "".join(file_digest(f)[:16] for f in PLOT_CODE_FILES)
+
+
+def plot_path(question, survey_type, plot_dir=PLOT_DIR):
+    return os.path.join(plot_dir, "{}_{}.svg".format(question, survey_type))
+
+
+def manifest_file(plot_dir=PLOT_DIR):
+    return os.path.join(plot_dir, os.path.basename(MANIFEST_FILE))
+
+
+def write_manifest(
+    source,
+    counts,
+    tallies,
+    charts,
+    crosstabs=None,
+    plots=True,
+    plot_dir=PLOT_DIR,
+    normalisation=None,
+):
+    """
+    write_manifest records the counts, the cells changed by every normalisation rule,
+    the tallies (dataframes with the option in the first column and a Count column), the
+    cross-tabs (dataframes of counts, options of two questions as index and columns), the
+    chart specs and, unless plots is False, the plots made from them. The manifest is
+    returned as well as written to plot_dir.
+    """
+    manifest = {
+        "source": dict(source, sha256=source_digest(source["path"])),
+        "code_version": code_version(),
+        "counts": {k: int(v) for k, v in counts.items()},
+        "normalisation": dict(normalisation or {}),
+        "tallies": {},
+        "crosstabs": {},
+        "charts": charts,
+        "plots": {},
+    }
+    for question, per_type in tallies.items():
+        manifest["tallies"][question] = {}
+        for survey_type, tally in per_type.items():
+            manifest["tallies"][question][survey_type] = {
+                str(option): int(count)
+                for option, count in zip(tally.iloc[:, 0], tally["Count"])
+            }
+            if not plots:
+                continue
+            path = plot_path(question, survey_type, plot_dir)
+            manifest["plots"]["{}_{}".format(question, survey_type)] = {
+                "path": path,
+                "sha256": file_digest(path),
+            }
+    for name, per_type in (crosstabs or {}).items():
+        manifest["crosstabs"][name] = {}
+        for survey_type, table in per_type.items():
+            manifest["crosstabs"][name][survey_type] = {
+                "rows": [str(option) for option in table.index],
+                "columns": [str(option) for option in table.columns],
+                "counts": table.to_numpy().tolist(),
+            }
+            if not plots:
+                continue
+            path = plot_path(name, survey_type, plot_dir)
+            manifest["plots"]["{}_{}".format(name, survey_type)] = {
+                "path": path,
+                "sha256": file_digest(path),
+            }
+    filename = manifest_file(plot_dir)
+    os.makedirs(plot_dir, exist_ok=True)
+    with open(filename + ".tmp", "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2, ensure_ascii=False)
+    os.replace(filename + ".tmp", filename)
+    return manifest
+
+
+def is_stale(manifest):
+    """
+    is_stale tells if the survey export, the plotting code or any of the plots have
+    changed since the manifest was written
+    """
+    source = manifest["source"]
+    if not os.path.isfile(source["path"]):
+        return True
+    if source_digest(source["path"]) != source["sha256"]:
+        return True
+    if manifest["code_version"] != code_version():
+        return True
+    for plot in manifest["plots"].values():
+        if (
+            not os.path.isfile(plot["path"])
+            or file_digest(plot["path"]) != plot["sha256"]
+        ):
+            return True
+    return False
+
+
+def load_manifest(need_plots=True, plot_dir=PLOT_DIR):
+    """
+    load_manifest returns the manifest, or None if it is missing or stale. With
+    need_plots, a manifest written without the plots counts as missing
+    """
+    filename = manifest_file(plot_dir)
+    if not os.path.isfile(filename):
+        return None
+    with open(filename, encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    if is_stale(manifest):
+        return None
+    if need_plots and not manifest["plots"]:
+        return None
+    return manifest
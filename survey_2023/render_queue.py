@@ -0,0 +1,172 @@
+"""Batched rendering of the plotly figures of a run
+
+Instead of every plotting function calling fig.write_image on its own, the
+figures are added to a RenderQueue and all rendered in one go when the queue is
+flushed. Every figure is rendered with plotly's public pio.to_image (kaleido
+keeps its own renderer alive between figures), and with more than one worker
+the figures are spread over a small process pool. The render time of every
+figure is reported when the queue is flushed.
+
+With a RenderCache, a figure is only rendered when its fingerprint (its data,
+its layout and the plotly version) differs from the one recorded for the file
+it goes to, so charts whose counts did not change are not rendered again.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from survey_cache import file_digest
+from survey_trace import stage
+
+
+def _render(job):
+    import plotly.io as pio
+
+    path, fig_dict, image_format = job
+    start = time.perf_counter()
+    with stage("render:" + path):
+        # the figure was validated when it was made, it is only rendered here
+        image = pio.to_image(fig_dict, format=image_format, validate=False)
+    return path, image, time.perf_counter() - start
+
+
+def fingerprint(fig_dict):
+    """
+    fingerprint returns a digest of everything that goes into a rendered figure:
+    the data, the layout (colours, size, tick order, dtick) and the plotly version
+    """
+    import plotly
+    from plotly.utils import PlotlyJSONEncoder
+
+    spec = json.dumps(fig_dict, cls=PlotlyJSONEncoder, sort_keys=True)
+    return hashlib.sha256(
+        "{}\n{}".format(plotly.__version__, spec).encode("utf-8")
+    ).hexdigest()
+
+
+class RenderCache(object):
+    # Records the fingerprint of the figure behind every rendered file (bounded, the least recently used
+    # entries are evicted). The files belong to the run that made them, the cache only forgets them
+    def __init__(self, filename, max_entries=64):
+        self.filename = filename
+        self.max_entries = max_entries
+        self._clock = 0
+        self._entries = {}
+        if os.path.isfile(filename):
+            with open(filename, encoding="utf-8") as fh:
+                stored = json.load(fh)
+            self._clock = stored["clock"]
+            self._entries = stored["entries"]
+
+    # Tells if the file at path was rendered from a figure with this fingerprint and is untouched since
+    def is_current(self, path, fig_fingerprint):
+        entry = self._entries.get(path)
+        if entry is None or entry["fingerprint"] != fig_fingerprint:
+            return False
+        if not os.path.isfile(path) or file_digest(path) != entry["sha256"]:
+            return False
+        self._touch(path)
+        return True
+
+    # Record that the file at path was rendered from a figure with this fingerprint
+    def record(self, path, fig_fingerprint):
+        self._entries[path] = {
+            "fingerprint": fig_fingerprint,
+            "sha256": file_digest(path),
+        }
+        self._touch(path)
+
+    def _touch(self, path):
+        self._clock += 1
+        self._entries[path]["last_used"] = self._clock
+
+    # Evict the least recently used entries above max_entries and save the cache. The files of
+    # evicted entries are kept (the manifest and the pdfs can still use them), an evicted file
+    # is only rendered again the next time its figure is queued
+    def save(self):
+        by_age = sorted(self._entries, key=lambda p: self._entries[p]["last_used"])
+        for path in by_age[: max(0, len(by_age) - self.max_entries)]:
+            del self._entries[path]
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.filename + ".tmp", "w", encoding="utf-8") as fh:
+            json.dump({"clock": self._clock, "entries": self._entries}, fh, indent=1)
+        os.replace(self.filename + ".tmp", self.filename)
+
+
+class RenderQueue(object):
+    # Collects the figures of a run and renders them all in one batch
+    def __init__(self, workers=1, cache=None):
+        self.workers = workers
+        self.cache = cache
+        self._jobs = []
+
+    def __len__(self):
+        return len(self._jobs)
+
+    # Queue a figure to be saved at path, the format is taken from the file extension
+    def add(self, fig, path):
+        image_format = os.path.splitext(path)[1].lstrip(".").lower()
+        self._jobs.append((path, fig.to_dict(), image_format))
+
+    # Render all queued figures, write them to disk and report the render times.
+    # With a cache, figures whose file is already up to date are skipped
+    def flush(self):
+        jobs, self._jobs = self._jobs, []
+        start = time.perf_counter()
+        fingerprints = {}
+        unchanged = []
+        if self.cache is not None:
+            for path, fig_dict, _ in jobs:
+                fingerprints[path] = fingerprint(fig_dict)
+            unchanged = [
+                job[0]
+                for job in jobs
+                if self.cache.is_current(job[0], fingerprints[job[0]])
+            ]
+            jobs = [job for job in jobs if job[0] not in unchanged]
+        if self.workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs))) as pool:
+                results = list(pool.map(_render, jobs))
+        else:
+            results = [_render(job) for job in jobs]
+        timings = []
+        for path, image, seconds in results:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, "wb") as fh:
+                fh.write(image)
+            timings.append((path, seconds))
+            if self.cache is not None:
+                self.cache.record(path, fingerprints[path])
+        if self.cache is not None:
+            self.cache.save()
+        report_timings(timings, time.perf_counter() - start, unchanged)
+        return timings
+
+
+def report_timings(timings, wall_time, unchanged=()):
+    """
+    report_timings prints how long every figure took to render, and which were unchanged
+    """
+    if not timings and not unchanged:
+        return
+    width = max(len(path) for path in [p for p, _ in timings] + list(unchanged))
+    for path, seconds in timings:
+        print("{}  {:7.3f} s".format(path.ljust(width), seconds))
+    for path in unchanged:
+        print("{}  unchanged".format(path.ljust(width)))
+    print(
+        "Rendered {} figures in {:.3f} s ({:.3f} s of render time), {} unchanged".format(
+            len(timings),
+            wall_time,
+            sum(seconds for _, seconds in timings),
+            len(unchanged),
+        )
+    )
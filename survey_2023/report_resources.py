@@ -0,0 +1,55 @@
+"""Fonts and images shared by all the pdfs made in a process
+
+The Arial fonts are parsed and registered once per process, and the SciLifeLab
+logo is decoded once and handed out as one shared Image flowable, instead of
+being read again for every document. The handles are shared between documents,
+so they must not be changed by the code using them. warm_up() loads everything
+up front and is meant to be used as the initializer of pool workers.
+"""
+
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import Image
+
+# Arial fonts, registered under these names
+FONTS = {
+    "Arial": "Arial.ttf",
+    "Arial-B": "Arial Bold.ttf",
+    "Arial-I": "Arial Italic.ttf",
+    "Arial-N": "Arial Narrow.ttf",
+}
+
+LOGO_FILE = "SciLifeLab_logo.png"
+
+_logo = None
+
+
+def register_fonts():
+    """
+    register_fonts registers the Arial fonts, unless they are already registered in this process
+    """
+    registered = pdfmetrics.getRegisteredFontNames()
+    for name, filename in FONTS.items():
+        if name not in registered:
+            pdfmetrics.registerFont(TTFont(name, filename))
+
+
+def logo():
+    """
+    logo returns the shared SciLifeLab logo flowable (22 x 5 mm), decoded on first use
+    """
+    global _logo
+    if _logo is None:
+        _logo = Image(LOGO_FILE, width=22 * mm, height=5 * mm, lazy=0)
+        # decode the png now, so no document has to do it
+        _logo._img.getRGBData()
+    return _logo
+
+
+def warm_up():
+    """
+    warm_up loads all shared resources of the process
+    """
+    register_fonts()
+    logo()
@@ -0,0 +1,95 @@
+"""Native reportlab bar charts for the summary pdfs
+
+The summary pdfs normally show the plotly figures, rendered to svg by kaleido
+and parsed back into reportlab drawings with svglib. With the "native"
+backend the same horizontal bar charts are drawn directly as reportlab
+Drawings from the tallies in the stats manifest, so the pdf stage needs
+neither kaleido nor the svg parser. Make_plots.py records the chart spec of
+every plot (category order, tick labels, axis range and dtick, bar colour) in
+the manifest, so both backends show the same categories, ticks and colours.
+"""
+
+import re
+
+from reportlab.graphics.charts.barcharts import HorizontalBarChart
+from reportlab.graphics.shapes import Drawing
+from reportlab.lib import colors
+from reportlab.lib.units import mm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+# Size of the charts on the summary pages
+CHART_WIDTH = 80 * mm
+CHART_HEIGHT = 60 * mm
+
+# Roughly the size of plotly's 23 px labels once a 1100 px wide figure is scaled to CHART_WIDTH
+FONT_SIZE = 5
+
+_TAGS = re.compile(r"<[^>]+>")
+
+
+def chart_spec(fig):
+    """
+    chart_spec returns what the native backend needs to know about a plotly bar
+    figure made by Make_plots.py: the categories from bottom to top, their tick
+    labels, the x axis range and dtick, and the bar colour
+    """
+    layout = fig.layout
+    return {
+        "categories": list(layout.yaxis.categoryarray),
+        "ticktext": dict(zip(layout.yaxis.tickvals, layout.yaxis.ticktext)),
+        "range": [int(v) for v in layout.xaxis.range],
+        "dtick": int(layout.xaxis.dtick),
+        "colour": fig.data[0].marker.color,
+    }
+
+
+def bar_chart(spec, counts, width=CHART_WIDTH, height=CHART_HEIGHT):
+    """
+    bar_chart draws the horizontal bar chart of one question as a reportlab Drawing.
+    spec comes from chart_spec, counts maps every option to its count
+    """
+    labels = [_TAGS.sub("", spec["ticktext"].get(c, c)) for c in spec["categories"]]
+    values = [counts.get(c, 0) for c in spec["categories"]]
+
+    label_width = max(stringWidth(l, "Arial-B", FONT_SIZE) for l in labels)
+
+    chart = HorizontalBarChart()
+    chart.x = label_width + 3
+    chart.y = FONT_SIZE + 4
+    chart.width = width - chart.x - 3
+    chart.height = height - chart.y - 2
+    chart.data = [values]
+    chart.bars[0].fillColor = colors.HexColor(spec["colour"])
+    chart.bars[0].strokeColor = colors.black
+    chart.bars[0].strokeWidth = 0.2
+    # plotly leaves a fifth of every category free between the bars
+    chart.barWidth = 4
+    chart.groupSpacing = 1
+
+    chart.categoryAxis.categoryNames = labels
+    chart.categoryAxis.labels.fontName = "Arial-B"
+    chart.categoryAxis.labels.fontSize = FONT_SIZE
+    chart.categoryAxis.labels.boxAnchor = "e"
+    chart.categoryAxis.labels.dx = -2
+    chart.categoryAxis.strokeColor = colors.black
+    chart.categoryAxis.strokeWidth = 0.3
+    chart.categoryAxis.tickLeft = 0
+    chart.categoryAxis.visibleGrid = True
+    chart.categoryAxis.gridStrokeColor = colors.HexColor("#EBF0F8")
+    chart.categoryAxis.gridStrokeWidth = 0.2
+
+    chart.valueAxis.valueMin = spec["range"][0]
+    # an empty chart still needs an axis
+    chart.valueAxis.valueMax = max(spec["range"][1], spec["range"][0] + 1)
+    chart.valueAxis.valueStep = spec["dtick"]
+    chart.valueAxis.labels.fontName = "Arial"
+    chart.valueAxis.labels.fontSize = FONT_SIZE
+    chart.valueAxis.strokeColor = colors.black
+    chart.valueAxis.strokeWidth = 0.3
+    chart.valueAxis.visibleGrid = True
+    chart.valueAxis.gridStrokeColor = colors.black
+    chart.valueAxis.gridStrokeWidth = 0.2
+
+    drawing = Drawing(width, height)
+    drawing.add(chart)
+    return drawing
@@ -0,0 +1,401 @@
+"""Full-text search over the proposals
+
+Answers questions such as "which proposals mention cryo-EM / single-cell /
+mass spec" without opening the export or the pdfs. An inverted index is built
+once per export over the title, description, funding and comment of every
+proposal (the columns of SURVEY_COLUMNS in survey_responses.py), with the
+position of every word, so both keywords and phrases can be looked up. Hits are mapped to the
+registration number and the report numbers (one per platform) of the proposal.
+
+The index is stored in Search/index.json.gz, with the hash of the export and
+of the code it was made from, and is only built again when one of those
+changed. The postings are stored as gaps between document ids and positions,
+which keeps the file small. `export_shards` writes the index as a set of
+static json files (the documents, and the postings split by the first
+character of the words) that a browser search page can load on demand.
+
+    python search_index.py cryo-EM
+    python search_index.py '"mass spec*"' proteomics --field description
+    python search_index.py --export-web Search/web
+"""
+
+import argparse
+import bisect
+import gzip
+import json
+import os
+import re
+
+from survey_cache import file_digest, source_digest
+from survey_responses import SURVEY_COLUMNS, plan_reports, read_responses
+
+SEARCH_DIR = "Search"
+INDEX_FILE = os.path.join(SEARCH_DIR, "index.json.gz")
+
+# The indexed fields, as keys of SURVEY_COLUMNS in survey_responses.py
+FIELDS = ["title", "description", "funding", "comment"]
+
+# Matches of a field count this many times more when ranking the hits
+FIELD_WEIGHTS = {"title": 3, "description": 1, "funding": 1, "comment": 1}
+
+# Words are runs of letters and digits; "cryo-EM" is the phrase "cryo em".
+# TOKEN_PATTERN_JS is the same pattern for the browser
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+TOKEN_PATTERN_JS = "[\\p{L}\\p{N}]+"
+
+# The code the index is made with, a change to any of these makes it stale
+INDEX_CODE_FILES = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    for name in ["search_index.py", "survey_responses.py", "survey_cache.py"]
+]
+
+
+def tokenize(text):
+    """
+    tokenize returns the lower case words of text
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def index_version():
+    """
+    index_version returns a digest of the code the index is made with
+    """
+    return "".join(file_digest(f)[:16] for f in INDEX_CODE_FILES)
+
+
+def build_index(survey_file, sheet_name=None, header=1, output_dir="Pdfs"):
+    """
+    build_index reads the export and returns the index: the documents (one per proposal,
+    in registration order, with the reg number, title and report numbers and pdfs) and
+    the encoded postings of every word (see _encode). output_dir is the folder of the
+    pdfs, as for single_survey_page.py
+    """
+    process_order, ntotal = read_responses(survey_file, sheet_name, header)
+    reports = {}
+    for plan in plan_reports(process_order, ntotal, output_dir):
+        reports.setdefault(plan.reg_no, []).append(plan)
+    responses = sorted(
+        {plan[0].response for plan in reports.values()},
+        key=lambda r: (r.sid, int(r.reg_no[1:])),
+    )
+
+    docs = []
+    postings = {}
+    for doc, response in enumerate(responses):
+        plans = reports[response.reg_no]
+        docs.append(
+            {
+                "reg_no": response.reg_no,
+                "title": response.title,
+                "reports": [plan.rpid for plan in plans],
+                "pdfs": [plan.filename for plan in plans],
+            }
+        )
+        columns = SURVEY_COLUMNS[response.sid]
+        for field_id, field in enumerate(FIELDS):
+            text = response.row[columns[field]]
+            # empty cells are read as 'None'
+            if text == "None":
+                continue
+            for position, word in enumerate(tokenize(text)):
+                fields = postings.setdefault(word, {}).setdefault(doc, {})
+                fields.setdefault(field_id, []).append(position)
+    return {
+        "source": dict(
+            path=survey_file,
+            sheet_name=sheet_name,
+            header=header,
+            output_dir=output_dir,
+            sha256=source_digest(survey_file),
+        ),
+        "version": index_version(),
+        "fields": FIELDS,
+        "docs": docs,
+        "postings": _encode(postings),
+    }
+
+
+def _gaps(numbers):
+    return [b - a for a, b in zip([0] + numbers[:-1], numbers)]
+
+
+def _undo_gaps(gaps):
+    numbers, total = [], 0
+    for gap in gaps:
+        total += gap
+        numbers.append(total)
+    return numbers
+
+
+def _encode(postings):
+    # word -> flat list of (document gap, field, number of positions, position gaps...)
+    encoded = {}
+    for word, docs in postings.items():
+        flat, last = [], 0
+        for doc in sorted(docs):
+            for field, positions in sorted(docs[doc].items()):
+                flat += [doc - last, field, len(positions)] + _gaps(positions)
+                last = doc
+        encoded[word] = flat
+    return encoded
+
+
+def _decode(flat):
+    # document -> field -> positions
+    docs, doc, i = {}, 0, 0
+    while i < len(flat):
+        doc += flat[i]
+        field, count = flat[i + 1], flat[i + 2]
+        docs.setdefault(doc, {})[field] = _undo_gaps(flat[i + 3 : i + 3 + count])
+        i += 3 + count
+    return docs
+
+
+def _postings(index, word):
+    # The postings of a word (document -> field -> positions), decoded on first use
+    decoded = index.setdefault("decoded", {})
+    if word not in decoded:
+        decoded[word] = _decode(index["postings"].get(word, []))
+    return decoded[word]
+
+
+def _words(index, word):
+    # The indexed words a query word stands for, "spec*" stands for every word starting with spec
+    if not word.endswith("*"):
+        return [word]
+    if "words" not in index:
+        index["words"] = sorted(index["postings"])
+    words, prefix = index["words"], word[:-1]
+    start = bisect.bisect_left(words, prefix)
+    end = bisect.bisect_left(words, prefix + "\U0010ffff")
+    return words[start:end]
+
+
+def _merged_postings(index, word):
+    # The postings of all the words a query word stands for, taken together
+    postings = [_postings(index, w) for w in _words(index, word)]
+    if len(postings) == 1:
+        return postings[0]
+    merged = {}
+    for docs in postings:
+        for doc, fields in docs.items():
+            for field, positions in fields.items():
+                merged.setdefault(doc, {}).setdefault(field, []).extend(positions)
+    return merged
+
+
+def save_index(index, filename=INDEX_FILE):
+    """
+    save_index stores the index compactly (gap encoded postings, gzipped json). The postings
+    stay encoded when the index is loaded, every word is only decoded when it is looked up
+    """
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    stored = {k: v for k, v in index.items() if k not in ("decoded", "words")}
+    with gzip.open(filename + ".tmp", "wt", encoding="utf-8") as fh:
+        json.dump(stored, fh, ensure_ascii=False, separators=(",", ":"))
+    os.replace(filename + ".tmp", filename)
+    return filename
+
+
+def load_index(filename=INDEX_FILE):
+    """
+    load_index returns the stored index, or None when there is none
+    """
+    if not os.path.isfile(filename):
+        return None
+    with gzip.open(filename, "rt", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def survey_index(
+    survey_file="Survey.xlsx",
+    sheet_name=None,
+    header=1,
+    filename=INDEX_FILE,
+    output_dir="Pdfs",
+):
+    """
+    survey_index returns the index of the export, built (and stored) only when the stored
+    index is missing or was made from another export, pdf folder or other code
+    """
+    index = load_index(filename)
+    if (
+        index is None
+        or index["version"] != index_version()
+        or index["source"]["sha256"] != source_digest(survey_file)
+        or index["source"]["sheet_name"] != sheet_name
+        or index["source"]["header"] != header
+        or index["source"]["output_dir"] != output_dir
+    ):
+        index = build_index(survey_file, sheet_name, header, output_dir)
+        save_index(index, filename)
+    return index
+
+
+def parse_query(text):
+    """
+    parse_query splits a query into its terms, every term a list of words. Quoted parts
+    are phrases, so are words such as cryo-EM that tokenize into more than one word.
+    A term ending in * matches every word starting with it (spec* matches spectrometry)
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', text):
+        part = phrase or word
+        words = tokenize(part)
+        if words and part.endswith("*"):
+            words[-1] += "*"
+        if words:
+            terms.append(words)
+    return terms
+
+
+def query_text(arguments):
+    """
+    query_text joins the query arguments of the command line into one query. An argument
+    with spaces (quoted in the shell) is a phrase, unless it has quotes of its own
+    """
+    return " ".join(
+        '"{}"'.format(argument) if " " in argument and '"' not in argument else argument
+        for argument in arguments
+    )
+
+
+def _term_hits(index, words, fields):
+    # document -> field -> number of matches of the words as a phrase
+    first = _merged_postings(index, words[0])
+    rest = [_merged_postings(index, word) for word in words[1:]]
+    hits = {}
+    for doc, doc_fields in first.items():
+        for field, positions in doc_fields.items():
+            if fields is not None and field not in fields:
+                continue
+            following = [set(p.get(doc, {}).get(field, ())) for p in rest]
+            count = sum(
+                all(start + n + 1 in after for n, after in enumerate(following))
+                for start in positions
+            )
+            if count:
+                hits.setdefault(doc, {})[field] = count
+    return hits
+
+
+def search(index, text, fields=None):
+    """
+    search returns the proposals that match every term of the query (see parse_query),
+    in the given fields (names, all by default). Every result is the document (reg number,
+    title, report numbers, pdfs) with its score and the fields that matched, best first
+    """
+    field_ids = None
+    if fields:
+        field_ids = {index["fields"].index(field) for field in fields}
+    matched = None
+    scores = {}
+    for words in parse_query(text):
+        hits = _term_hits(index, words, field_ids)
+        matched = set(hits) if matched is None else matched & set(hits)
+        for doc, counts in hits.items():
+            for field, count in counts.items():
+                name = index["fields"][field]
+                score = scores.setdefault(doc, [0, set()])
+                score[0] += count * FIELD_WEIGHTS[name]
+                score[1].add(name)
+    results = []
+    for doc in sorted(matched or (), key=lambda d: (-scores[d][0], d)):
+        result = dict(index["docs"][doc])
+        result["score"] = scores[doc][0]
+        result["fields"] = [f for f in index["fields"] if f in scores[doc][1]]
+        results.append(result)
+    return results
+
+
+def _shard(word):
+    return word[0] if word[0].isascii() and word[0].isalnum() else "_"
+
+
+def export_shards(index, directory=os.path.join(SEARCH_DIR, "web")):
+    """
+    export_shards writes the index as static json for a browser search page: manifest.json
+    (fields, weights, word pattern and the shards), docs.json and one postings shard per
+    first character of the words (word -> [[document, field, [positions]], ...])
+    """
+    os.makedirs(directory, exist_ok=True)
+    shards = {}
+    for word in index["postings"]:
+        docs = _postings(index, word)
+        shards.setdefault(_shard(word), {})[word] = [
+            [doc, field, positions]
+            for doc, fields in sorted(docs.items())
+            for field, positions in sorted(fields.items())
+        ]
+    for entry in os.listdir(directory):
+        if entry.startswith("postings_") and entry.endswith(".json"):
+            os.remove(os.path.join(directory, entry))
+    files = {}
+    for name, words in sorted(shards.items()):
+        files[name] = "postings_{}.json".format(name)
+        with open(os.path.join(directory, files[name]), "w", encoding="utf-8") as fh:
+            json.dump(words, fh, ensure_ascii=False, separators=(",", ":"))
+    with open(os.path.join(directory, "docs.json"), "w", encoding="utf-8") as fh:
+        json.dump(index["docs"], fh, ensure_ascii=False, separators=(",", ":"))
+    manifest = {
+        "source": index["source"],
+        "fields": index["fields"],
+        "weights": FIELD_WEIGHTS,
+        "token_pattern": TOKEN_PATTERN_JS,
+        "shards": files,
+        "other_shard": "_",
+    }
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, ensure_ascii=False, indent=1)
+    return directory
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Search the titles, descriptions, funding and comments of the proposals"
+    )
+    parser.add_argument(
+        "query", nargs="*", help='words and "quoted phrases", all have to match'
+    )
+    parser.add_argument(
+        "--field", action="append", choices=FIELDS, help="only search these fields"
+    )
+    parser.add_argument(
+        "-i", "--input", default="Survey.xlsx", help="the survey export"
+    )
+    parser.add_argument("--sheet", help="sheet of the export (default the active one)")
+    parser.add_argument(
+        "--header", type=int, default=1, help="row of the column names (default 1)"
+    )
+    parser.add_argument(
+        "--output-dir",
+        default="Pdfs",
+        help="folder of the proposal pdfs (default Pdfs)",
+    )
+    parser.add_argument(
+        "--export-web", metavar="DIR", help="also write the json shards for a browser"
+    )
+    args = parser.parse_args()
+    index = survey_index(
+        args.input, args.sheet, args.header, output_dir=args.output_dir
+    )
+    if args.export_web:
+        print(
+            "Search shards written to {}".format(export_shards(index, args.export_web))
+        )
+    if args.query:
+        results = search(index, query_text(args.query), args.field)
+        for result in results:
+            print(
+                "{}\treports {}\t{}\t({}, score {})".format(
+                    result["reg_no"],
+                    ", ".join(result["reports"]),
+                    result["title"],
+                    ", ".join(result["fields"]),
+                    result["score"],
+                )
+            )
+        print("{} proposal(s)".format(len(results)))
@@ -1,26 +1,33 @@
 # Parse survey excel and create pdf for each response
 
+import argparse
+import hashlib
+import io
+import json
 import os
+import queue
+import threading
 
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
 from pathlib import Path
 
-from openpyxl import load_workbook, Workbook
-from openpyxl.utils.escape import escape, unescape
-
-from reportlab.platypus import BaseDocTemplate, Frame, Image, PageTemplate, Paragraph
+from reportlab.platypus import BaseDocTemplate, Frame, NextPageTemplate, PageBreak, PageTemplate, Paragraph
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
 from reportlab.lib.enums import TA_RIGHT
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 
-# Arial fonts
-pdfmetrics.registerFont(TTFont('Arial', 'Arial.ttf'))
-pdfmetrics.registerFont(TTFont('Arial-B', 'Arial Bold.ttf'))
-pdfmetrics.registerFont(TTFont('Arial-I', 'Arial Italic.ttf'))
-pdfmetrics.registerFont(TTFont('Arial-N', 'Arial Narrow.ttf'))
+from build_manifest import BuildManifest
+from catalogue import INDEX_FILE, catalogue_records, indexed, load_index, write_catalogue, write_index
+from report_resources import logo, register_fonts, warm_up
+from survey_cache import file_digest
+from survey_responses import platform_outside_scilifelab, plan_reports, read_responses, unique_responses
+from survey_trace import stage, traced
+
+# Arial fonts (registered once per process)
+register_fonts()
 
 # Add required styles for the texts
 styles = getSampleStyleSheet()
@@ -150,22 +157,23 @@ styles.add(
     )
 )
 
+# Page size and margins of the reports (also used for the proposal books)
+page_layout = dict(pagesize=A4, rightMargin=14 * mm, leftMargin=14 * mm, topMargin=12 * mm, bottomMargin=12 * mm, showBoundary=0)
+
 class report_gen(object):
     # A class object that defines the layout of pdf
-    def __init__(self, filename):
+    # With output (a file object, e.g. BytesIO) the pdf is written there instead of to filename
+    def __init__(self, filename, output=None):
         self.filename = filename
-        self.doc = BaseDocTemplate(
-                    self.filename,
-                    pagesize=A4,
-                    rightMargin=14 * mm,
-                    leftMargin=14 * mm,
-                    topMargin=12 * mm,
-                    bottomMargin=12 * mm,
-                    showBoundary=0,
-                   )
+        self.output = output
+        self.doc = BaseDocTemplate(output or self.filename, **page_layout)
         self.__header_content = []
         self.__footer_content = []
         self.__content = []
+        # Pages drawn so far, and the page number (in the document) of the first one
+        self.pages = 0
+        self.first_page = None
+        self.on_first_page = None
     
     # Add the text to header section
     def add_to_header(self, text, style):
@@ -182,15 +190,21 @@ class report_gen(object):
     # Function will make the page layout and generate pdf
     def make_pdf(self):
         # make page layouts
-        self.__make_page_layout()
+        self.doc.addPageTemplates([self.page_template()])
         # create the directories
-        Path(os.path.split(self.filename)[0]).mkdir(parents=True, exist_ok=True)
+        if self.output is None:
+            Path(os.path.split(self.filename)[0]).mkdir(parents=True, exist_ok=True)
         # make the pdf
-        self.doc.build(self.__content)
+        with stage("build:" + self.filename):
+            self.doc.build(self.__content)
+
+    # The flowables of the main section, for when the report is built as part of a bigger document
+    def get_content(self):
+        return self.__content
     
     # This funtion creates the page layout by creating main body frame
     # and exisiting header function (which defines header layout)
-    def __make_page_layout(self):
+    def page_template(self, template_id="all_frames"):
         header_height = self.__get_header_height()
         col1 = Frame(
             id="col1",
@@ -217,16 +231,13 @@ class report_gen(object):
             #showBoundary=0.5
         )
         # Add the above created frames to a template
-        template = PageTemplate(id="all_frames", frames=[col1, col2], onPage=self.__call_header_and_footer)
-        # Add the above temple to the base doc
-        self.doc.addPageTemplates([template])
+        return PageTemplate(id=template_id, frames=[col1, col2], onPage=self.__call_header_and_footer)
         
     # Function that controls layout of header
     def __header(self, canvas, doc, content):
         canvas.saveState()
-        page_num = canvas.getPageNumber()
         # Write title of the document, add a tag for multi page
-        if page_num == 2:
+        if self.pages == 2:
             content[0].frags[0].text = content[0].frags[0].text + " (cont.)"
         w0, h0 = content[0].wrap(doc.width * 0.7, doc.topMargin)
         content[0].drawOn(canvas, doc.leftMargin, doc.height + doc.topMargin - h0)
@@ -274,8 +285,13 @@ class report_gen(object):
         canvas.drawPath(p, stroke=1)
         canvas.restoreState()
     
-    # Wrapper function to call both header and footer
+    # Wrapper function to call both header and footer (and on_first_page, e.g. for bookmarks)
     def __call_header_and_footer(self, canvas, doc):
+        self.pages += 1
+        if self.pages == 1:
+            self.first_page = canvas.getPageNumber()
+            if self.on_first_page:
+                self.on_first_page(canvas)
         self.__header(canvas, doc, self.__header_content)
         self.__footer(canvas, doc, self.__footer_content)
     
@@ -287,10 +303,6 @@ class report_gen(object):
         w2, h2 = self.__header_content[2].wrap(self.doc.width * 0.7, self.doc.topMargin + h1)
         return h2 + h1 + 8*mm
 
-# Helper method for aesthetic
-def platform_outside_scilifelab(platform):
-    return platform in ["None of the existing platforms", "None of the current platforms", "I do not know", "No platform suggested"]
-
 def get_platform_header_text(platform, plt_text):
     # If its not an exisitng platform, put in special criteria
     if platform_outside_scilifelab(platform):
@@ -321,8 +333,6 @@ suggestions_info = {
         "style": "technology",
         "style_plt": "technology-plt",
         "style_non_plt": "technology-non-plt",
-        "title_index": 10,
-        "platform_index": 12,
         "reg_num": 0
     },
     "B": {
@@ -332,161 +342,364 @@ suggestions_info = {
         "style": "facility",
         "style_plt": "facility-plt",
         "style_non_plt": "facility-non-plt",
-        "title_index": 18,
-        "platform_index": 26,
         "reg_num": 0
     }
 }
 
-platforms_order = ["Bioinformatics", "Genomics", "Clinical Genomics", "Clinical Proteomics and Immunology",
-                   "Metabolomics", "Spatial Biology", "Cellular and Molecular Imaging", "Integrated Structural Biology",
-                   "Chemical Biology and Genome Engineering", "Drug Discovery and Development", "No platform suggested"]
-
-# Read the survey file
-wb = load_workbook('Survey.xlsx')
-ws = wb.active
-rpn = 0
-ntotal = 0
-
-# excel file for metadata
-owb = Workbook()
-ows = owb.active
-for c, h in enumerate(["Report Num.", "Reg Num.", "Title", "Platform", "Category"], 1):
-    cell = ows.cell(row=1, column=c)
-    cell.value = h
-
-# Read and sort the data to process in right order
-process_order = {}
-reg_num = {"A": 1, "B": 1}
-for n, srow in enumerate(ws.iter_rows(min_row=3), 3):
-    row = [unescape(str(cell.value) or "") for cell in srow]
-    sid = row[9][0].upper()
-    platforms = [p.strip() for p in row[suggestions_info[sid]["platform_index"]].split(", ")]
-    platforms_uniq = list(set(["No platform suggested" if platform_outside_scilifelab(p) else p for p in platforms]))
-    for p in platforms_uniq:
-        if p not in process_order:
-            process_order[p] = {"A": [], "B": []}
-        s_title = row[suggestions_info[sid]["title_index"]].strip()
-        process_order[p][sid].append({
-            "title": s_title[0].upper() + s_title[1:],
-            "reg_no": sid + str(reg_num[sid]),
-            "row_index": n,
-            "multi_platform": len(platforms_uniq) > 1
-        })
-        ntotal += 1
-    reg_num[sid] += 1
-
-for plt_i, p in enumerate(platforms_order, 1):
-    if p not in process_order:
-        continue
-    for i in ["A", "B"]:
-        for s in sorted(process_order[p][i], key=lambda d: d['title'].lower()):
-            row = [unescape(str(cell.value) or "") for cell in ws[s["row_index"]]]
-            rpn += 1
-            rpid = str(rpn).zfill(len(str(ntotal)))
-            snm = suggestions_info[i]["style"]
-            snm_plt = suggestions_info[i]["style_plt"]
-            snm_non_plt = suggestions_info[i]["style_non_plt"]
-            platforms = [p.strip() for p in row[suggestions_info[i]["platform_index"]].split(", ")]
-            # Filename and path
-            pdf_name = "{}_{}_{}.pdf".format(rpid, s["title"].replace(" ", "_"), s["reg_no"])
-            fname = os.path.join("Pdfs", "{}_{}".format(str(plt_i), p), pdf_name)
-            # Instantiate report gen object
-            rp = report_gen(fname)
-            # Affiliation text
-            if row[4] == "University":
-                aff_text = row[6]
-            elif row[7] == "None":
-                aff_text = row[4]
-            else:
-                aff_text = "{}, {}".format(row[4], row[7])
-            # Add content to header section
-            rp.add_to_header("{}: {}".format(rpid, s["title"]), styles["ntitle"])
-            rp.add_to_header("{} {}, {}, {}".format(row[0], row[1], row[2], aff_text), styles["name"])
-            rp.add_to_header(row[3], styles["email"])
-            rp.add_to_header(get_platform_header_text(p, suggestions_info[i]["plt_text"]), styles[snm_plt])
-            # Add disclaimer if proposal belongs to two platform
-            if s["multi_platform"]:
-                rp.add_to_header(
-                        "**Please note that this proposal is<br/>also found under other platforms",
-                        styles["multi-plt"]
-                    )
-            # Add content to Footer
-            rp.add_to_footer("{} - Report No: {}, Reg No: {}".format(suggestions_info[i]["footer_text"], rpid, s["reg_no"]), styles["footer"])
-            rp.add_to_footer(Image("SciLifeLab_logo.png", width=22*mm, height=5*mm))
-            # Add content to main body
-            # Representing text
-            if row[5] == "Other":
-                rep_text = row[8]
-            elif row[8] == "None":
-                rep_text = row[5]
-            else:
-                rep_text = "{} ({})".format(row[5], row[8])
-            rp.add_to_content("Representing:", styles[snm])
-            rp.add_to_content(rep_text, styles["normal"])
-            # Platforms text
-            rp.add_to_content("The {} would fit in the SciLifeLab Platform(s):".format(suggestions_info[i]["alt_text"]), styles[snm])
-            rp.add_to_content("<br/>".join(platforms), styles["normal"])
-            # Info relavant for technology/service proposal
-            if i == "A":
-                # Contribution to scilifelab or ddls
-                rp.add_to_content("The suggested technology would contribute to following capabilities:", styles[snm])
-                rp.add_to_content(row[13].replace(", ", "<br/>"), styles["normal"])
-                # Currently available
-                if row[14] == "No" or row[15] == "None":
-                    avail_text = row[14]
-                else:
-                    avail_text = "{}, {}".format(row[14], row[15])
-                rp.add_to_content("Is the technology currently available as local infrastructure service in Sweden?", styles[snm])
-                rp.add_to_content(avail_text, styles["normal"])
-                # Brief description
-                rp.add_to_content("Brief description of the technology:", styles[snm])
-                rp.add_to_content(row[11].replace("\n", "<br/>"), styles["normal"])
-                # Estimated funding
-                rp.add_to_content("Estimated annual total funding (MSEK) needed from SciLifeLab:", styles[snm])
-                rp.add_to_content(row[16].replace("\n", "<br/>"), styles["normal"])
-                # Additional comment
-                rp.add_to_content("Additional comment:", styles[snm])
-                rp.add_to_content(row[17].replace("\n", "<br/>"), styles["normal"])
-            # Info relavant for facility proposal
-            else:
-                # Facility location
-                rp.add_to_content("Facility location:", styles[snm])
-                rp.add_to_content(row[19], styles["normal"])
-                # Contact person name
-                rp.add_to_content("Contact person for the facility:", styles[snm])
-                rp.add_to_content(row[20], styles["normal"])
-                # Contact person email
-                rp.add_to_content("Contact person email address:", styles[snm])
-                rp.add_to_content(row[21], styles["normal"])
-                # Uniq users
-                rp.add_to_content("Current number of unique users annually:", styles[snm])
-                rp.add_to_content(row[25], styles["normal"])
-                # Contribution to scilifelab or ddls
-                rp.add_to_content("The suggested facility would contribute to following capabilities:", styles[snm])
-                rp.add_to_content(row[27].replace(", ", "<br/>"), styles["normal"])
-                # Uniq users estimate
-                rp.add_to_content("Estimated unique annual users if the unit become a part of SciLifeLab infrastructure:", styles[snm])
-                rp.add_to_content(row[28], styles["normal"])
-                # Brief description
-                rp.add_to_content("Brief description of the facility:", styles[snm])
-                rp.add_to_content(row[22].replace("\n", "<br/>"), styles["normal"])
-                # Services providing today
-                if row[23] == "I do not know" or row[24] == "None":
-                    provide_text = row[23]
-                else:
-                    provide_text = "{}, {}".format(row[23], row[24])
-                rp.add_to_content("How is the facility providing infrastructure services today?", styles[snm])
-                rp.add_to_content(provide_text, styles["normal"])
-                # Estimated funding
-                rp.add_to_content("Estimated annual funding (MSEK) needed from SciLifeLab, co-funding and user fee plans:", styles[snm])
-                rp.add_to_content(row[29].replace("\n", "<br/>"), styles["normal"])
-                # Additional comment
-                rp.add_to_content("Additional comment:", styles[snm])
-                rp.add_to_content(row[30].replace("\n", "<br/>"), styles["normal"])
-            rp.make_pdf()
-            # following is to generate meta data
-            for c, v in enumerate([rpid, s["reg_no"], s["title"], p, "Technology" if i == "A" else "Unit"], 1):
-                cell = ows.cell(row=rpn+1, column=c)
-                cell.value = v
-owb.save("Survey_meta.xlsx")
+# Everything a report is made from, as plain data: the header, footer and main content as
+# (text, style name) pairs. Specs are made from the plans ahead of the layout, and can be sent
+# to layout workers in other processes
+report_spec = namedtuple("report_spec", ["filename", "header", "footer", "content"])
+
+# Work out the header, footer and main content of one planned report (the producer stage)
+def make_spec(plan):
+    s, p, i, rpid = plan.response, plan.platform, plan.sid, plan.rpid
+    row = s.row
+    snm = suggestions_info[i]["style"]
+    snm_plt = suggestions_info[i]["style_plt"]
+    platforms = s.platforms
+    header, footer, content = [], [], []
+    # Affiliation text
+    if row[4] == "University":
+        aff_text = row[6]
+    elif row[7] == "None":
+        aff_text = row[4]
+    else:
+        aff_text = "{}, {}".format(row[4], row[7])
+    # Add content to header section
+    header.append(("{}: {}".format(rpid, s.title), "ntitle"))
+    header.append(("{} {}, {}, {}".format(row[0], row[1], row[2], aff_text), "name"))
+    header.append((row[3], "email"))
+    header.append((get_platform_header_text(p, suggestions_info[i]["plt_text"]), snm_plt))
+    # Add disclaimer if proposal belongs to two platform
+    if s.multi_platform:
+        header.append(("**Please note that this proposal is<br/>also found under other platforms", "multi-plt"))
+    # Add content to Footer
+    footer.append(("{} - Report No: {}, Reg No: {}".format(suggestions_info[i]["footer_text"], rpid, s.reg_no), "footer"))
+    # Add content to main body
+    # Representing text
+    if row[5] == "Other":
+        rep_text = row[8]
+    elif row[8] == "None":
+        rep_text = row[5]
+    else:
+        rep_text = "{} ({})".format(row[5], row[8])
+    content.append(("Representing:", snm))
+    content.append((rep_text, "normal"))
+    # Platforms text
+    content.append(("The {} would fit in the SciLifeLab Platform(s):".format(suggestions_info[i]["alt_text"]), snm))
+    content.append(("<br/>".join(platforms), "normal"))
+    # Info relavant for technology/service proposal
+    if i == "A":
+        # Contribution to scilifelab or ddls
+        content.append(("The suggested technology would contribute to following capabilities:", snm))
+        content.append((row[13].replace(", ", "<br/>"), "normal"))
+        # Currently available
+        if row[14] == "No" or row[15] == "None":
+            avail_text = row[14]
+        else:
+            avail_text = "{}, {}".format(row[14], row[15])
+        content.append(("Is the technology currently available as local infrastructure service in Sweden?", snm))
+        content.append((avail_text, "normal"))
+        # Brief description
+        content.append(("Brief description of the technology:", snm))
+        content.append((row[11].replace("\n", "<br/>"), "normal"))
+        # Estimated funding
+        content.append(("Estimated annual total funding (MSEK) needed from SciLifeLab:", snm))
+        content.append((row[16].replace("\n", "<br/>"), "normal"))
+        # Additional comment
+        content.append(("Additional comment:", snm))
+        content.append((row[17].replace("\n", "<br/>"), "normal"))
+    # Info relavant for facility proposal
+    else:
+        # Facility location
+        content.append(("Facility location:", snm))
+        content.append((row[19], "normal"))
+        # Contact person name
+        content.append(("Contact person for the facility:", snm))
+        content.append((row[20], "normal"))
+        # Contact person email
+        content.append(("Contact person email address:", snm))
+        content.append((row[21], "normal"))
+        # Uniq users
+        content.append(("Current number of unique users annually:", snm))
+        content.append((row[25], "normal"))
+        # Contribution to scilifelab or ddls
+        content.append(("The suggested facility would contribute to following capabilities:", snm))
+        content.append((row[27].replace(", ", "<br/>"), "normal"))
+        # Uniq users estimate
+        content.append(("Estimated unique annual users if the unit become a part of SciLifeLab infrastructure:", snm))
+        content.append((row[28], "normal"))
+        # Brief description
+        content.append(("Brief description of the facility:", snm))
+        content.append((row[22].replace("\n", "<br/>"), "normal"))
+        # Services providing today
+        if row[23] == "I do not know" or row[24] == "None":
+            provide_text = row[23]
+        else:
+            provide_text = "{}, {}".format(row[23], row[24])
+        content.append(("How is the facility providing infrastructure services today?", snm))
+        content.append((provide_text, "normal"))
+        # Estimated funding
+        content.append(("Estimated annual funding (MSEK) needed from SciLifeLab, co-funding and user fee plans:", snm))
+        content.append((row[29].replace("\n", "<br/>"), "normal"))
+        # Additional comment
+        content.append(("Additional comment:", snm))
+        content.append((row[30].replace("\n", "<br/>"), "normal"))
+    # Near-duplicate proposals, only when the note is asked for
+    if plan.related:
+        content.append(("Possibly related proposals:", snm))
+        content.append(("<br/>".join("{}: {}".format("{} {}".format(label, reg_no) if label else reg_no, title)
+                                     for label, reg_no, title in plan.related), "normal"))
+    return report_spec(plan.filename, header, footer, content)
+
+# Add the header, footer and main content of a report spec to a report gen object
+def fill_report(rp, spec):
+    for text, style in spec.header:
+        rp.add_to_header(text, styles[style])
+    for text, style in spec.footer:
+        rp.add_to_footer(text, styles[style])
+    rp.add_to_footer(logo())
+    for text, style in spec.content:
+        rp.add_to_content(text, styles[style])
+
+# Lay out the pdf of one report spec in memory (the layout stage), returns the filename, the pdf and its pages
+def layout_report(spec):
+    output = io.BytesIO()
+    # Instantiate report gen object
+    rp = report_gen(spec.filename, output)
+    fill_report(rp, spec)
+    rp.make_pdf()
+    return spec.filename, output.getvalue(), rp.pages
+
+# Lay out the reports of the plans, in order. The specs are made as the layout goes, and with
+# more than one worker the layout is spread over a process pool, with a few specs per worker in flight
+def layout_reports(plans, workers=1):
+    specs = (make_spec(plan) for plan in plans)
+    if workers < 2:
+        for spec in specs:
+            yield layout_report(spec)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_up) as pool:
+        pending = deque()
+        for spec in specs:
+            pending.append(pool.submit(layout_report, spec))
+            if len(pending) >= 4 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# Write a pdf, through a temporary file so a reader never sees half a pdf
+def write_pdf(filename, data):
+    Path(os.path.dirname(filename)).mkdir(parents=True, exist_ok=True)
+    with open(filename + ".tmp", "wb") as fh:
+        fh.write(data)
+    os.replace(filename + ".tmp", filename)
+
+# Writes the finished pdfs to disk in a thread of its own (the writer stage), so the layout
+# does not wait for the disk. The queue is bounded: when the disk falls behind, the layout
+# waits for it instead of piling up pdfs in memory. Errors are raised again by put and close
+class pdf_writer(object):
+    def __init__(self, maxsize=16):
+        self.queue = queue.Queue(maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self.__run, name="pdf_writer", daemon=True)
+        self.thread.start()
+
+    # Hand a finished pdf to the writer, waits when the queue is full
+    def put(self, filename, data):
+        if self.error:
+            raise self.error
+        self.queue.put((filename, data))
+
+    def __run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            # after an error the rest is only drained, so put never blocks for ever
+            if self.error is None:
+                try:
+                    write_pdf(*item)
+                except Exception as error:
+                    self.error = error
+
+    # Wait until everything is written
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error:
+            raise self.error
+
+# Proposal books hold all reports in one pdf (or one pdf per platform), in the same order
+# as the single pdfs, with outline bookmarks per platform and per report.
+# The fonts and the logo are embedded once per book instead of once per report
+BOOK_DIR = "Pdfs_book"
+book_modes = ["single", "platform"]
+
+def book_filename(plan=None, book_dir=BOOK_DIR):
+    if plan is None:
+        return os.path.join(book_dir, "Survey_proposals.pdf")
+    return os.path.join(book_dir, "{}_{}.pdf".format(str(plan.plt_i), plan.platform))
+
+# Bookmark the first page of a report in the book outline (and of its platform, if it comes first)
+def bookmark_report(canvas, plan, new_platform):
+    if new_platform:
+        canvas.bookmarkPage("platform_{}".format(plan.plt_i))
+        canvas.addOutlineEntry(plan.platform, "platform_{}".format(plan.plt_i), level=0)
+        canvas.showOutline()
+    canvas.bookmarkPage("report_{}".format(plan.rpid))
+    canvas.addOutlineEntry("{}: {}".format(plan.rpid, plan.title), "report_{}".format(plan.rpid), level=1)
+
+# Make one book from a list of planned reports. Every report gets its own page template
+# (its header and footer) and starts on a new page. Returns the book, first page and
+# number of pages of every report
+def build_book(book):
+    filename, plans = book
+    doc = BaseDocTemplate(filename, **page_layout)
+    templates = []
+    story = []
+    reports = []
+    last_platform = None
+    for plan in plans:
+        rp = report_gen(filename)
+        fill_report(rp, make_spec(plan))
+        rp.on_first_page = partial(bookmark_report, plan=plan, new_platform=plan.platform != last_platform)
+        last_platform = plan.platform
+        template_id = "report_{}".format(plan.rpid)
+        templates.append(rp.page_template(template_id))
+        if story:
+            story.extend([NextPageTemplate(template_id), PageBreak()])
+        story.extend(rp.get_content())
+        reports.append((plan, rp))
+    doc.addPageTemplates(templates)
+    Path(os.path.dirname(filename)).mkdir(parents=True, exist_ok=True)
+    with stage("build:" + filename):
+        doc.build(story)
+    return [(plan.filename, filename, rp.first_page, rp.pages) for plan, rp in reports]
+
+# Make the books (one for all reports, or one per platform with mode "platform"), and remove
+# books of earlier runs that are not made any more. Returns report filename -> (book, first page, pages)
+def make_books(plans, mode="single", workers=1, book_dir=BOOK_DIR):
+    books = {}
+    for plan in plans:
+        books.setdefault(book_filename(plan if mode == "platform" else None, book_dir), []).append(plan)
+    if workers > 1 and len(books) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(books)), initializer=warm_up) as pool:
+            results = list(pool.map(build_book, books.items()))
+    else:
+        results = [build_book(book) for book in books.items()]
+    # Nothing was built (and book_dir may not exist) when there are no reports
+    for entry in os.listdir(book_dir) if os.path.isdir(book_dir) else []:
+        if entry.endswith(".pdf") and os.path.join(book_dir, entry) not in books:
+            os.remove(os.path.join(book_dir, entry))
+    return {fname: (book, first_page, pages) for result in results for fname, book, first_page, pages in result}
+
+# Meta data file (Excel, CSV or Parquet by its extension) and lookup index of all reports, in the
+# order of the plan (see catalogue.py). placed has the output, first page and pages of the reports made
+# in this run, e.g. the books and pages of the reports in proposal books, related the clusters of
+# near-duplicate proposals (see near_duplicates.py)
+@traced("meta")
+def write_meta(plans, filename="Survey_meta.xlsx", placed=None, index_file=INDEX_FILE, related=None):
+    # The records are streamed to the meta data file and indexed on the way, only the index keeps them
+    index = {}
+    records = catalogue_records(plans, placed, load_index(index_file), related)
+    write_catalogue(indexed(records, index), filename)
+    return write_index((), index_file, index)
+
+# The code that makes the pdfs, a change to any of these rebuilds all pdfs
+REPORT_CODE_FILES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+                     for name in ["single_survey_page.py", "survey_responses.py", "report_resources.py"]]
+
+# Digest of the style definitions and the code, shared by all reports of a run
+def build_version():
+    digest = hashlib.sha256()
+    for name in sorted(styles.byName):
+        attrs = {k: v for k, v in vars(styles[name]).items() if k != "parent"}
+        digest.update(repr(sorted(attrs.items())).encode("utf-8"))
+    for code_file in REPORT_CODE_FILES:
+        digest.update(file_digest(code_file).encode("utf-8"))
+    return digest.hexdigest()
+
+# Digest of everything a report is made from: the source row, where the report is placed
+# (platform, survey type, numbers), the related proposals noted, the style definitions and the code
+def report_digest(plan, version):
+    inputs = [plan.rpid, plan.reg_no, plan.title, plan.platform, plan.plt_i, plan.sid,
+              plan.response.multi_platform, list(plan.response.row), [list(r) for r in plan.related], version]
+    return hashlib.sha256(json.dumps(inputs, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+# Make all the reports, the builds are independent so with more than one worker
+# the layout is handed to a process pool. Names, numbers and meta data do not depend on it.
+# Only the reports whose inputs changed since the last run are built (unless force is set),
+# and reports that are no longer part of the plan are removed.
+# With book set ("single" or "platform"), proposal books are made instead of single pdfs.
+# With only (report or registration numbers), only those reports are looked at, the others are left as they are.
+# With find_related, near-duplicate proposals, also among the earlier exports in history ((label, export) or
+# (label, export, sheet, header), see near_duplicates.history_exports), are clustered in the meta data,
+# and with related_note (which implies find_related) also noted in the reports. The clusters are cached,
+# and with only they are only taken from the cache, nothing is detected
+def make_reports(survey_file="Survey.xlsx", workers=1, force=False, book=None, sheet_name=None, header=1,
+                 output_dir="Pdfs", meta_file="Survey_meta.xlsx", book_dir=BOOK_DIR, only=None, index_file=INDEX_FILE,
+                 related_note=False, history=(), find_related=False):
+    process_order, ntotal = read_responses(survey_file, sheet_name, header)
+    plans = plan_reports(process_order, ntotal, output_dir)
+    related = {}
+    if find_related or related_note:
+        from near_duplicates import related_proposals
+
+        related = related_proposals(survey_file, sheet_name, header, history,
+                                    responses=unique_responses(process_order), detect=not only)
+    if related_note:
+        plans = [plan._replace(related=tuple(related[plan.reg_no]["related"])) if plan.reg_no in related else plan
+                 for plan in plans]
+    if book:
+        placed = make_books(plans, book, workers, book_dir)
+        write_meta(plans, meta_file, placed, index_file, related)
+        print("{} reports in {} book(s)".format(len(plans), len(set(b for b, _, _ in placed.values()))))
+        return plans
+    manifest = BuildManifest(os.path.join(output_dir, ".build_manifest.json"))
+    version = build_version()
+    if only:
+        # report numbers can be given with or without the leading zeros
+        only = set(str(o).lstrip("0") for o in only)
+    todo = []
+    for plan in plans:
+        if only and plan.rpid.lstrip("0") not in only and plan.reg_no not in only:
+            manifest.keep(plan.filename)
+        elif manifest.needs_build(plan.filename, report_digest(plan, version), force):
+            todo.append(plan)
+    # Specs are made, laid out and written in a pipeline, the disk writes overlap with the layout
+    placed = {}
+    writer = pdf_writer()
+    try:
+        for filename, data, pages in layout_reports(todo, workers if len(todo) > 1 else 1):
+            writer.put(filename, data)
+            placed[filename] = (filename, 1, pages)
+    finally:
+        writer.close()
+    manifest.finish()
+    write_meta(plans, meta_file, placed, index_file, related)
+    print(manifest.summary())
+    return plans
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create a pdf for each survey response")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of processes building pdfs in parallel")
+    parser.add_argument("--force", action="store_true", help="rebuild all pdfs, also the unchanged ones")
+    parser.add_argument("--book", choices=book_modes, help="make proposal books instead of single pdfs: one for all reports, or one per platform")
+    parser.add_argument("--only", nargs="+", help="only look at these reports (report or registration numbers)")
+    parser.add_argument("--meta", default="Survey_meta.xlsx", help="meta data file, .xlsx, .csv or .parquet (default Survey_meta.xlsx)")
+    parser.add_argument("--index", default=INDEX_FILE, help="lookup index of the reports (default {})".format(INDEX_FILE))
+    parser.add_argument("--related", action="store_true", help="find the near-duplicate proposals and list them in the meta data")
+    parser.add_argument("--related-note", action="store_true", help="also note the possibly related (near-duplicate) proposals in the reports (implies --related)")
+    parser.add_argument("--history", nargs="+", action="append", default=[], metavar="LABEL EXPORT [SHEET HEADER]",
+                        help="also look for related proposals in an earlier export (read from SHEET with the column names in row HEADER, 0 based, if given), can be given more than once")
+    args = parser.parse_args()
+    from near_duplicates import history_exports
+
+    try:
+        args.history = history_exports(args.history)
+    except ValueError as error:
+        parser.error(str(error))
+    make_reports(workers=args.jobs, force=args.force, book=args.book, only=args.only, meta_file=args.meta, index_file=args.index,
+                 related_note=args.related_note, history=args.history, find_related=args.related)
@@ -0,0 +1,208 @@
+"""Command line interface to all the survey scripts
+
+    python survey.py plots          the summary plots and stats (Make_plots.py)
+    python survey.py summary-pdf    the summary pdfs (Make_graph_pdfs.py)
+    python survey.py proposal-pdfs  a pdf per response (single_survey_page.py)
+    python survey.py all            all of the above
+
+The export, its sheet and header row, and the output folders can be given
+for every command. Nothing heavy is imported up front: every command only
+imports the script (and so the libraries) it runs, so small jobs such as
+remaking one proposal pdf do not pay for importing plotly and pandas.
+"""
+
+import argparse
+
+
+def _source(args):
+    # The export options that were given, the scripts use their own defaults for the others
+    given = {"path": args.input, "sheet_name": args.sheet, "header": args.header}
+    return {key: value for key, value in given.items() if value is not None}
+
+
+def run_plots(args):
+    from Make_plots import make_plots
+
+    make_plots(
+        render_workers=args.render_jobs, plot_dir=args.plots_dir, **_source(args)
+    )
+
+
+def run_summary_pdf(args):
+    from Make_graph_pdfs import generatePdf
+
+    for survey_type in ["A", "B"]:
+        generatePdf(
+            survey_type, args.backend, args.summary_dir, args.plots_dir, _source(args)
+        )
+
+
+def run_proposal_pdfs(args):
+    from single_survey_page import make_reports
+
+    source = _source(args)
+    if "path" in source:
+        source["survey_file"] = source.pop("path")
+    make_reports(
+        workers=args.jobs,
+        force=args.force,
+        book=args.book,
+        output_dir=args.proposals_dir,
+        meta_file=args.meta,
+        book_dir=args.book_dir,
+        only=args.only,
+        index_file=args.index,
+        related_note=args.related_note,
+        history=args.history,
+        find_related=args.related,
+        **source
+    )
+
+
+def run_all(args):
+    run_plots(args)
+    run_summary_pdf(args)
+    run_proposal_pdfs(args)
+
+
+def _add_plot_options(parser, render_jobs=True):
+    parser.add_argument(
+        "--plots-dir",
+        default="Plots",
+        help="folder of the plots and stats (default Plots)",
+    )
+    if render_jobs:
+        parser.add_argument(
+            "--render-jobs",
+            type=int,
+            default=1,
+            help="processes rendering the plots (default 1)",
+        )
+
+
+def _add_summary_options(parser, flag="--output-dir"):
+    parser.add_argument(
+        flag,
+        dest="summary_dir",
+        default="pdfs_plots",
+        help="folder of the summary pdfs (default pdfs_plots)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["svg", "native"],
+        default="svg",
+        help="charts from the svg plots, or drawn with reportlab (default svg)",
+    )
+
+
+def _add_proposal_options(parser, flag="--output-dir"):
+    parser.add_argument(
+        flag,
+        dest="proposals_dir",
+        default="Pdfs",
+        help="folder of the per-response pdfs (default Pdfs)",
+    )
+    parser.add_argument(
+        "--meta",
+        default="Survey_meta.xlsx",
+        help="meta data file of the reports, .xlsx, .csv or .parquet (default Survey_meta.xlsx)",
+    )
+    parser.add_argument(
+        "--index",
+        default="Survey_index.json",
+        help="lookup index of the reports (default Survey_index.json)",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="processes building pdfs (default 1)"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="rebuild the pdfs, also unchanged ones"
+    )
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        help="only look at these reports (report or registration numbers)",
+    )
+    parser.add_argument(
+        "--book",
+        choices=["single", "platform"],
+        help="make proposal books instead of single pdfs",
+    )
+    parser.add_argument(
+        "--book-dir",
+        default="Pdfs_book",
+        help="folder of the proposal books (default Pdfs_book)",
+    )
+    parser.add_argument(
+        "--related",
+        action="store_true",
+        help="find the near-duplicate proposals and list them in the meta data",
+    )
+    parser.add_argument(
+        "--related-note",
+        action="store_true",
+        help="also note the possibly related (near-duplicate) proposals in the pdfs (implies --related)",
+    )
+    parser.add_argument(
+        "--history",
+        nargs="+",
+        action="append",
+        default=[],
+        metavar="LABEL EXPORT [SHEET HEADER]",
+        help="also look for related proposals in an earlier export, read from SHEET with the column names in row HEADER (0 based) if given (repeatable)",
+    )
+
+
+def main(argv=None):
+    source = argparse.ArgumentParser(add_help=False)
+    source.add_argument(
+        "-i", "--input", help="the survey export (default: the one of each script)"
+    )
+    source.add_argument("--sheet", help="sheet of the export")
+    source.add_argument(
+        "--header", type=int, help="row of the column names (0 based, default 1)"
+    )
+
+    parser = argparse.ArgumentParser(description="SciLifeLab infrastructure survey")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    plots = commands.add_parser(
+        "plots", parents=[source], help="make the summary plots and stats"
+    )
+    _add_plot_options(plots)
+    plots.set_defaults(run=run_plots)
+
+    summary = commands.add_parser(
+        "summary-pdf", parents=[source], help="make the summary pdfs"
+    )
+    _add_plot_options(summary, render_jobs=False)
+    _add_summary_options(summary)
+    summary.set_defaults(run=run_summary_pdf)
+
+    proposals = commands.add_parser(
+        "proposal-pdfs", parents=[source], help="make a pdf per response"
+    )
+    _add_proposal_options(proposals)
+    proposals.set_defaults(run=run_proposal_pdfs)
+
+    everything = commands.add_parser(
+        "all", parents=[source], help="make the plots, summary pdfs and proposal pdfs"
+    )
+    _add_plot_options(everything)
+    _add_summary_options(everything, "--summary-dir")
+    _add_proposal_options(everything, "--proposals-dir")
+    everything.set_defaults(run=run_all)
+
+    args = parser.parse_args(argv)
+    if getattr(args, "history", None):
+        from near_duplicates import history_exports
+
+        try:
+            args.history = history_exports(args.history)
+        except ValueError as error:
+            parser.error(str(error))
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Columnar on-disk cache for the parsed survey export
+
+Parsing the Excel export with openpyxl is the biggest fixed cost of every run.
+The functions here parse the workbook once and store the cleaned table as a
+Parquet file in `.survey_cache/`, keyed by the path and a content hash of the
+workbook plus the sheet name and header row. Later runs read the Parquet file instead, and a
+real parse only happens again when the workbook changes.
+
+Parquet is columnar, so a caller that only needs a few columns of a wide
+export (the plots do not need the free text) reads only those. There is one
+cache entry per sheet and header row: the rows used for the per-response pdfs
+are read from the same entry as the dataframe of the plots, with pyarrow alone
+(pandas is only imported to parse the workbook and by read_survey_frame).
+
+The content hash of an export is only computed once per version of the file
+(see source_digest), however many of the scripts and caches ask for it in a run.
+"""
+
+import glob
+import hashlib
+import os
+import re
+
+CACHE_DIR = ".survey_cache"
+
+# Schema meta data key of the cache entries, the title of the active sheet of the workbook
+ACTIVE_SHEET_KEY = b"active_sheet"
+
+_source_digests = {}
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    file_digest returns the sha256 hex digest of the contents of a file
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_digest(path):
+    """
+    source_digest returns file_digest(path) for a survey export. The digest is kept for
+    the path, modification time and size of the file, so it is only computed again in
+    this process when the file changes
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if key not in _source_digests:
+        _source_digests[key] = file_digest(path)
+    return _source_digests[key]
+
+
+def _cache_prefix(path, kind, sheet_name, header):
+    # sheet names can contain spaces and dashes, keep the file names tidy. The digest of
+    # the absolute path tells the workbooks apart, so that the entries of one (e.g. the
+    # current export) survive caching another (an earlier year's export)
+    sheet_slug = re.sub(r"[^0-9A-Za-z]+", "_", str(sheet_name)).strip("_")
+    source = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:12]
+    return "{}_{}_{}_{}_".format(kind, sheet_slug, header, source)
+
+
+def _cache_path(path, kind, sheet_name, header):
+    prefix = _cache_prefix(path, kind, sheet_name, header)
+    return os.path.join(CACHE_DIR, prefix + source_digest(path)[:20] + ".parquet")
+
+
+def _store(write, cache_file):
+    # Write to a temporary file first so an interrupted run never leaves a broken cache
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_file = cache_file + ".tmp"
+    write(tmp_file)
+    os.replace(tmp_file, cache_file)
+    # Drop the entries of earlier versions of the same workbook (path), sheet and header
+    prefix = os.path.basename(cache_file)[: -len(".parquet") - 20]
+    for entry in os.listdir(CACHE_DIR):
+        if entry.startswith(prefix) and entry != os.path.basename(cache_file):
+            os.remove(os.path.join(CACHE_DIR, entry))
+
+
+def _columnar(frame):
+    # Parquet needs one type per column; with keep_default_na=False the free text
+    # columns mix '' with numbers, so those columns are kept as plain strings
+    frame.columns = [str(c) for c in frame.columns]
+    for col in frame.columns:
+        if frame[col].dtype == object and not all(
+            isinstance(v, str) for v in frame[col]
+        ):
+            frame[col] = frame[col].astype(str)
+    return frame
+
+
+def _active_sheet(path, header):
+    # The title of the active sheet, from the meta data of any cache entry of this version
+    # of the workbook, or None when there is none
+    import pyarrow.parquet as pq
+
+    source = _cache_prefix(path, "frame", "", header)[len("frame__") :]
+    pattern = "frame_*_{}{}.parquet".format(source, source_digest(path)[:20])
+    for cache_file in glob.glob(os.path.join(CACHE_DIR, pattern)):
+        metadata = pq.read_schema(cache_file).metadata or {}
+        if ACTIVE_SHEET_KEY in metadata:
+            return metadata[ACTIVE_SHEET_KEY].decode("utf-8")
+    return None
+
+
+def _frame_cache(path, sheet_name, header):
+    # The cache file of the parsed sheet (the active one when sheet_name is None), parsed
+    # and stored first when it is missing
+    if sheet_name is None:
+        sheet_name = _active_sheet(path, header)
+    cache_file = None
+    if sheet_name is not None:
+        cache_file = _cache_path(path, "frame", sheet_name, header)
+    if cache_file is None or not os.path.isfile(cache_file):
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        with pd.ExcelFile(path, engine="openpyxl") as workbook:
+            active = workbook.book.active.title
+            if sheet_name is None:
+                sheet_name = active
+                cache_file = _cache_path(path, "frame", sheet_name, header)
+            frame = pd.read_excel(
+                workbook,
+                sheet_name=sheet_name,
+                header=header,
+                keep_default_na=False,
+            )
+        table = pa.Table.from_pandas(_columnar(frame), preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[ACTIVE_SHEET_KEY] = active.encode("utf-8")
+        table = table.replace_schema_metadata(metadata)
+        _store(lambda tmp_file: pq.write_table(table, tmp_file), cache_file)
+    return cache_file
+
+
+def survey_columns(path, sheet_name, header):
+    """
+    survey_columns returns the column names of the survey export, in export order,
+    from the schema of the columnar cache
+    """
+    import pyarrow.parquet as pq
+
+    return pq.read_schema(_frame_cache(path, sheet_name, header)).names
+
+
+def read_survey_frame(path, sheet_name, header, columns=None):
+    """
+    read_survey_frame returns the survey export as a dataframe, as read by
+    pd.read_excel(path, sheet_name, header, keep_default_na=False), but served from
+    the columnar cache whenever the workbook has not changed. Parquet needs one type
+    per column, so columns that mix text with other values (numbers and '' for the
+    empty cells) are read as strings, e.g. "5" instead of 5. With
+    columns (names, see survey_columns) only those columns are read, in that order.
+    The workbook is always parsed and cached in full, so other column sets are
+    served from the same cache.
+    """
+    import pandas as pd
+
+    return pd.read_parquet(_frame_cache(path, sheet_name, header), columns=columns)
+
+
+def read_survey_head(path, sheet_name, header, rows=50):
+    """
+    read_survey_head returns the first rows (at most) of every column of the survey export,
+    column name -> values, in export order, read from the columnar cache
+    """
+    import pyarrow.parquet as pq
+
+    batches = pq.ParquetFile(_frame_cache(path, sheet_name, header)).iter_batches(
+        batch_size=rows
+    )
+    head = next(batches, None)
+    if head is None:
+        return {name: [] for name in survey_columns(path, sheet_name, header)}
+    return head.to_pydict()
+
+
+def _cell_text(value):
+    # What unescape(str(cell.value) or "") gives for the cell the value was parsed from,
+    # empty cells are '' in the cache and None in openpyxl. openpyxl is only imported
+    # for the (rare) text with escaped characters
+    if value == "":
+        return "None"
+    if not isinstance(value, str):
+        return str(value)
+    if "_x" not in value:
+        return value
+    from openpyxl.utils.escape import unescape
+
+    return unescape(value)
+
+
+def read_survey_rows(path, min_row=1, sheet_name=None):
+    """
+    read_survey_rows returns the rows of a sheet (the active one by default)
+    starting from min_row as lists of unescaped strings, i.e. exactly what
+    `unescape(str(cell.value) or "")` gives for every cell. The rows are read from
+    the same cache entry as read_survey_frame(path, sheet_name, min_row - 2), the row
+    above min_row is the header row
+    """
+    import pyarrow.parquet as pq
+
+    header = min_row - 2 if min_row > 1 else None
+    # ParquetFile, unlike read_table, does not import pyarrow.dataset (and pandas with it)
+    table = pq.ParquetFile(_frame_cache(path, sheet_name, header)).read()
+    columns = [[_cell_text(value) for value in column.to_pylist()] for column in table.columns]
+    return [list(row) for row in zip(*columns)]
@@ -0,0 +1,88 @@
+"""Cross-tabulation of two survey questions
+
+Every question is encoded once into a sparse indicator matrix (one row per
+response, one column per option, a 1 where the response selected the option,
+or the number of times a cell repeats it, as the tallies count it). Like the tally engine, only the distinct answers (categories) are
+split, the rows just pick the indicator row of their answer. The cross-tab of
+two questions is then one sparse matrix product, X_row.T @ X_column, which
+counts for every pair of options the responses that selected both. Multi-select
+questions can be on either or both axes: a response that selected two platforms
+and two capabilities is counted once in each of the four cells.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from survey_tally import split_answers
+from survey_trace import stage
+
+
+def indicator_matrix(answers, options, multi_select=True):
+    """
+    indicator_matrix encodes the answers of a question into a sparse (CSR) matrix with one
+    row per answer and one column per option (in the given order), holding how often the
+    answer has the option (1, or more when a cell repeats it). Answers that are not one of
+    the options are not encoded
+    """
+    options = list(options)
+    option_codes = {option: code for code, option in enumerate(options)}
+    answers = pd.Series(answers)
+    if not isinstance(answers.dtype, pd.CategoricalDtype):
+        answers = answers.astype(object).astype("category")
+    categories = np.asarray(answers.cat.categories, dtype=object)
+    if multi_select:
+        tokens = split_answers(categories, options)
+        cells = tokens.index.to_numpy()
+        codes = tokens.map(option_codes).to_numpy()
+    else:
+        cells = np.arange(len(categories))
+        codes = pd.Series(categories).astype(str).map(option_codes).to_numpy()
+    known = ~pd.isna(codes)
+    # One row per category, and an empty last row for the missing answers (code -1)
+    per_category = sparse.csr_matrix(
+        (
+            np.ones(known.sum(), dtype=np.int64),
+            (cells[known], codes[known].astype(np.int64)),
+        ),
+        shape=(len(categories) + 1, len(options)),
+    )
+    # An option given twice in one cell counts twice, as in the tallies (survey_tally.py), so
+    # the margins of a cross-tab with a single-select question are the bar chart counts
+    per_category.sum_duplicates()
+    rows = answers.cat.codes.to_numpy().astype(np.int64)
+    rows[rows < 0] = len(categories)
+    return per_category[rows]
+
+
+class CrossTab(object):
+    # The indicator matrices of the questions of a survey frame, each encoded on first use.
+    # questions: name -> (column, options, multi_select), as the questions of Make_plots.py
+    def __init__(self, frame, questions):
+        self.frame = frame
+        self.questions = questions
+        self._indicators = {}
+
+    def indicators(self, question):
+        if question not in self._indicators:
+            column, options, multi_select = self.questions[question]
+            with stage("encode:" + question):
+                self._indicators[question] = indicator_matrix(
+                    self.frame[column], options, multi_select
+                )
+        return self._indicators[question]
+
+    # The co-occurrence counts of two questions (options of the first as rows, of the second
+    # as columns), over the responses at the row positions rows (all responses by default)
+    def table(self, row_question, column_question, rows=None):
+        first = self.indicators(row_question)
+        second = self.indicators(column_question)
+        if rows is not None:
+            first, second = first[rows], second[rows]
+        with stage("crosstab:{}:{}".format(row_question, column_question)):
+            counts = (first.T @ second).toarray()
+        return pd.DataFrame(
+            counts,
+            index=pd.Index(self.questions[row_question][1]),
+            columns=pd.Index(self.questions[column_question][1]),
+        )
@@ -0,0 +1,257 @@
+"""Survey loading
+
+Reads the survey export into the frame the tallies and plots are made from: the columns
+the questions need, renamed, normalised and typed, and partitioned by survey type. The
+trends aggregates are made with this code, so it is part of their code version (see
+trends.AGGREGATE_CODE_FILES)
+"""
+
+import numpy as np
+import pandas as pd
+
+from survey_cache import read_survey_frame, survey_columns
+from survey_normalise import normalise_answers, year_rules
+from survey_options import (
+    AFFILIATION_OPTIONS,
+    CAPABILITY_OPTIONS,
+    PLATFORM_OPTIONS,
+    POTENTIAL_USERS_OPTIONS,
+    SURVEY_FILE,
+    SURVEY_HEADER,
+    SURVEY_SHEET,
+    SURVEY_TYPES,
+    SURVEY_YEAR,
+)
+from survey_responses import survey_type_column
+from survey_trace import stage, traced
+
+
+# Column types of the typed survey frame (see type_survey_data)
+# Closed-choice single-select columns and their known options (the survey type column is added by type_survey_data)
+
+SINGLE_SELECT_COLUMNS = {
+    "potential_users": POTENTIAL_USERS_OPTIONS,
+}
+
+# Multi-select columns (answers separated by ", ")
+
+MULTI_SELECT_COLUMNS = [
+    "Affiliation",
+    "University",
+    "Tech_fits",
+    "Fac_fits",
+    "cap_fits_A",
+    "cap_fits_B",
+    "Platform_fits",
+    "Capability_fits",
+]
+
+# Columns made by joining two export columns (the answers of survey type A and B)
+
+COMBINED_COLUMNS = {
+    "Platform_fits": ("Tech_fits", "Fac_fits"),
+    "Capability_fits": ("cap_fits_A", "cap_fits_B"),
+}
+
+# The columns every tallied column is made from (after renaming), only these are loaded
+
+SOURCE_COLUMNS = dict(
+    {column: list(parts) for column, parts in COMBINED_COLUMNS.items()},
+    Affiliation=["Affiliation", "University"],
+)
+
+# The questions to tally: name -> (column, all possible values, multi-select)
+
+QUESTIONS = {
+    "affiliation": ("Affiliation", AFFILIATION_OPTIONS, True),
+    "platform_fit": ("Platform_fits", PLATFORM_OPTIONS, True),
+    "capability_fit": ("Capability_fits", CAPABILITY_OPTIONS, True),
+    "potential_users": ("potential_users", POTENTIAL_USERS_OPTIONS, False),
+}
+
+
+# Names used for the export columns needed to work with
+
+COLUMN_NAMES = {
+    "In which of the existing SciLifeLab Platform(s) would the technology/instrument/service/technological capability fit. https://www.scilifelab.se/services/infrastructure-organization/": "Tech_fits",
+    "In which of the existing SciLifeLab Platform(s) would the facility fit": "Fac_fits",
+    "Indicate if the suggested technology/instrument/service/technological capability would considerably contribute to strengthen one or more of the SciLifeLab capabilities and/or the Data Driven Life Science program": "cap_fits_A",
+    "Indicate if the suggested facility would considerably contribute to strengthen one or more of the SciLifeLab capabilities and/or the Data Driven Life Science program": "cap_fits_B",
+    "Estimate the number of unique annual users if the unit would become a part of the SciLifeLab national infrastructure": "potential_users",
+}
+
+# The survey type question is found by its answers (survey_type_column of survey_responses.py,
+# the column single_survey_page.py reads) and loaded under this name
+
+SURVEY_TYPE_ANSWER = "Survey_type_answer"
+
+
+def survey_data_columns(names, type_column, questions=None):
+    """
+    survey_data_columns returns the export columns (out of names, the columns of the export)
+    that the questions (name -> (column, options, multi_select), all of QUESTIONS by default)
+    are made from, together with the survey type question (type_column), in export order
+    """
+    export_names = {short: name for name, short in COLUMN_NAMES.items()}
+    needed = {type_column}
+    for column, options, multi_select in (questions or QUESTIONS).values():
+        needed.update(
+            export_names.get(source, source)
+            for source in SOURCE_COLUMNS.get(column, [column])
+        )
+    return [name for name in names if name in needed]
+
+
+def load_survey_data(
+    path=SURVEY_FILE,
+    sheet_name=SURVEY_SHEET,
+    header=SURVEY_HEADER,
+    typed=True,
+    questions=None,
+    all_columns=False,
+    year=SURVEY_YEAR,
+):
+    """
+    load_survey_data reads in the survey export and performs the general survey prep
+    (everything that happens before partitioning by survey type). Only the columns the
+    questions (all of QUESTIONS by default) need are loaded, unless all_columns is set.
+    The answers are normalised with the rules of the survey year (see survey_normalise.py),
+    the number of cells every rule changed is kept in the attrs of the frame ("normalisation").
+    With typed=True the columns get compact types (see type_survey_data), otherwise they
+    stay python strings. The survey type question is found by its answers (see
+    survey_type_column), an export without it raises ValueError
+    """
+    # The parsed export is cached in columnar form, so only the first run after the file changes pays for the Excel parse
+    # and later runs only read the columns that are needed
+    with stage("load"):
+        names = survey_columns(path, sheet_name, header)
+        type_column = names[survey_type_column(path, sheet_name, header)]
+        columns = (
+            names if all_columns else survey_data_columns(names, type_column, questions)
+        )
+        survey_data_raw = read_survey_frame(
+            path, sheet_name=sheet_name, header=header, columns=columns
+        )
+
+    # Rename columns needed to work with
+
+    survey_data_raw.rename(
+        columns=dict(COLUMN_NAMES, **{type_column: SURVEY_TYPE_ANSWER}),
+        inplace=True,
+    )
+
+    with stage("normalise"):
+        # make affiliations types into a unified column
+        # (prep for affiliations work)
+
+        if "Affiliation" in survey_data_raw:
+            survey_data_raw["Affiliation"] = _with_universities(
+                survey_data_raw["Affiliation"], survey_data_raw["University"]
+            )
+
+        # The year-specific fixups (e.g. 'Health care' affiliations standardised to 'Healthcare'),
+        # only in the closed-choice columns they are for
+
+        survey_data_raw.attrs["normalisation"] = normalise_answers(
+            survey_data_raw, year_rules(year)
+        )
+
+    # made where the tech/facility fits in one column (for which platform does it fit in question)
+    # made which capability would be contributed to fit in one column (for which capability does it fit in question)
+
+    for column, (first, second) in COMBINED_COLUMNS.items():
+        if first in survey_data_raw and second in survey_data_raw:
+            survey_data_raw[column] = survey_data_raw[first] + survey_data_raw[second]
+
+    if typed:
+        with stage("types"):
+            survey_data_raw = type_survey_data(survey_data_raw)
+
+    return survey_data_raw
+
+
+def _with_universities(affiliation, university):
+    # The 'University' affiliation replaced by the universities answered (there can be multiple
+    # affiliations, so it is a substring), worked out once for every distinct pair of answers
+    codes, pairs = pd.factorize(pd.MultiIndex.from_arrays([affiliation, university]))
+    merged = np.asarray(
+        [x.replace("University", str(y)) for x, y in pairs], dtype=object
+    )
+    return pd.Series(merged[codes], index=affiliation.index)
+
+
+def _categories(values, options=()):
+    # The known options first (in their order), then any other answer that was given
+    seen = pd.unique(values)
+    return list(options) + sorted(set(seen) - set(options))
+
+
+def type_survey_data(survey_data_raw):
+    """
+    type_survey_data converts the columns of the loaded survey to compact types, without
+    changing any value: closed-choice single-select columns become categoricals with the
+    known options as categories, multi-select columns become categoricals of the distinct
+    answer combinations (every combination is stored and split once) and the free text
+    columns become Arrow-backed strings
+    """
+    single_select = dict(SINGLE_SELECT_COLUMNS)
+    single_select[SURVEY_TYPE_ANSWER] = list(SURVEY_TYPES.values())
+    for column in survey_data_raw.columns:
+        values = survey_data_raw[column]
+        if values.dtype != object:
+            continue
+        if column in single_select:
+            categories = _categories(values, single_select[column])
+        elif column in MULTI_SELECT_COLUMNS:
+            categories = _categories(values)
+        else:
+            survey_data_raw[column] = values.astype("string[pyarrow]")
+            continue
+        survey_data_raw[column] = pd.Categorical(values, categories=categories)
+    return survey_data_raw
+
+
+# There are two different sets of plots needed (one for each survey type), although some plots are needed for both types
+# The answers to the survey type question are in SURVEY_TYPES (survey_options.py)
+
+
+@traced("partition")
+def partition_survey_types(survey_data_raw, survey_types=SURVEY_TYPES):
+    """
+    partition_survey_types classifies the responses according to survey type by reading only the
+    survey type column (SURVEY_TYPE_ANSWER). The result is stored in a categorical 'survey_type'
+    column, and the row positions of each survey type are returned (works for any number of survey types)
+    """
+    answers = survey_data_raw[SURVEY_TYPE_ANSWER]
+    survey_type = pd.Categorical(
+        answers.map({answer: name for name, answer in survey_types.items()}),
+        categories=list(survey_types),
+    )
+    survey_data_raw["survey_type"] = survey_type
+
+    # Noticed that for 'A', the response for 'none' is 'none of the current platforms'. and for B it's 'none of the existing platforms'
+    # Need to standardise this (only the platform answers of survey type A are affected)
+
+    is_A = survey_type == "A"
+    if "Platform_fits" in survey_data_raw:
+        platform_fits = survey_data_raw["Platform_fits"]
+        standardised = (
+            platform_fits[is_A]
+            .astype(str)
+            .str.replace(
+                "None of the current platforms",
+                "None of the existing platforms",
+                regex=False,
+            )
+        )
+        if isinstance(platform_fits.dtype, pd.CategoricalDtype):
+            # a typed frame only takes answers that are one of its categories
+            survey_data_raw["Platform_fits"] = platform_fits.cat.add_categories(
+                pd.Index(standardised.unique()).difference(platform_fits.cat.categories)
+            )
+        survey_data_raw.loc[is_A, "Platform_fits"] = standardised
+
+    return {
+        name: np.flatnonzero(survey_type.codes == code)
+        for code, name in enumerate(survey_type.categories)
+    }
@@ -0,0 +1,169 @@
+"""Normalisation of the closed-choice answers
+
+Some answers of an export are rewritten before they are counted: 'Health
+care' is counted as the affiliation 'Healthcare', and in 2023 the 'Other'
+university could be typed in, so 'Copenhagen University' is counted as 'Other
+University'. These fixups change from year to year, so they are kept in one
+table, NORMALISATION_RULES, with the rules of every survey year and, under
+ALL_YEARS, those that hold for all years.
+
+A rule only rewrites the columns it names. All rules of a column are compiled
+into one pass over the distinct values of the column (not over every cell):
+rules for a whole answer (one of the ", "-separated answers of a multi-select
+cell) are one dictionary lookup per answer, and the rules with a pattern are
+joined into a single regular expression. The number of cells each rule
+changed is reported, so a rule that no longer matches anything stands out:
+
+    python survey_normalise.py -i Data/Test-run.xlsx --year 2023
+"""
+
+import argparse
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from survey_tally import SEPARATOR
+
+# A rewrite of the answers of some columns. old is a whole answer, or with pattern=True a
+# regular expression searched in the cell, and every match is replaced by new (taken literally)
+Rule = namedtuple(
+    "Rule", ["name", "columns", "old", "new", "pattern"], defaults=[False]
+)
+
+# Key of the rules that hold for all years
+ALL_YEARS = "all"
+
+# The rules of every survey year (the columns as named after loading, see Make_plots.py)
+NORMALISATION_RULES = {
+    ALL_YEARS: [
+        # The Healthcare affiliation has been put in as 'Health care'
+        Rule("health_care", ["Affiliation"], "Health care", "Healthcare"),
+    ],
+    2023: [
+        # 'Other' under universities allows users to type in the university (this is not
+        # true for 'Other Swedish University'), these should show up as 'Other University'
+        Rule(
+            "copenhagen_university",
+            ["Affiliation"],
+            "Copenhagen University",
+            "Other University",
+        ),
+    ],
+}
+
+
+def year_rules(year=None, table=NORMALISATION_RULES):
+    """
+    year_rules returns the rules for all years followed by those of the year
+    """
+    return list(table.get(ALL_YEARS, [])) + list(
+        table.get(int(year), []) if year is not None else []
+    )
+
+
+def compile_rules(rules):
+    """
+    compile_rules groups the rules by column: column -> (whole answer -> rule, the combined
+    pattern of the pattern rules or None, group name -> pattern rule)
+    """
+    compiled = {}
+    for rule in rules:
+        for column in rule.columns:
+            exact, patterns = compiled.setdefault(column, ({}, []))
+            if rule.pattern:
+                patterns.append(rule)
+            else:
+                exact.setdefault(rule.old, rule)
+    return {
+        column: (
+            exact,
+            re.compile(
+                "|".join(
+                    "(?P<rule{}>{})".format(number, rule.old)
+                    for number, rule in enumerate(patterns)
+                )
+            )
+            if patterns
+            else None,
+            {"rule{}".format(number): rule for number, rule in enumerate(patterns)},
+        )
+        for column, (exact, patterns) in compiled.items()
+    }
+
+
+def _rewrite(value, exact, combined, patterns):
+    # The rewritten value and the names of the rules that changed it
+    fired = set()
+    if exact:
+        answers = value.split(SEPARATOR)
+        for position, answer in enumerate(answers):
+            rule = exact.get(answer)
+            if rule is not None and rule.new != answer:
+                answers[position] = rule.new
+                fired.add(rule.name)
+        value = SEPARATOR.join(answers)
+    if combined is not None:
+        # The group of a rule closes after the groups of its own pattern, so it is the last group
+        def replace(match):
+            rule = patterns[match.lastgroup]
+            if match.group(0) != rule.new:
+                fired.add(rule.name)
+            return rule.new
+
+        value = combined.sub(replace, value)
+    return value, fired
+
+
+def normalise_answers(frame, rules):
+    """
+    normalise_answers applies the rules to the columns of frame they name (in place), and
+    returns the number of cells every rule changed (rule name -> cells)
+    """
+    touched = {rule.name: 0 for rule in rules}
+    for column, (exact, combined, patterns) in compile_rules(rules).items():
+        if column not in frame:
+            continue
+        codes, values = pd.factorize(frame[column])
+        cells = np.bincount(codes[codes >= 0], minlength=len(values))
+        mapping = {}
+        for value, count in zip(values, cells):
+            if not isinstance(value, str):
+                continue
+            rewritten, fired = _rewrite(value, exact, combined, patterns)
+            for name in fired:
+                touched[name] += int(count)
+            if rewritten != value:
+                mapping[value] = rewritten
+        if mapping:
+            # Through the codes, so a rewritten value is never rewritten again
+            new = np.asarray(
+                [mapping.get(value, value) for value in values], dtype=object
+            )
+            frame[column] = frame[column].where(codes < 0, new[codes])
+    return touched
+
+
+if __name__ == "__main__":
+    from survey_options import SURVEY_FILE, SURVEY_HEADER, SURVEY_SHEET, SURVEY_YEAR
+
+    parser = argparse.ArgumentParser(
+        description="Show how many cells every normalisation rule changes in an export"
+    )
+    parser.add_argument("-i", "--input", default=SURVEY_FILE, help="the survey export")
+    parser.add_argument("--sheet", default=SURVEY_SHEET, help="sheet of the export")
+    parser.add_argument(
+        "--header", type=int, default=SURVEY_HEADER, help="row of the column names"
+    )
+    parser.add_argument(
+        "--year", type=int, default=SURVEY_YEAR, help="survey year of the export"
+    )
+    args = parser.parse_args()
+    from survey_loading import load_survey_data
+
+    frame = load_survey_data(
+        args.input, args.sheet, args.header, typed=False, year=args.year
+    )
+    for name, cells in frame.attrs["normalisation"].items():
+        print("{:<30} {:>8} cells".format(name, cells))
@@ -0,0 +1,83 @@
+"""The survey export and the options of its closed-choice questions
+
+Where the export is (file, sheet, header row and survey year), the answers to
+the survey type question and all possible answers of the questions that are
+plotted and tallied. They are kept apart from Make_plots.py so that scripts
+that only need the options (synthetic_survey.py, trends.py) do not import
+plotly and pandas.
+"""
+
+# The survey export to work with
+
+SURVEY_FILE = "Data/Test-run.xlsx"
+SURVEY_SHEET = "Sheet 1 - 230807072119_scilifel"
+SURVEY_HEADER = 1
+SURVEY_YEAR = 2023
+
+# Answers to the survey type question, keyed by the survey type used for the plots and pdfs
+
+SURVEY_TYPES = {
+    "A": "a.	From a user perspective, an urgently needed technology, instrument, service, or technological capability, currently not available as nation-wide service in Sweden",
+    "B": "b.	An existing local or national core-facility that could be incorporated as a SciLifeLab unit from 2025",
+}
+
+# All possible values of every question (needed to ensure all values can be on the plot, even if
+# not selected in the survey)
+
+# Affiliation - needed for both survey types
+
+AFFILIATION_OPTIONS = [
+    "Chalmers University of Technology",
+    "Karolinska Institutet",
+    "KTH, Royal Institute of Technology",
+    "Linköping University",
+    "Lund University",
+    "Stockholm University",
+    "Swedish University of Agricultural Sciences",
+    "Umeå University",
+    "University of Gothenburg",
+    "Uppsala University",
+    "Örebro University",
+    "Other Swedish University",
+    "Governmental organization",
+    "Healthcare",
+    "Industry",
+    "Other University",
+]
+
+# In which Platform would it fit? - for both survey types
+
+PLATFORM_OPTIONS = [
+    "Genomics",
+    "Clinical Genomics",
+    "Metabolomics",
+    "Spatial Biology",
+    "Cellular and Molecular Imaging",
+    "Integrated Structural Biology",
+    "Chemical Biology and Genome Engineering",
+    "Clinical Proteomics and Immunology",
+    "Drug Discovery and Development",
+    "Bioinformatics",
+    "None of the existing platforms",
+    "I do not know",
+]
+
+# Contribution to capabilities - needed for both survey types
+
+CAPABILITY_OPTIONS = [
+    "Pandemic Laboratory Preparedness",
+    "Precision Medicine",
+    "Planetary Biology",
+    "Data Driven Life Science",
+    "None",
+    "I do not know",
+]
+
+# Estimate number of users that would have if incorporated into SciLifeLab - only needed for survey type B
+
+POTENTIAL_USERS_OPTIONS = [
+    "1-10",
+    "10-50",
+    "More than 50",
+    "I do not know",
+]
@@ -0,0 +1,183 @@
+"""The proposals of the survey export
+
+Where the answers of every survey type are in the export (the column map), the
+record of one response and the plan of the per-response reports (report
+numbers, platform folders and file names). This is everything needed to find a
+proposal and its reports, without reportlab or the fonts: single_survey_page.py
+makes the pdfs from it, and search_index.py and near_duplicates.py read the
+proposals through it.
+"""
+
+import os
+from collections import namedtuple
+
+from survey_cache import read_survey_head, read_survey_rows
+from survey_options import SURVEY_TYPES
+from survey_trace import traced
+
+# Positions of the answers of every survey type in the export
+SURVEY_COLUMNS = {
+    "A": {"title": 10, "description": 11, "platform": 12, "funding": 16, "comment": 17},
+    "B": {"title": 18, "description": 22, "platform": 26, "funding": 29, "comment": 30},
+}
+
+# The platforms in the order of the reports (and of their folders)
+platforms_order = [
+    "Bioinformatics",
+    "Genomics",
+    "Clinical Genomics",
+    "Clinical Proteomics and Immunology",
+    "Metabolomics",
+    "Spatial Biology",
+    "Cellular and Molecular Imaging",
+    "Integrated Structural Biology",
+    "Chemical Biology and Genome Engineering",
+    "Drug Discovery and Development",
+    "No platform suggested",
+]
+
+
+def platform_outside_scilifelab(platform):
+    """
+    platform_outside_scilifelab tells if a platform answer is not one of the SciLifeLab platforms
+    """
+    return platform in [
+        "None of the existing platforms",
+        "None of the current platforms",
+        "I do not know",
+        "No platform suggested",
+    ]
+
+
+class survey_response(object):
+    # Compact record of one survey response, built once while streaming the sheet.
+    # A proposal listed under several platforms shares the same record, so it is never parsed twice
+    __slots__ = ("row", "sid", "reg_no", "title", "platforms", "platform_groups")
+
+    def __init__(self, row, sid, reg_no):
+        columns = SURVEY_COLUMNS[sid]
+        self.row = tuple(row)
+        self.sid = sid
+        self.reg_no = reg_no
+        s_title = row[columns["title"]].strip()
+        self.title = s_title[0].upper() + s_title[1:]
+        self.platforms = [p.strip() for p in row[columns["platform"]].split(", ")]
+        # Platforms outside SciLifeLab are all grouped under 'No platform suggested'
+        self.platform_groups = list(
+            set(
+                [
+                    "No platform suggested" if platform_outside_scilifelab(p) else p
+                    for p in self.platforms
+                ]
+            )
+        )
+
+    @property
+    def multi_platform(self):
+        return len(self.platform_groups) > 1
+
+
+# A planned report: its report number, where it goes and the response it is made from.
+# related lists the (label, reg number, title) of the proposals noted as possibly related in the report
+report_plan = namedtuple(
+    "report_plan",
+    [
+        "rpid",
+        "reg_no",
+        "title",
+        "platform",
+        "plt_i",
+        "sid",
+        "filename",
+        "response",
+        "related",
+    ],
+    defaults=[()],
+)
+
+
+def survey_type_column(survey_file, sheet_name=None, header=1, survey_types=SURVEY_TYPES):
+    """
+    survey_type_column returns the position of the survey type question in an export: the
+    first column with one of the answers of survey_types (SURVEY_TYPES) in its first rows,
+    wherever the question is in the layout of that year. Raises ValueError when no column has
+    them, rather than splitting the responses by the wrong column
+    """
+    answers = set(survey_types.values())
+    for position, values in enumerate(read_survey_head(survey_file, sheet_name, header).values()):
+        if answers.intersection(str(value) for value in values):
+            return position
+    raise ValueError(
+        "No column of {} (sheet {}, header row {}) has the survey type answers {}".format(
+            survey_file,
+            "active" if sheet_name is None else sheet_name,
+            header,
+            ", ".join(sorted(answers)),
+        )
+    )
+
+
+@traced("load")
+def read_responses(survey_file, sheet_name=None, header=1):
+    """
+    read_responses reads the survey file (served from the columnar cache unless the file
+    changed) and turns every row into a record. header is the (0 based) row of the column
+    names, as for Make_plots.py, the responses start below it. Returns platform -> survey
+    type -> responses, and the number of reports (a response per platform it is under)
+    """
+    ntotal = 0
+    process_order = {}
+    reg_num = {"A": 1, "B": 1}
+    type_column = survey_type_column(survey_file, sheet_name, header)
+    for row in read_survey_rows(survey_file, min_row=header + 2, sheet_name=sheet_name):
+        sid = row[type_column][0].upper()
+        response = survey_response(row, sid, sid + str(reg_num[sid]))
+        for p in response.platform_groups:
+            if p not in process_order:
+                process_order[p] = {"A": [], "B": []}
+            process_order[p][sid].append(response)
+            ntotal += 1
+        reg_num[sid] += 1
+    return process_order, ntotal
+
+
+def plan_reports(process_order, ntotal, output_dir="Pdfs"):
+    """
+    plan_reports works out the full plan (report numbers, file names and folders) in the
+    order of the platforms and titles, before any pdf is made. The numbering never depends
+    on how the pdfs are built
+    """
+    plans = []
+    rpn = 0
+    for plt_i, p in enumerate(platforms_order, 1):
+        if p not in process_order:
+            continue
+        for i in ["A", "B"]:
+            for s in sorted(process_order[p][i], key=lambda r: r.title.lower()):
+                rpn += 1
+                rpid = str(rpn).zfill(len(str(ntotal)))
+                # Filename and path
+                pdf_name = "{}_{}_{}.pdf".format(
+                    rpid, s.title.replace(" ", "_"), s.reg_no
+                )
+                fname = os.path.join(
+                    output_dir, "{}_{}".format(str(plt_i), p), pdf_name
+                )
+                plans.append(
+                    report_plan(rpid, s.reg_no, s.title, p, plt_i, i, fname, s)
+                )
+    return plans
+
+
+def unique_responses(process_order):
+    """
+    unique_responses returns the responses of read_responses once each (a proposal under
+    several platforms is one response), in registration order
+    """
+    responses = {
+        response.reg_no: response
+        for groups in process_order.values()
+        for group in groups.values()
+        for response in group
+    }
+    return sorted(responses.values(), key=lambda r: (r.sid, int(r.reg_no[1:])))
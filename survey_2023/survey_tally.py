@@ -0,0 +1,122 @@
+"""Single-pass tally engine for the closed-choice survey questions
+
+Multi-select answers are exported as one cell with the selected options
+separated by ", ". Every cell is split into its answers once, the answers are
+looked up in the option set of the question (a dictionary lookup, so an option
+can never be counted as part of a longer one, e.g. "Genomics" in "Clinical
+Genomics") and all survey types are counted together with one bincount.
+
+Categorical answers (the typed survey frame) are counted per distinct answer:
+only the categories are split, the rows are just counted per category.
+"""
+
+import numpy as np
+import pandas as pd
+
+from survey_trace import stage
+
+# How the export separates the answers of a multi-select question
+SEPARATOR = ", "
+
+# Stands in for the separator inside options that contain it while splitting
+_PROTECTED = "\x1f"
+
+
+def split_answers(answers, options):
+    """
+    split_answers splits multi-select cells into one answer per row. The index of
+    the result points back to the position of the cell the answer came from
+    """
+    text = pd.Series(answers, dtype=object).astype(str).reset_index(drop=True)
+    # Options such as "KTH, Royal Institute of Technology" contain the separator
+    protected = [option for option in options if SEPARATOR in option]
+    for option in protected:
+        text = text.str.replace(
+            option, option.replace(SEPARATOR, _PROTECTED), regex=False
+        )
+    tokens = text.str.split(SEPARATOR).explode().str.strip()
+    if protected:
+        tokens = tokens.str.replace(_PROTECTED, SEPARATOR, regex=False)
+    return tokens
+
+
+def tally(answers, groups, options, multi_select=True):
+    """
+    tally counts how often every option was selected within every group (survey type).
+    answers and groups are aligned sequences, groups should be categorical. Returns a
+    zero-filled dataframe with one row per option (in the given order) and one column
+    per group. Answers that are not one of the options are not counted.
+    """
+    options = list(options)
+    groups = pd.Categorical(groups)
+    option_codes = {option: code for code, option in enumerate(options)}
+
+    if isinstance(getattr(answers, "dtype", None), pd.CategoricalDtype):
+        return _tally_categorical(answers, groups, options, multi_select)
+
+    if multi_select:
+        tokens = split_answers(answers, options)
+        rows = tokens.index.to_numpy()
+        codes = tokens.map(option_codes).to_numpy()
+    else:
+        rows = np.arange(len(groups))
+        codes = (
+            pd.Series(answers, dtype=object).astype(str).map(option_codes).to_numpy()
+        )
+
+    group_codes = np.asarray(groups.codes, dtype=np.int64)[rows]
+    counted = ~pd.isna(codes) & (group_codes >= 0)
+    counts = np.bincount(
+        group_codes[counted] * len(options) + codes[counted].astype(np.int64),
+        minlength=len(groups.categories) * len(options),
+    ).reshape(len(groups.categories), len(options))
+
+    return pd.DataFrame(
+        counts.T, index=pd.Index(options), columns=list(groups.categories)
+    )
+
+
+def _tally_categorical(answers, groups, options, multi_select):
+    # Every distinct answer (category) is split and counted once, the rows are only
+    # counted per (group, category), and the two are combined with a matrix product
+    answers = pd.Series(answers)
+    categories = answers.cat.categories
+    per_category = tally(
+        np.asarray(categories, dtype=object),
+        pd.Categorical(np.arange(len(categories))),
+        options,
+        multi_select,
+    ).to_numpy()
+    cells = answers.cat.codes.to_numpy().astype(np.int64)
+    group_codes = np.asarray(groups.codes, dtype=np.int64)
+    counted = (cells >= 0) & (group_codes >= 0)
+    rows = np.bincount(
+        group_codes[counted] * len(categories) + cells[counted],
+        minlength=len(groups.categories) * len(categories),
+    ).reshape(len(groups.categories), len(categories))
+    return pd.DataFrame(
+        per_category @ rows.T, index=pd.Index(options), columns=list(groups.categories)
+    )
+
+
+def tally_questions(frame, questions, group_column="survey_type"):
+    """
+    tally_questions tallies every question of `questions` (name -> (column, options,
+    multi_select)) for every group in `group_column`, and returns name -> tally
+    """
+    groups = frame[group_column]
+    tallies = {}
+    for name, (column, options, multi_select) in questions.items():
+        with stage("tally:" + name):
+            tallies[name] = tally(frame[column], groups, options, multi_select)
+    return tallies
+
+
+def counts(question_tally, group, label):
+    """
+    counts returns the counts of one group as a two column dataframe (label, Count),
+    which is what the plotting functions take
+    """
+    return pd.DataFrame(
+        {label: question_tally.index, "Count": question_tally[group].to_numpy()}
+    )
@@ -0,0 +1,203 @@
+"""Lightweight tracing of where the time goes in the survey scripts
+
+The stages of the scripts (loading, normalising, partitioning, every tally,
+every rendered plot, every parsed svg, every pdf build) are wrapped in
+stage("name") blocks or decorated with @traced("name"). When tracing is on,
+every stage records its wall time, cpu time and the peak memory of the
+process, and at the end of the run the trace is written as json and csv
+(to traces/ by default) and a summary table is printed.
+
+Tracing is switched on with the SURVEY_TRACE environment variable:
+
+    SURVEY_TRACE=1       wall time, cpu time and peak RSS
+    SURVEY_TRACE=memory  also the peak of the memory allocated by python during
+                         every stage (tracemalloc, which slows the run down)
+
+SURVEY_TRACE_DIR sets where the trace files go. When tracing is off, stage()
+hands out one shared no-op context manager and @traced leaves the function
+as it is, so the hooks can stay in for production runs. Only the main process
+is traced, stages run in pool workers are not recorded.
+"""
+
+import atexit
+import contextlib
+import csv
+import datetime
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak RSS is then not recorded
+    resource = None
+
+_setting = os.environ.get("SURVEY_TRACE", "").strip().lower()
+ENABLED = _setting not in ("", "0", "false", "no", "off")
+TRACE_MEMORY = ENABLED and _setting == "memory"
+TRACE_DIR = os.environ.get("SURVEY_TRACE_DIR", "traces")
+
+_NO_TRACE = contextlib.nullcontext()
+
+# Finished stages, in the order they finished
+records = []
+
+# Stages that are running, innermost last, with the highest traced memory seen in them so far
+_open = []
+_started = time.perf_counter()
+
+
+def _peak_rss():
+    if resource is None:
+        return 0
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class _Stage(object):
+    # Records one run of a stage
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if TRACE_MEMORY:
+            current, peak = tracemalloc.get_traced_memory()
+            if _open:
+                _open[-1]["peak"] = max(_open[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+            self.memory_start = current
+        self.frame = {"peak": 0}
+        _open.append(self.frame)
+        self.start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.start
+        cpu = time.process_time() - self.cpu_start
+        _open.pop()
+        record = {
+            "name": self.name,
+            "depth": len(_open),
+            "start": round(self.start - _started, 6),
+            "wall": wall,
+            "cpu": cpu,
+            "peak_rss": _peak_rss(),
+        }
+        if TRACE_MEMORY:
+            peak = max(self.frame["peak"], tracemalloc.get_traced_memory()[1])
+            record["peak_alloc"] = peak - self.memory_start
+            if _open:
+                _open[-1]["peak"] = max(_open[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+        records.append(record)
+        return False
+
+
+def stage(name):
+    """
+    stage returns a context manager that records the block it wraps as a stage called name
+    """
+    if not ENABLED:
+        return _NO_TRACE
+    return _Stage(name)
+
+
+def traced(name=None):
+    """
+    traced is a decorator recording every call of the function as a stage (called name,
+    or the name of the function)
+    """
+
+    def decorate(func):
+        if not ENABLED:
+            return func
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Stage(stage_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def summary():
+    """
+    summary returns the recorded stages grouped by kind (the part of the name before ":"),
+    as rows of (kind, calls, total wall, total cpu, max wall, peak rss)
+    """
+    groups = {}
+    for record in records:
+        kind = record["name"].split(":", 1)[0]
+        group = groups.setdefault(kind, [kind, 0, 0.0, 0.0, 0.0, 0])
+        group[1] += 1
+        group[2] += record["wall"]
+        group[3] += record["cpu"]
+        group[4] = max(group[4], record["wall"])
+        group[5] = max(group[5], record["peak_rss"])
+    return list(groups.values())
+
+
+def print_summary():
+    """
+    print_summary prints the summary table of the recorded stages
+    """
+    rows = summary()
+    if not rows:
+        return
+    width = max(len("stage"), max(len(row[0]) for row in rows))
+    print(
+        "{}  {:>6}  {:>9}  {:>9}  {:>9}  {:>9}".format(
+            "stage".ljust(width), "calls", "wall s", "cpu s", "max s", "rss MB"
+        )
+    )
+    for kind, calls, wall, cpu, longest, rss in rows:
+        print(
+            "{}  {:6d}  {:9.3f}  {:9.3f}  {:9.3f}  {:9.1f}".format(
+                kind.ljust(width), calls, wall, cpu, longest, rss / 2**20
+            )
+        )
+
+
+def write_trace(directory=TRACE_DIR):
+    """
+    write_trace writes the recorded stages to a json and a csv file in directory, named
+    after the script and the time, and returns the two paths
+    """
+    os.makedirs(directory, exist_ok=True)
+    script = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+    base = os.path.join(
+        directory,
+        "{}_{}".format(script, datetime.datetime.now().strftime("%Y%m%d-%H%M%S")),
+    )
+    with open(base + ".json", "w", encoding="utf-8") as fh:
+        json.dump({"script": script, "stages": records}, fh, indent=1)
+    fields = ["name", "depth", "start", "wall", "cpu", "peak_rss"]
+    if TRACE_MEMORY:
+        fields.append("peak_alloc")
+    with open(base + ".csv", "w", encoding="utf-8", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(records)
+    return base + ".json", base + ".csv"
+
+
+def _finish():
+    if records:
+        paths = write_trace()
+        print_summary()
+        print("Trace written to {} and {}".format(*paths))
+
+
+if ENABLED:
+    if TRACE_MEMORY:
+        tracemalloc.start()
+    atexit.register(_finish)
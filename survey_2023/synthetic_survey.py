@@ -0,0 +1,275 @@
+"""Synthetic survey exports for testing and benchmarking
+
+The real survey responses contain personal data, so they can not be used to
+try out or time the scripts. This script writes a workbook with made up
+responses in the exact layout of the export from the Operations Office: a
+title row, the header row and one row per response, with the survey type in
+column 9, the titles in columns 10/18, the platforms in columns 12/26,
+multi-select answers separated by ", " and long free-text descriptions. The
+answers include the spellings the scripts clean up ('Health care',
+'Copenhagen University', 'None of the current platforms').
+
+The workbook is written row by row with openpyxl in write-only mode, so any
+size from a hundred to a million rows can be made without holding it in memory.
+"""
+
+import argparse
+import os
+import random
+
+from openpyxl import Workbook
+
+from survey_options import (
+    CAPABILITY_OPTIONS,
+    POTENTIAL_USERS_OPTIONS,
+    SURVEY_SHEET,
+    SURVEY_TYPES,
+)
+
+# The header row of the export, in column order (the scripts read the columns by position
+# or, in Make_plots.py, by these names)
+HEADERS = [
+    "First name",
+    "Last name",
+    "Position",
+    "Email address",
+    "Affiliation",
+    "Representing",
+    "University",
+    "Affiliation - Other",
+    "Representing - Other",
+    "Survey type",
+    # survey type A
+    "Title of the technology/instrument/service/technological capability",
+    "Brief description of the technology/instrument/service/technological capability",
+    "In which of the existing SciLifeLab Platform(s) would the technology/instrument/service/technological capability fit. https://www.scilifelab.se/services/infrastructure-organization/",
+    "Indicate if the suggested technology/instrument/service/technological capability would considerably contribute to strengthen one or more of the SciLifeLab capabilities and/or the Data Driven Life Science program",
+    "Is the technology currently available as local infrastructure service in Sweden?",
+    "Is the technology currently available as local infrastructure service in Sweden? - Where",
+    "Estimated annual total funding (MSEK) needed from SciLifeLab",
+    "Additional comment (technology)",
+    # survey type B
+    "Name of the facility/unit",
+    "Facility location",
+    "Contact person for the facility",
+    "Contact person email address",
+    "Brief description of the facility",
+    "How is the facility providing infrastructure services today?",
+    "How is the facility providing infrastructure services today? - Other",
+    "Current number of unique users annually",
+    "In which of the existing SciLifeLab Platform(s) would the facility fit",
+    "Indicate if the suggested facility would considerably contribute to strengthen one or more of the SciLifeLab capabilities and/or the Data Driven Life Science program",
+    "Estimate the number of unique annual users if the unit would become a part of the SciLifeLab national infrastructure",
+    "Estimated annual funding (MSEK) needed from SciLifeLab, co-funding and user fee plans",
+    "Additional comment (facility)",
+]
+
+# Answers as they appear in the export (before any cleaning)
+AFFILIATIONS = ["University", "Industry", "Health care", "Governmental organization"]
+UNIVERSITIES = [
+    "Chalmers University of Technology",
+    "Karolinska Institutet",
+    "KTH, Royal Institute of Technology",
+    "Linköping University",
+    "Lund University",
+    "Stockholm University",
+    "Swedish University of Agricultural Sciences",
+    "Umeå University",
+    "University of Gothenburg",
+    "Uppsala University",
+    "Örebro University",
+    "Other Swedish University",
+    "Copenhagen University",
+]
+PLATFORMS = [
+    "Genomics",
+    "Clinical Genomics",
+    "Metabolomics",
+    "Spatial Biology",
+    "Cellular and Molecular Imaging",
+    "Integrated Structural Biology",
+    "Chemical Biology and Genome Engineering",
+    "Clinical Proteomics and Immunology",
+    "Drug Discovery and Development",
+    "Bioinformatics",
+    "I do not know",
+]
+# The "none" answer is phrased differently in the two survey types
+NO_PLATFORM = {
+    "A": "None of the current platforms",
+    "B": "None of the existing platforms",
+}
+POSITIONS = [
+    "Professor",
+    "Senior lecturer",
+    "Researcher",
+    "Facility director",
+    "PhD student",
+    "Research engineer",
+]
+REPRESENTING = ["Myself", "My research group", "My department", "Other"]
+PROVIDING = ["Local core facility", "National infrastructure", "I do not know", "Other"]
+FIRST_NAMES = [
+    "Anna",
+    "Erik",
+    "Maria",
+    "Lars",
+    "Karin",
+    "Johan",
+    "Sofia",
+    "Björn",
+    "Åsa",
+    "Mikael",
+]
+LAST_NAMES = [
+    "Andersson",
+    "Johansson",
+    "Karlsson",
+    "Nilsson",
+    "Eriksson",
+    "Larsson",
+    "Öberg",
+    "Lindqvist",
+]
+CITIES = ["Stockholm", "Uppsala", "Göteborg", "Lund", "Linköping", "Umeå", "Örebro"]
+TOPICS = [
+    "cryo-EM",
+    "single-cell",
+    "mass spectrometry",
+    "spatial omics",
+    "long-read sequencing",
+    "proteomics",
+    "lab automation",
+    "machine learning",
+    "super-resolution imaging",
+    "metabolomics",
+    "organoids",
+    "CRISPR screening",
+]
+KINDS = [
+    "platform",
+    "facility",
+    "service",
+    "pipeline",
+    "core",
+    "unit",
+    "infrastructure",
+]
+SENTENCES = [
+    "The {} capability would serve research groups across the country.",
+    "Today there is no national service offering {} at the scale that is needed.",
+    "Users currently send samples abroad for {}, which is slow and expensive.",
+    "The unit has ten years of experience with {} and a large national user base.",
+    "Funding would cover staff, instrument service contracts and training in {}.",
+    "Integration with existing platforms would make {} available to clinical projects.",
+    "Demand for {} has doubled over the last three years.",
+    "Data from {} experiments would be handled together with the bioinformatics support.",
+]
+
+
+def _pick(rng, options, most=2):
+    return ", ".join(rng.sample(options, rng.randint(1, most)))
+
+
+def _text(rng, topic, sentences):
+    # Free text of about 15 words per sentence, with the odd paragraph break
+    parts = []
+    for n in range(sentences):
+        parts.append(rng.choice(SENTENCES).format(topic))
+        if n % 5 == 4:
+            parts.append("\n")
+    return " ".join(parts).replace(" \n ", "\n")
+
+
+def survey_row(rng, n, survey_type, description_sentences=12):
+    """
+    survey_row returns one made up response of survey_type ("A" or "B") as a list of cell values
+    """
+    row = [None] * len(HEADERS)
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    row[0], row[1], row[2] = first, last, rng.choice(POSITIONS)
+    row[3] = "{}.{}{}@example.se".format(first.lower(), last.lower(), n)
+    affiliation = _pick(rng, AFFILIATIONS)
+    row[4] = affiliation
+    row[5] = rng.choice(REPRESENTING)
+    if "University" in affiliation:
+        row[6] = _pick(rng, UNIVERSITIES)
+    if rng.random() < 0.05:
+        row[7] = "Research institute"
+    if row[5] == "Other":
+        row[8] = "A national research network"
+    row[9] = SURVEY_TYPES[survey_type]
+    topic = rng.choice(TOPICS)
+    title = "{} {} {}".format(topic, rng.choice(KINDS), n)
+    description = _text(
+        rng, topic, rng.randint(description_sentences // 2, description_sentences * 2)
+    )
+    platforms = _pick(rng, PLATFORMS + [NO_PLATFORM[survey_type]])
+    capabilities = _pick(rng, CAPABILITY_OPTIONS)
+    funding = "{} MSEK per year. ".format(rng.randint(1, 20)) + _text(rng, topic, 2)
+    comment = _text(rng, topic, rng.randint(0, 3)) or "None"
+    if survey_type == "A":
+        row[10], row[11], row[12], row[13] = title, description, platforms, capabilities
+        row[14] = rng.choice(["Yes", "No"])
+        if row[14] == "Yes":
+            row[15] = rng.choice(CITIES)
+        row[16], row[17] = funding, comment
+    else:
+        row[18], row[19] = title, rng.choice(CITIES)
+        row[20] = "{} {}".format(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))
+        row[21] = "contact{}@example.se".format(n)
+        row[22] = description
+        row[23] = rng.choice(PROVIDING)
+        if row[23] == "Other":
+            row[24] = "Regional collaboration"
+        row[25] = rng.randint(5, 500)
+        row[26], row[27] = platforms, capabilities
+        row[28] = rng.choice(POTENTIAL_USERS_OPTIONS)
+        row[29], row[30] = funding, comment
+    return row
+
+
+def write_survey(path, rows, seed=1, share_a=0.6, description_sentences=12):
+    """
+    write_survey writes a synthetic export with `rows` responses to path (about
+    share_a of them of survey type A). The same seed always gives the same responses
+    """
+    rng = random.Random(seed)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(SURVEY_SHEET)
+    ws.append(["SciLifeLab infrastructure survey - synthetic export"])
+    ws.append(HEADERS)
+    for n in range(rows):
+        survey_type = "A" if rng.random() < share_a else "B"
+        ws.append(survey_row(rng, n, survey_type, description_sentences))
+    wb.save(path)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic survey export")
+    parser.add_argument("rows", type=int, help="number of responses")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="Survey.xlsx",
+        help="file to write (default Survey.xlsx)",
+    )
+    parser.add_argument("--seed", type=int, default=1, help="random seed (default 1)")
+    parser.add_argument(
+        "--share-a",
+        type=float,
+        default=0.6,
+        help="share of survey type A responses (default 0.6)",
+    )
+    parser.add_argument(
+        "--sentences",
+        type=int,
+        default=12,
+        help="typical number of sentences in a description (default 12)",
+    )
+    args = parser.parse_args()
+    write_survey(args.output, args.rows, args.seed, args.share_a, args.sentences)
@@ -0,0 +1,60 @@
+import os
+
+from build_manifest import BuildManifest
+
+
+def build(manifest, outputs, force=False):
+    # One run: the outputs (name -> digest) that need it are "built", returns their names
+    built = []
+    for output, digest in outputs.items():
+        if manifest.needs_build(output, digest, force):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+            with open(output, "w") as fh:
+                fh.write(digest)
+            built.append(output)
+    manifest.finish()
+    return built
+
+
+def test_only_changed_outputs_are_built(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    outputs = {os.path.join("Pdfs", "1.pdf"): "a", os.path.join("Pdfs", "2.pdf"): "b"}
+    assert build(BuildManifest("manifest.json"), outputs) == list(outputs)
+
+    manifest = BuildManifest("manifest.json")
+    assert build(manifest, outputs) == []
+    assert manifest.summary() == "0 rebuilt, 2 unchanged, 0 removed"
+
+    changed = dict(outputs)
+    changed[os.path.join("Pdfs", "2.pdf")] = "c"
+    assert build(BuildManifest("manifest.json"), changed) == [
+        os.path.join("Pdfs", "2.pdf")
+    ]
+    assert build(BuildManifest("manifest.json"), changed, force=True) == list(changed)
+
+
+def test_missing_output_is_built_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    outputs = {os.path.join("Pdfs", "1.pdf"): "a"}
+    build(BuildManifest("manifest.json"), outputs)
+    os.remove(os.path.join("Pdfs", "1.pdf"))
+    assert build(BuildManifest("manifest.json"), outputs) == list(outputs)
+
+
+def test_kept_outputs_survive_and_dropped_ones_are_removed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    kept = os.path.join("Pdfs", "A", "1.pdf")
+    dropped = os.path.join("Pdfs", "B", "2.pdf")
+    build(BuildManifest("manifest.json"), {kept: "a", dropped: "b"})
+
+    # kept is not looked at in this run, dropped is no longer part of the plan
+    manifest = BuildManifest("manifest.json")
+    manifest.keep(kept)
+    manifest.finish()
+    assert os.path.isfile(kept)
+    assert not os.path.exists(dropped)
+    assert not os.path.isdir(os.path.join("Pdfs", "B"))
+    assert manifest.removed == [dropped]
+
+    # and kept is still in the manifest, so an unchanged run does not build it
+    assert build(BuildManifest("manifest.json"), {kept: "a"}) == []
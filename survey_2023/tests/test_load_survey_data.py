@@ -0,0 +1,83 @@
+import random
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from Make_plots import CROSSTAB_QUESTIONS, CROSSTABS
+from survey_crosstab import CrossTab
+from survey_loading import QUESTIONS, load_survey_data, partition_survey_types
+from survey_responses import survey_type_column
+from survey_tally import tally_questions
+from synthetic_survey import HEADERS, SURVEY_SHEET, survey_row, write_survey
+
+
+def loaded(typed):
+    frame = load_survey_data("Survey.xlsx", typed=typed)
+    survey_types = partition_survey_types(frame)
+    return frame, survey_types
+
+
+def test_typed_loading_gives_the_same_tallies(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_survey("Survey.xlsx", 300)
+    typed, typed_types = loaded(True)
+    plain, plain_types = loaded(False)
+    assert any(isinstance(t, pd.CategoricalDtype) for t in typed.dtypes)
+    assert {k: v.tolist() for k, v in typed_types.items()} == {
+        k: v.tolist() for k, v in plain_types.items()
+    }
+
+    typed_tallies = tally_questions(typed, QUESTIONS)
+    plain_tallies = tally_questions(plain, QUESTIONS)
+    for question in QUESTIONS:
+        pd.testing.assert_frame_equal(
+            typed_tallies[question], plain_tallies[question], check_dtype=False
+        )
+    assert typed.attrs["normalisation"] == plain.attrs["normalisation"]
+
+    typed_crosstab = CrossTab(typed, CROSSTAB_QUESTIONS)
+    plain_crosstab = CrossTab(plain, CROSSTAB_QUESTIONS)
+    for row_question, column_question, _ in CROSSTABS.values():
+        pd.testing.assert_frame_equal(
+            typed_crosstab.table(row_question, column_question),
+            plain_crosstab.table(row_question, column_question),
+            check_dtype=False,
+        )
+
+
+def write_moved_export(path, rows=40):
+    # The columns in another order, the survey type question first
+    rng = random.Random(1)
+    order = [9] + [c for c in range(len(HEADERS)) if c != 9]
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(SURVEY_SHEET)
+    ws.append(["SciLifeLab infrastructure survey - synthetic export"])
+    ws.append([HEADERS[c] for c in order])
+    for n in range(rows):
+        row = survey_row(rng, n, "AB"[n % 3 == 0])
+        ws.append([row[c] for c in order])
+    wb.save(path)
+
+
+def test_survey_type_column_is_found_by_its_answers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_survey("Survey.xlsx", 40)
+    write_moved_export("Moved.xlsx")
+    assert survey_type_column("Survey.xlsx") == 9
+    assert survey_type_column("Moved.xlsx") == 0
+    frame = load_survey_data("Moved.xlsx")
+    survey_types = partition_survey_types(frame)
+    assert len(survey_types["A"]) == 26 and len(survey_types["B"]) == 14
+
+
+def test_export_without_survey_types_fails(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(SURVEY_SHEET)
+    ws.append(["title"])
+    ws.append(HEADERS)
+    ws.append(["answer"] * len(HEADERS))
+    wb.save("Other.xlsx")
+    with pytest.raises(ValueError, match="survey type"):
+        load_survey_data("Other.xlsx")
@@ -0,0 +1,86 @@
+import random
+
+import numpy as np
+import pytest
+from openpyxl import Workbook
+
+import near_duplicates
+from near_duplicates import (
+    candidate_pairs,
+    find_clusters,
+    history_exports,
+    related_proposals,
+    signatures,
+)
+from synthetic_survey import HEADERS, SURVEY_SHEET, survey_row
+
+
+def test_identical_signatures_pair_with_the_first_only():
+    texts = ["the same boilerplate description of a facility"] * 50 + [
+        "a cryo electron microscopy unit for structural biology"
+    ]
+    first, second = candidate_pairs(signatures(texts))
+    assert len(first) == 49
+    assert set(first.tolist()) == {0}
+    assert find_clusters(len(texts), first, second) == [list(range(50))]
+
+
+def test_large_buckets_are_skipped(capsys):
+    # Every distinct text shares its first words, so all of them share some band values
+    texts = ["shared opening words of every proposal {}".format(n) for n in range(30)]
+    sig = signatures(texts)
+    assert len(candidate_pairs(sig)[0]) > 0
+    first, second = candidate_pairs(sig, max_bucket=5)
+    assert len(first) < 30 * 29 // 2
+    assert "skipped" in capsys.readouterr().out
+    assert (first < second).all()
+    assert np.array_equal(np.unique(first * 30 + second), first * 30 + second)
+
+
+def write_export(path, sheet, title_row, rows=12):
+    rng = random.Random(1)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet)
+    if title_row:
+        ws.append(["SciLifeLab infrastructure survey - synthetic export"])
+    ws.append(HEADERS)
+    for n in range(rows):
+        ws.append(survey_row(rng, n, "AB"[n % 2]))
+    wb.save(path)
+
+
+def test_history_export_with_its_own_sheet_and_header(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_export("Survey.xlsx", SURVEY_SHEET, True)
+    # An earlier year's export: another sheet name and no title row above the header
+    write_export("old.xlsx", "Form Responses 1", False)
+    related = related_proposals(
+        "Survey.xlsx", history=[("2022", "old.xlsx", "Form Responses 1", "0")]
+    )
+    assert len(related) == 12
+    for reg_no, entry in related.items():
+        assert ("2022", reg_no) in [(label, reg) for label, reg, title in entry["related"]]
+
+
+def test_history_exports():
+    assert history_exports([["2022", "old.xlsx"], ["2021", "a.xlsx", "Form", "0"]]) == [
+        ("2022", "old.xlsx", None, 1),
+        ("2021", "a.xlsx", "Form", 0),
+    ]
+    with pytest.raises(ValueError):
+        history_exports([["2022", "old.xlsx", "Form"]])
+
+
+def test_clusters_are_cached(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_export("Survey.xlsx", SURVEY_SHEET, True)
+    history = [("2022", "Survey.xlsx")]
+    assert related_proposals("Survey.xlsx", history=history, detect=False) == {}
+    related = related_proposals("Survey.xlsx", history=history)
+    assert related
+
+    # Unchanged exports: no MinHash work, not even with detect=False
+    monkeypatch.setattr(near_duplicates, "similar_pairs", None)
+    monkeypatch.setattr(near_duplicates, "export_signatures", None)
+    assert related_proposals("Survey.xlsx", history=history) == related
+    assert related_proposals("Survey.xlsx", history=history, detect=False) == related
@@ -0,0 +1,71 @@
+import os
+import random
+import subprocess
+import sys
+
+from openpyxl import Workbook
+
+from conftest import SCRIPT_DIR
+from search_index import query_text, search, survey_index
+from survey_responses import SURVEY_COLUMNS
+from synthetic_survey import HEADERS, SURVEY_SHEET, survey_row
+
+
+def write_export(path, rows=30):
+    # A synthetic export in which every third description mentions mass spectrometry proteomics
+    rng = random.Random(1)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(SURVEY_SHEET)
+    ws.append(["SciLifeLab infrastructure survey - synthetic export"])
+    ws.append(HEADERS)
+    for n in range(rows):
+        survey_type = "AB"[n % 2]
+        row = survey_row(rng, n, survey_type)
+        if n % 3 == 0:
+            row[
+                SURVEY_COLUMNS[survey_type]["description"]
+            ] = "Proteomics by mass spectrometry for clinical projects."
+        ws.append(row)
+    wb.save(path)
+
+
+def test_query_text_keeps_quoted_phrases():
+    assert query_text(['"mass spec*"', "proteomics"]) == '"mass spec*" proteomics'
+    assert query_text(["mass spec*", "proteomics"]) == '"mass spec*" proteomics'
+    assert query_text(["cryo-EM"]) == "cryo-EM"
+
+
+def test_cli_documented_phrase_query(tmp_path, monkeypatch):
+    # python search_index.py '"mass spec*"' proteomics --field description
+    write_export(str(tmp_path / "Survey.xlsx"))
+    result = subprocess.run(
+        [
+            sys.executable,
+            os.path.join(SCRIPT_DIR, "search_index.py"),
+            '"mass spec*"',
+            "proteomics",
+            "--field",
+            "description",
+        ],
+        cwd=str(tmp_path),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    monkeypatch.chdir(tmp_path)
+    hits = search(survey_index(), '"mass spec*" proteomics', ["description"])
+    assert len(hits) == 10
+    assert result.stdout.splitlines()[-1] == "10 proposal(s)"
+
+
+def test_index_pdfs_follow_output_dir(tmp_path, monkeypatch):
+    write_export(str(tmp_path / "Survey.xlsx"))
+    monkeypatch.chdir(tmp_path)
+    assert survey_index()["docs"][0]["pdfs"][0].startswith("Pdfs" + os.sep)
+    index = survey_index(output_dir=os.path.join("out", "Pdfs"))
+    assert index["source"]["output_dir"] == os.path.join("out", "Pdfs")
+    assert all(
+        pdf.startswith(os.path.join("out", "Pdfs") + os.sep)
+        for doc in index["docs"]
+        for pdf in doc["pdfs"]
+    )
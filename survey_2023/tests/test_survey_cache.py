@@ -0,0 +1,52 @@
+import os
+
+import survey_cache
+from survey_cache import read_survey_rows
+from synthetic_survey import SURVEY_SHEET, write_survey
+
+
+def test_workbooks_do_not_evict_each_other(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_survey("Survey.xlsx", 20)
+    write_survey(os.path.join("Data", "old.xlsx"), 10, seed=2)
+    current = read_survey_rows("Survey.xlsx", min_row=3)
+    read_survey_rows(os.path.join("Data", "old.xlsx"), min_row=3)
+    assert len(os.listdir(survey_cache.CACHE_DIR)) == 2
+
+    # Served from the cache, the workbook is not parsed again
+    monkeypatch.setattr("openpyxl.load_workbook", None)
+    assert read_survey_rows("Survey.xlsx", min_row=3) == current
+
+
+def test_new_version_replaces_the_entry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_survey("Survey.xlsx", 20)
+    read_survey_rows("Survey.xlsx", min_row=3)
+    write_survey("Survey.xlsx", 25)
+    assert len(read_survey_rows("Survey.xlsx", min_row=3)) == 25
+    assert len(os.listdir(survey_cache.CACHE_DIR)) == 1
+
+
+def test_rows_and_frame_share_one_entry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_survey("Survey.xlsx", 20)
+    rows = read_survey_rows("Survey.xlsx", min_row=3)
+    frame = survey_cache.read_survey_frame("Survey.xlsx", SURVEY_SHEET, 1)
+    assert len(os.listdir(survey_cache.CACHE_DIR)) == 1
+    assert [row[10] for row in rows] == [
+        value if value else "None" for value in frame.iloc[:, 10]
+    ]
+
+
+def test_export_is_hashed_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_survey("Survey.xlsx", 20)
+    hashed = []
+    file_digest = survey_cache.file_digest
+    monkeypatch.setattr(
+        survey_cache, "file_digest", lambda path: hashed.append(path) or file_digest(path)
+    )
+    survey_cache.survey_columns("Survey.xlsx", SURVEY_SHEET, 1)
+    survey_cache.read_survey_frame("Survey.xlsx", SURVEY_SHEET, 1)
+    read_survey_rows("Survey.xlsx", min_row=3)
+    assert hashed == ["Survey.xlsx"]
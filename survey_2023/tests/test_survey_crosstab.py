@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+from survey_crosstab import CrossTab, indicator_matrix
+from survey_tally import tally
+
+PLATFORMS = ["Genomics", "Clinical Genomics", "Bioinformatics"]
+CAPABILITIES = ["Precision Medicine", "Data Driven Life Science", "None"]
+USERS = ["1-10", "10-50", "More than 50"]
+
+FRAME = pd.DataFrame(
+    {
+        "Platform_fits": [
+            "Genomics, Bioinformatics",
+            "Clinical Genomics",
+            "Bioinformatics",
+            "Genomics",
+            "Something else",
+            "Genomics, Clinical Genomics",
+        ],
+        "Capability_fits": [
+            "Precision Medicine, Data Driven Life Science",
+            "Precision Medicine",
+            "None",
+            "Data Driven Life Science",
+            "None",
+            "Precision Medicine",
+        ],
+        "potential_users": ["1-10", "10-50", "1-10", "More than 50", "10-50", ""],
+    }
+)
+
+QUESTIONS = {
+    "platform_fit": ("Platform_fits", PLATFORMS, True),
+    "capability_fit": ("Capability_fits", CAPABILITIES, True),
+    "potential_users": ("potential_users", USERS, False),
+}
+
+
+def expected(row_question, column_question, frame=FRAME):
+    # pd.crosstab of the answers, with the multi-select cells exploded into one row per option
+    row_column, row_options, row_multi = QUESTIONS[row_question]
+    column_column, column_options, column_multi = QUESTIONS[column_question]
+    pairs = pd.DataFrame(
+        {
+            "row": frame[row_column].str.split(", ") if row_multi else frame[row_column],
+            "column": frame[column_column].str.split(", ")
+            if column_multi
+            else frame[column_column],
+        }
+    )
+    pairs = pairs.explode("row").explode("column")
+    pairs = pairs[pairs["row"].isin(row_options) & pairs["column"].isin(column_options)]
+    table = pd.crosstab(pairs["row"], pairs["column"])
+    return table.reindex(index=row_options, columns=column_options, fill_value=0)
+
+
+def test_indicator_matrix():
+    matrix = indicator_matrix(FRAME["Platform_fits"], PLATFORMS).toarray()
+    assert matrix.tolist() == [
+        [1, 0, 1],
+        [0, 1, 0],
+        [0, 0, 1],
+        [1, 0, 0],
+        [0, 0, 0],
+        [1, 1, 0],
+    ]
+
+
+def test_same_as_pandas_crosstab():
+    for frame in [FRAME, FRAME.astype("category")]:
+        crosstab = CrossTab(frame, QUESTIONS)
+        for row_question, column_question in [
+            ("platform_fit", "capability_fit"),
+            ("platform_fit", "potential_users"),
+            ("potential_users", "capability_fit"),
+        ]:
+            assert np.array_equal(
+                crosstab.table(row_question, column_question).to_numpy(),
+                expected(row_question, column_question, frame.astype(str)).to_numpy(),
+            )
+
+
+def test_rows_select_the_responses():
+    crosstab = CrossTab(FRAME, QUESTIONS)
+    rows = np.array([0, 2, 4])
+    assert np.array_equal(
+        crosstab.table("platform_fit", "capability_fit", rows).to_numpy(),
+        expected("platform_fit", "capability_fit", FRAME.iloc[rows]).to_numpy(),
+    )
+
+
+def test_margins_are_the_tallies():
+    # A cell that repeats an option counts it twice, in the tallies and the cross-tabs alike
+    frame = pd.DataFrame(
+        {
+            "Platform_fits": ["Genomics, Genomics", "Genomics, Bioinformatics", ""],
+            "survey_type": pd.Categorical(["A", "A", "B"]),
+        }
+    )
+    questions = dict(QUESTIONS, survey_type=("survey_type", ["A", "B"], False))
+    table = CrossTab(frame, questions).table("platform_fit", "survey_type")
+    counted = tally(frame["Platform_fits"], frame["survey_type"], PLATFORMS)
+    assert counted.loc["Genomics", "A"] == 3
+    assert np.array_equal(table.to_numpy(), counted.to_numpy())
+    assert np.array_equal(
+        indicator_matrix(frame["Platform_fits"], PLATFORMS).sum(axis=0).A1,
+        counted.sum(axis=1).to_numpy(),
+    )
@@ -0,0 +1,119 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+from conftest import SCRIPT_DIR
+from survey_loading import load_survey_data
+from survey_normalise import ALL_YEARS, Rule, normalise_answers, year_rules
+from synthetic_survey import write_survey
+
+RULES = {
+    ALL_YEARS: [Rule("health_care", ["Affiliation"], "Health care", "Healthcare")],
+    2023: [
+        Rule(
+            "copenhagen_university",
+            ["Affiliation"],
+            "Copenhagen University",
+            "Other University",
+        )
+    ],
+    2022: [
+        Rule(
+            "none_platform",
+            ["Platform_fits"],
+            "current platforms",
+            "existing platforms",
+            pattern=True,
+        )
+    ],
+}
+
+
+def test_year_rules():
+    assert [rule.name for rule in year_rules(2023, RULES)] == [
+        "health_care",
+        "copenhagen_university",
+    ]
+    assert [rule.name for rule in year_rules("2022", RULES)] == [
+        "health_care",
+        "none_platform",
+    ]
+    assert [rule.name for rule in year_rules(2021, RULES)] == ["health_care"]
+    assert [rule.name for rule in year_rules(None, RULES)] == ["health_care"]
+
+
+def test_whole_answers_in_the_named_columns_only():
+    frame = pd.DataFrame(
+        {
+            "Affiliation": [
+                "Health care",
+                "Health care, Industry",
+                "Health care services",
+                "Copenhagen University",
+                "Health care",
+            ],
+            "University": ["Health care"] * 5,
+        }
+    )
+    changed = normalise_answers(frame, year_rules(2023, RULES))
+    assert frame["Affiliation"].tolist() == [
+        "Healthcare",
+        "Healthcare, Industry",
+        "Health care services",
+        "Other University",
+        "Healthcare",
+    ]
+    assert frame["University"].tolist() == ["Health care"] * 5
+    assert changed == {"health_care": 3, "copenhagen_university": 1}
+
+
+def test_pattern_rules_and_counts():
+    frame = pd.DataFrame(
+        {
+            "Platform_fits": pd.Categorical(
+                [
+                    "None of the current platforms",
+                    "Genomics",
+                    "None of the current platforms",
+                    "None of the existing platforms",
+                ]
+            )
+        }
+    )
+    changed = normalise_answers(frame, year_rules(2022, RULES))
+    assert frame["Platform_fits"].astype(str).tolist() == [
+        "None of the existing platforms",
+        "Genomics",
+        "None of the existing platforms",
+        "None of the existing platforms",
+    ]
+    # a rule that does not match anything is reported with 0 cells
+    assert changed == {"health_care": 0, "none_platform": 2}
+
+
+def test_cli_reports_the_changed_cells(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_survey("Survey.xlsx", 200)
+    result = subprocess.run(
+        [
+            sys.executable,
+            os.path.join(SCRIPT_DIR, "survey_normalise.py"),
+            "-i",
+            "Survey.xlsx",
+            "--year",
+            "2023",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    reported = {
+        line.split()[0]: int(line.split()[1]) for line in result.stdout.splitlines()
+    }
+    frame = load_survey_data("Survey.xlsx", typed=False, year=2023)
+    assert reported == frame.attrs["normalisation"]
+    assert reported["health_care"] > 0
+    assert reported["copenhagen_university"] > 0
+    assert (frame["Affiliation"].str.split(", ").explode() != "Health care").all()
@@ -0,0 +1,73 @@
+import re
+
+import pandas as pd
+
+from survey_tally import split_answers, tally
+
+OPTIONS = [
+    "Genomics",
+    "Clinical Genomics",
+    "KTH, Royal Institute of Technology",
+    "Bioinformatics",
+    "I do not know",
+]
+
+ANSWERS = [
+    "Genomics, Bioinformatics",
+    "Clinical Genomics",
+    "KTH, Royal Institute of Technology, Genomics",
+    "Bioinformatics",
+    "Something else",
+    "KTH, Royal Institute of Technology",
+]
+GROUPS = ["A", "A", "B", "B", "A", "B"]
+
+
+def old_tally(answers, options):
+    # The counting of Make_plots.py before the tally engine: every match of the options
+    # (regular expression alternation) is counted, then merged with zero counts
+    matches = (
+        pd.Series(answers)
+        .str.extractall("({})".format("|".join(re.escape(o) for o in options)))
+        .iloc[:, 0]
+        .value_counts()
+    )
+    return {option: int(matches.get(option, 0)) for option in options}
+
+
+def test_options_are_matched_exactly():
+    counted = tally(["Clinical Genomics", "Clinical Genomics"], ["A", "A"], OPTIONS)
+    assert counted.loc["Clinical Genomics", "A"] == 2
+    assert counted.loc["Genomics", "A"] == 0
+
+
+def test_options_with_the_separator_stay_whole():
+    tokens = split_answers(["KTH, Royal Institute of Technology, Genomics"], OPTIONS)
+    assert tokens.tolist() == ["KTH, Royal Institute of Technology", "Genomics"]
+    assert (tokens.index == 0).all()
+
+
+def test_zero_filled_in_option_order():
+    counted = tally(["Bioinformatics"], pd.Categorical(["B"], categories=["A", "B"]), OPTIONS)
+    assert counted.index.tolist() == OPTIONS
+    assert counted.columns.tolist() == ["A", "B"]
+    assert counted["A"].tolist() == [0, 0, 0, 0, 0]
+    assert counted["B"].tolist() == [0, 0, 0, 1, 0]
+
+
+def test_single_select_counts_whole_answers():
+    counted = tally(["1-10", "1-10, 10-50", "10-50"], ["B"] * 3, ["1-10", "10-50"], False)
+    assert counted["B"].tolist() == [1, 1]
+
+
+def test_categorical_answers_count_the_same():
+    plain = tally(ANSWERS, GROUPS, OPTIONS)
+    typed = tally(pd.Series(ANSWERS, dtype="category"), GROUPS, OPTIONS)
+    pd.testing.assert_frame_equal(plain, typed, check_dtype=False)
+
+
+def test_same_counts_as_the_old_algorithm():
+    counted = tally(ANSWERS, GROUPS, OPTIONS)
+    for group in ["A", "B"]:
+        answers = [a for a, g in zip(ANSWERS, GROUPS) if g == group]
+        assert counted[group].to_dict() == old_tally(answers, OPTIONS)
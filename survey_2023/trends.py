@@ -0,0 +1,325 @@
+"""Year-over-year trends of the survey
+
+The standard tallies (affiliation, platform fit, capability fit and potential
+users, per survey type) and the number of proposals of every year's export
+are computed once and stored in Trends/aggregates/<year>.json, together with
+the hash of the export they came from. The comparison tables
+(Trends/trends.xlsx) and charts (Trends/<question>_<type>.svg) are made from
+these aggregates alone, so adding a year only parses that year's export.
+
+An aggregate is only made again when its export is still there and has
+changed, or when the loading and tallying code changed. Exports of earlier
+years can be archived once their aggregate is made.
+"""
+
+import argparse
+import json
+import os
+
+import pandas as pd
+
+from survey_cache import file_digest, source_digest
+
+TREND_DIR = "Trends"
+AGGREGATE_DIR = os.path.join(TREND_DIR, "aggregates")
+
+# The loading and tallying code the aggregates are computed with, a change to any of these
+# makes them stale. Make_plots.py is not hashed, so changing a plot does not make every year
+# parse its export again
+AGGREGATE_CODE_FILES = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    for name in [
+        "survey_loading.py",
+        "survey_responses.py",
+        "survey_options.py",
+        "survey_normalise.py",
+        "survey_tally.py",
+        "survey_cache.py",
+    ]
+]
+
+# Bar colours of the years, the most recent year first
+YEAR_COLOURS = ["#A7C947", "#4C979F", "#045C64", "#491F53", "#D3E4A3", "#A6ACAF"]
+
+
+def aggregate_version():
+    """
+    aggregate_version returns a digest of the code the aggregates are computed with
+    """
+    return "".join(file_digest(f)[:16] for f in AGGREGATE_CODE_FILES)
+
+
+def _aggregate_file(year):
+    return os.path.join(AGGREGATE_DIR, "{}.json".format(year))
+
+
+def aggregate_year(year, path, sheet_name, header):
+    """
+    aggregate_year parses one year's export, tallies it and stores the aggregate
+    """
+    from survey_loading import QUESTIONS, load_survey_data, partition_survey_types
+    from survey_tally import tally_questions
+
+    frame = load_survey_data(path, sheet_name, header, year=year)
+    survey_types = partition_survey_types(frame)
+    tallies = tally_questions(frame, QUESTIONS)
+    aggregate = {
+        "year": str(year),
+        "source": dict(
+            path=path, sheet_name=sheet_name, header=header, sha256=source_digest(path)
+        ),
+        "version": aggregate_version(),
+        "counts": {name: int(len(rows)) for name, rows in survey_types.items()},
+        "tallies": {
+            question: {
+                survey_type: {
+                    str(option): int(count)
+                    for option, count in tally[survey_type].items()
+                }
+                for survey_type in tally.columns
+            }
+            for question, tally in tallies.items()
+        },
+    }
+    os.makedirs(AGGREGATE_DIR, exist_ok=True)
+    filename = _aggregate_file(year)
+    with open(filename + ".tmp", "w", encoding="utf-8") as fh:
+        json.dump(aggregate, fh, indent=1, ensure_ascii=False)
+    os.replace(filename + ".tmp", filename)
+    return aggregate
+
+
+def _is_stale(aggregate):
+    # Only aggregates that can be made again are ever stale
+    path = aggregate["source"]["path"]
+    if not os.path.isfile(path):
+        return False
+    return (
+        aggregate["version"] != aggregate_version()
+        or source_digest(path) != aggregate["source"]["sha256"]
+    )
+
+
+def load_aggregates():
+    """
+    load_aggregates returns the aggregates of all years (year -> aggregate, oldest first).
+    Stale aggregates whose export is still there are made again
+    """
+    aggregates = {}
+    if not os.path.isdir(AGGREGATE_DIR):
+        return aggregates
+    for entry in sorted(os.listdir(AGGREGATE_DIR)):
+        if not entry.endswith(".json"):
+            continue
+        with open(os.path.join(AGGREGATE_DIR, entry), encoding="utf-8") as fh:
+            aggregate = json.load(fh)
+        if _is_stale(aggregate):
+            source = aggregate["source"]
+            aggregate = aggregate_year(
+                aggregate["year"],
+                source["path"],
+                source["sheet_name"],
+                source["header"],
+            )
+        aggregates[aggregate["year"]] = aggregate
+    return aggregates
+
+
+def trend_tables(aggregates):
+    """
+    trend_tables returns one dataframe per question, with the options as rows and the
+    count and share of proposals of every (year, survey type) as columns
+    """
+    tables = {}
+    questions = []
+    for aggregate in aggregates.values():
+        questions += [q for q in aggregate["tallies"] if q not in questions]
+    for question in questions:
+        # options keep the order of the most recent year, options only earlier years had come after
+        options = []
+        for aggregate in reversed(list(aggregates.values())):
+            for counts in aggregate["tallies"].get(question, {}).values():
+                options += [o for o in counts if o not in options]
+        columns = {}
+        for year, aggregate in aggregates.items():
+            for survey_type, counts in aggregate["tallies"].get(question, {}).items():
+                total = aggregate["counts"][survey_type]
+                # e.g. potential users is only asked in survey type B
+                if total == 0 or not any(counts.values()):
+                    continue
+                counts = pd.Series(counts, dtype="int64")
+                columns[(year, survey_type, "Count")] = counts
+                columns[(year, survey_type, "Share")] = (counts / total).round(3)
+        table = pd.DataFrame(columns, index=options)
+        table.columns.names = ["Year", "Survey type", ""]
+        tables[question] = table.fillna(0)
+    return tables
+
+
+def write_tables(tables, aggregates, filename=os.path.join(TREND_DIR, "trends.xlsx")):
+    """
+    write_tables writes the number of proposals and the trend table of every question to an Excel file
+    """
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    proposals = pd.DataFrame(
+        {year: aggregate["counts"] for year, aggregate in aggregates.items()}
+    ).T
+    proposals.index.name = "Year"
+    with pd.ExcelWriter(filename, engine="openpyxl") as writer:
+        proposals.to_excel(writer, sheet_name="proposals")
+        for question, table in tables.items():
+            table.to_excel(writer, sheet_name=question)
+    return filename
+
+
+def trend_chart(table, question, survey_type, queue):
+    """
+    trend_chart queues a horizontal bar chart comparing the share of proposals choosing
+    every option across the years, for one question and survey type
+    """
+    import plotly.graph_objects as go
+
+    years = [
+        y
+        for y in table.columns.get_level_values(0).unique()
+        if (y, survey_type, "Share") in table
+    ]
+    if not years:
+        return None
+    fig = go.Figure()
+    # the most recent year is drawn on top of every option
+    for n, year in enumerate(years):
+        colour = YEAR_COLOURS[(len(years) - 1 - n) % len(YEAR_COLOURS)]
+        fig.add_trace(
+            go.Bar(
+                name=year,
+                y=table.index,
+                x=table[(year, survey_type, "Share")] * 100,
+                orientation="h",
+                marker=dict(color=colour, line=dict(color="#000000", width=1)),
+            )
+        )
+    fig.update_layout(
+        barmode="group",
+        plot_bgcolor="white",
+        font=dict(size=23),
+        width=1100,
+        height=700 + 20 * len(table.index) * (len(years) - 1),
+        legend=dict(traceorder="reversed"),
+    )
+    fig.update_yaxes(
+        title=" ",
+        linecolor="black",
+        categoryorder="array",
+        categoryarray=list(table.index)[::-1],
+        ticktext=["<b>{}</b>".format(o) for o in table.index],
+        tickvals=list(table.index),
+    )
+    fig.update_xaxes(
+        title="% of proposals",
+        showgrid=True,
+        gridcolor="black",
+        linecolor="black",
+        rangemode="tozero",
+    )
+    path = os.path.join(TREND_DIR, "{}_{}.svg".format(question, survey_type))
+    queue.add(fig, path)
+    return fig
+
+
+def stored_source(year):
+    """
+    stored_source returns the source (path, sheet_name, header, sha256) of the stored
+    aggregate of a year, or None when the year was not added before
+    """
+    filename = _aggregate_file(year)
+    if not os.path.isfile(filename):
+        return None
+    with open(filename, encoding="utf-8") as fh:
+        return json.load(fh)["source"]
+
+
+def make_trends(years=()):
+    """
+    make_trends adds the exports in years (tuples of year, path, sheet_name, header),
+    then makes the trend tables and charts of all years from the stored aggregates
+    """
+    from render_queue import RenderCache, RenderQueue
+
+    for year, path, sheet_name, header in years:
+        aggregate_year(year, path, sheet_name, header)
+    aggregates = load_aggregates()
+    if not aggregates:
+        print("No years to compare, add one with --year")
+        return None
+    tables = trend_tables(aggregates)
+    write_tables(tables, aggregates)
+    queue = RenderQueue(
+        cache=RenderCache(os.path.join(TREND_DIR, ".render_cache.json"))
+    )
+    for question, table in tables.items():
+        for survey_type in sorted(set(table.columns.get_level_values(1))):
+            trend_chart(table, question, survey_type, queue)
+    queue.flush()
+    return tables
+
+
+def _year_exports(values, sheet_name=None, header=None):
+    # (year, path, sheet_name, header) of every --year YEAR EXPORT [SHEET HEADER]. Without
+    # SHEET and HEADER, those given for all years are used, then those the year was added
+    # with before, then the defaults of survey_options.py
+    from survey_options import SURVEY_HEADER, SURVEY_SHEET
+
+    exports = []
+    for given in values:
+        if len(given) not in (2, 4):
+            raise ValueError(
+                "--year takes YEAR EXPORT or YEAR EXPORT SHEET HEADER, not {}".format(
+                    " ".join(given)
+                )
+            )
+        year, path = given[:2]
+        if len(given) == 4:
+            exports.append((year, path, given[2], int(given[3])))
+            continue
+        stored = stored_source(year) or {}
+        exports.append(
+            (
+                year,
+                path,
+                sheet_name
+                if sheet_name is not None
+                else stored.get("sheet_name", SURVEY_SHEET),
+                header if header is not None else stored.get("header", SURVEY_HEADER),
+            )
+        )
+    return exports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the survey across years. Every export is only parsed when it is added or changed"
+    )
+    parser.add_argument(
+        "--year",
+        nargs="+",
+        action="append",
+        default=[],
+        metavar="YEAR EXPORT [SHEET HEADER]",
+        help="add (or update) the export of a year, optionally with its sheet and header row, can be given more than once",
+    )
+    parser.add_argument(
+        "--sheet",
+        help="sheet of the added exports that do not give one (default: the sheet the year was added with, or that of survey_options.py)",
+    )
+    parser.add_argument(
+        "--header",
+        type=int,
+        help="header row of the added exports that do not give one (default: as for --sheet)",
+    )
+    args = parser.parse_args()
+    try:
+        years = _year_exports(args.year, args.sheet, args.header)
+    except ValueError as error:
+        parser.error(str(error))
+    make_trends(years)